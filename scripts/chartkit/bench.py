@@ -0,0 +1,312 @@
+"""Benchmarks for chartkit internals."""
+
+import datetime
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set
+
+from ruamel.yaml import YAML
+
+from .files import read_yaml
+
+if TYPE_CHECKING:
+    from .synthetic import Monorepo
+
+
+def benchmark_yaml_loaders(
+    chart_files: List[Path], iterations: int = 20
+) -> List[Dict[str, Any]]:
+    """Time the round-trip loader against the read-only loader used by chartkit.
+
+    Every Chart.yaml is read into memory first so only parsing is measured.
+    The speedup of each loader is relative to the round-trip loader.
+    """
+    contents = [p.read_text(encoding="utf-8") for p in chart_files]
+    loaders = {"round-trip": YAML(), "safe": read_yaml()}
+
+    results: List[Dict[str, Any]] = []
+    for name, loader in loaders.items():
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for content in contents:
+                loader.load(content)
+        elapsed = time.perf_counter() - start
+        parsed = len(contents) * iterations
+        results.append(
+            {
+                "loader": name,
+                "parser": loader.Parser.__name__,
+                "files": len(contents),
+                "iterations": iterations,
+                "seconds": elapsed,
+                "per_file_us": elapsed / parsed * 1e6 if parsed else 0.0,
+            }
+        )
+
+    baseline = results[0]["seconds"]
+    for result in results:
+        result["speedup"] = baseline / result["seconds"] if result["seconds"] else 0.0
+    return results
+
+
+# Heavy modules that must stay out of CLI startup and only be imported by the
+# commands that use them.
+LAZY_MODULES = ["git", "ruamel.yaml", "semver"]
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)")
+
+
+def measure_import_time(
+    module: str = "chartkit.cli", repeat: int = 3
+) -> Dict[str, Any]:
+    """Import a module in fresh interpreters with -X importtime.
+
+    Returns the fastest run: the module's cumulative import time, the
+    per-module breakdown and which of LAZY_MODULES were pulled in.
+    """
+    env = dict(os.environ)
+    package_root = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [package_root, env.get("PYTHONPATH")] if p
+    )
+
+    best: Dict[str, Any] = {}
+    for _ in range(max(repeat, 1)):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            env=env,
+            check=True,
+        )
+        imports: List[Dict[str, Any]] = []
+        for line in result.stderr.splitlines():
+            if m := IMPORTTIME_LINE.match(line):
+                imports.append(
+                    {
+                        "module": m.group(3),
+                        "self_us": int(m.group(1)),
+                        "cumulative_us": int(m.group(2)),
+                    }
+                )
+        total = next((i["cumulative_us"] for i in imports if i["module"] == module), 0)
+        if not best or total < best["total_us"]:
+            names = {i["module"] for i in imports}
+            best = {
+                "module": module,
+                "total_us": total,
+                "imports": imports,
+                "lazy_modules_imported": [m for m in LAZY_MODULES if m in names],
+            }
+    return best
+
+
+# find_subtree builds a node per path rather than per chart, which grows
+# exponentially with shared dependencies; larger subtrees are not timed.
+SUBTREE_LIMIT = 100_000
+# Changes smaller than this are noise, whatever their ratio.
+NOISE_FLOOR_MS = 1.0
+
+
+def time_runs(
+    run: Callable[[Any], Any],
+    repeat: int,
+    setup: Optional[Callable[[], Any]] = None,
+) -> Dict[str, Any]:
+    """Time run(setup()) repeat times; setup is not timed."""
+    times: List[float] = []
+    for _ in range(max(repeat, 1)):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        run(arg)
+        times.append(time.perf_counter() - start)
+    return {
+        "min_ms": min(times) * 1000,
+        "median_ms": statistics.median(times) * 1000,
+        "runs": len(times),
+    }
+
+
+def subtree_size(index: Dict[str, Set[str]], name: str) -> int:
+    """Number of nodes find_subtree creates for a chart: one per path. Counted
+    from the leaves up, each chart once, without building the tree."""
+    sizes: Dict[str, int] = {}
+    stack = [(name, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if node in sizes:
+            continue
+        children = index.get(node, ())
+        if expanded:
+            sizes[node] = 1 + sum(sizes[child] for child in children)
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children if child not in sizes)
+    return sizes[name]
+
+
+def benchmark_graph(
+    repo: "Monorepo", repeat: int = 5, cache_path: Optional[Path] = None
+) -> Dict[str, Any]:
+    """Time discovery, graph building and queries, affected charts and suites
+    and dry-run version bumps on a generated monorepo.
+
+    Every benchmark reports the fastest and the median of repeat runs. The
+    graph cache is written to cache_path, outside of the repository.
+    """
+    from .charts import ChartGraph
+    from .files import find_chart_files
+    from .templateindex import TemplateIndex
+    from .versions import VersionManager
+
+    roots = [str(repo.root)]
+    cache_path = cache_path or repo.root.parent / "graph-cache.json"
+
+    def build(use_cache: bool = True) -> ChartGraph:
+        return ChartGraph(
+            roots=roots, internal_only=True, use_cache=use_cache, cache_path=cache_path
+        )
+
+    results: List[Dict[str, Any]] = []
+
+    def measure(
+        name: str,
+        run: Callable[[Any], Any],
+        setup: Optional[Callable[[], Any]] = None,
+    ):
+        results.append({"name": name, **time_runs(run, repeat, setup)})
+
+    def skip(name: str, reason: str):
+        results.append({"name": name, "skipped": reason})
+
+    measure("discovery", lambda _: find_chart_files([repo.root]))
+    measure("graph build (no cache)", lambda _: build(use_cache=False))
+    build()
+    measure("graph build (warm cache)", lambda _: build())
+
+    graph = build()
+    hub = repo.hubs[0]
+    leaf_app = next(name for name in reversed(repo.apps) if name not in graph.parents)
+
+    def reset_levels(_=None) -> ChartGraph:
+        graph._levels = None
+        graph._depths = None
+        return graph
+
+    measure("get_levels", lambda g: g.get_levels(), reset_levels)
+    measure(
+        "sort_by_depth (all charts)",
+        lambda g: g.sort_by_depth(list(g.charts)),
+        reset_levels,
+    )
+    measure(
+        f"find_closure (dependents of {hub})",
+        lambda _: graph.find_closure([hub], graph.dependent_selector()),
+    )
+
+    subtrees = [
+        ("dependencies", graph.children, graph.dependency_selector(), repo.chain[0])
+        if repo.chain
+        else None,
+        ("dependencies", graph.children, graph.dependency_selector(), repo.diamonds[0])
+        if repo.diamonds
+        else None,
+        ("dependencies", graph.children, graph.dependency_selector(), leaf_app),
+        ("dependents", graph.parents, graph.dependent_selector(), hub),
+    ]
+    for direction, index, selector, name in filter(None, subtrees):
+        label = f"find_subtree ({direction} of {name})"
+        size = subtree_size(index, name)
+        if size > SUBTREE_LIMIT:
+            skip(label, f"{size} tree nodes, over the limit of {SUBTREE_LIMIT}")
+            continue
+        measure(label, lambda _, n=name, s=selector: graph.find_subtree(n, s))
+
+    hub_template = str(repo.path(hub) / "templates" / "_helpers.tpl")
+    rng = random.Random(repo.spec.seed)
+    changed_files = [
+        str(repo.path(name) / "templates" / "configmap.yaml")
+        for name in rng.sample(repo.apps, min(100, len(repo.apps)))
+    ]
+    measure(
+        f"affected charts ({hub} template)",
+        lambda _: graph.get_affected_charts([hub_template]),
+    )
+    measure(
+        f"affected charts ({len(changed_files)} app templates)",
+        lambda _: graph.get_affected_charts(changed_files),
+    )
+    measure("TemplateIndex build", lambda _: TemplateIndex(graph))
+    index = TemplateIndex(graph)
+    measure(
+        f"affected suites ({hub} template)",
+        lambda _: index.affected_suites([Path(hub_template)]),
+    )
+
+    def bump(chart_name: str):
+        def run(g: ChartGraph) -> VersionManager:
+            manager = VersionManager(g)
+            manager.cascade_bump([chart_name], "patch")
+            return manager
+
+        return run
+
+    # cascade_bump edits the charts in memory, so each run gets a fresh graph
+    measure(f"dry-run bump ({hub})", bump(hub), build)
+    measure(f"dry-run bump ({leaf_app})", bump(leaf_app), build)
+
+    return {
+        "benchmark": "graph",
+        "spec": repo.spec.to_json(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(
+            timespec="seconds"
+        ),
+        "stats": {
+            "charts": len(graph.charts),
+            "chart_files": len(graph.chart_files),
+            "edges": len(graph.edges),
+            "levels": len(graph.get_levels()),
+            "suites": len(index.suites),
+            "dependents_of_hub": len(graph.get_affected_charts([hub_template])) - 1,
+            "suites_affected_by_hub": len(index.affected_suites([Path(hub_template)])),
+            "bumped_by_hub": len(bump(hub)(build()).updated_charts),
+        },
+        "results": results,
+    }
+
+
+def compare_results(
+    result: Dict[str, Any], baseline: Dict[str, Any], max_regression: float
+) -> List[Dict[str, Any]]:
+    """Compare the fastest runs of each benchmark with a baseline result.
+    A benchmark regressed if it is more than max_regression percent and
+    NOISE_FLOOR_MS slower."""
+    before = {
+        r["name"]: r["min_ms"] for r in baseline.get("results", []) if "min_ms" in r
+    }
+    rows: List[Dict[str, Any]] = []
+    for r in result["results"]:
+        if "min_ms" not in r or r["name"] not in before:
+            continue
+        previous = before[r["name"]]
+        ratio = r["min_ms"] / previous if previous else 0.0
+        rows.append(
+            {
+                "name": r["name"],
+                "baseline_ms": previous,
+                "min_ms": r["min_ms"],
+                "ratio": ratio,
+                "regressed": ratio > 1 + max_regression / 100
+                and r["min_ms"] - previous > NOISE_FLOOR_MS,
+            }
+        )
+    return rows
@@ -0,0 +1,197 @@
+"""Persistent caches kept under the git directory."""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import click
+
+from .git import git_dir
+
+GRAPH_CACHE_VERSION = 2
+
+
+def cache_dir() -> Path:
+    """Return the chartkit cache directory (.git/chartkit-cache)."""
+    return git_dir() / "chartkit-cache"
+
+
+def write_text_atomic(path: Path, text: str):
+    """Write text to a temporary file next to path and rename it into place."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_json_atomic(path: Path, data: Any):
+    """Write JSON to a temporary file next to path and rename it into place."""
+    write_text_atomic(path, json.dumps(data))
+
+
+def prune_entries(
+    paths: Iterable[Path],
+    max_bytes: Optional[int] = None,
+    max_age: Optional[float] = None,
+) -> Tuple[int, int]:
+    """Delete cache entries older than max_age seconds (by mtime, which hits
+    update), then the least recently used ones until the rest fit in
+    max_bytes. Returns the number of entries and bytes removed."""
+    entries: List[Tuple[float, int, Path]] = []
+    for entry in paths:
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+    entries.sort()
+
+    now = time.time()
+    total = sum(size for _, size, _ in entries)
+    removed = freed = 0
+    for mtime, size, entry in entries:
+        too_old = max_age is not None and now - mtime > max_age
+        too_big = max_bytes is not None and total > max_bytes
+        if not (too_old or too_big):
+            continue
+        try:
+            entry.unlink()
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+        freed += size
+    return removed, freed
+
+
+class GraphCache:
+    """On-disk cache of discovered Chart.yaml files, parsed charts and edges.
+
+    The chart file list is reused while none of the directories scanned during
+    discovery have changed. Each Chart.yaml record is reused while the file's
+    size and mtime match, or failing that, while its content hash matches, so
+    only edited charts are parsed again.
+    """
+
+    path: Path
+    roots: List[str]
+    data: Dict[str, Any]
+    records: Dict[str, Dict[str, Any]]
+    changed: bool
+
+    def __init__(self, roots: List[Path], path: Optional[Path] = None):
+        self.roots = [str(r) for r in roots]
+        key = hashlib.sha256("\0".join(self.roots).encode()).hexdigest()[:16]
+        self.path = path or cache_dir() / f"graph-{key}.json"
+        self.data = self.read()
+        self.records = {}
+        self.changed = False
+
+    def read(self) -> Dict[str, Any]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != GRAPH_CACHE_VERSION or data.get("roots") != (
+            self.roots
+        ):
+            return {}
+        return data
+
+    def get_chart_files(self) -> Optional[List[Path]]:
+        """Return the cached chart files, or None if discovery must run again."""
+        dirs: Dict[str, int] = self.data.get("dirs") or {}
+        if not dirs:
+            return None
+        for directory, mtime in dirs.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    return None
+            except OSError:
+                return None
+        return [Path(p) for p in self.data.get("chart_files", [])]
+
+    def get_dir_mtimes(self) -> Dict[str, int]:
+        """The directories scanned by the cached discovery, with their mtimes."""
+        return dict(self.data.get("dirs") or {})
+
+    def set_chart_files(self, chart_files: List[Path], dir_mtimes: Dict[str, int]):
+        """Record a fresh discovery result."""
+        files = [str(p) for p in chart_files]
+        if files != self.data.get("chart_files"):
+            self.changed = True
+        self.data["chart_files"] = files
+        self.data["dirs"] = dir_mtimes
+
+    def get_chart(self, chart_file: Path) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Look up the cached record for a Chart.yaml.
+
+        Returns (hit, chart) where chart is the cached chart JSON, or None for a
+        file that previously failed to parse. On a miss the caller is expected
+        to parse the file and store the result with put_chart.
+        """
+        key = str(chart_file)
+        record = (self.data.get("charts") or {}).get(key)
+        try:
+            stat = chart_file.stat()
+        except OSError:
+            return False, None
+        fresh = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        if record and all(record.get(k) == v for k, v in fresh.items()):
+            self.records[key] = record
+            return True, record.get("chart")
+
+        try:
+            digest = hashlib.sha256(chart_file.read_bytes()).hexdigest()
+        except OSError:
+            return False, None
+        fresh["sha256"] = digest
+        if record and record.get("sha256") == digest:
+            self.records[key] = record | fresh
+            return True, record.get("chart")
+
+        self.records[key] = fresh
+        return False, None
+
+    def put_chart(self, chart_file: Path, chart: Optional[Dict[str, Any]]):
+        """Store the parse result for a Chart.yaml previously missed by get_chart."""
+        key = str(chart_file)
+        record = self.records.setdefault(key, {})
+        record["chart"] = chart
+        self.changed = True
+
+    def get_edges(self, internal_only: bool) -> Optional[List[Tuple[str, str]]]:
+        """Return cached edges if no chart changed since they were computed."""
+        if self.changed or self.data.get("internal_only") != internal_only:
+            return None
+        edges = self.data.get("edges")
+        if edges is None:
+            return None
+        return [(parent, child) for parent, child in edges]
+
+    def save(self, edges: List[Tuple[str, str]], internal_only: bool):
+        """Persist the cache, dropping records for charts no longer present."""
+        data = {
+            "version": GRAPH_CACHE_VERSION,
+            "roots": self.roots,
+            "dirs": self.data.get("dirs", {}),
+            "chart_files": self.data.get("chart_files", []),
+            "charts": self.records,
+            "internal_only": internal_only,
+            "edges": [list(edge) for edge in sorted(edges)],
+        }
+        if data == self.data:
+            return
+        try:
+            write_json_atomic(self.path, data)
+        except OSError as e:
+            click.echo(f"WARN: Failed to write chart cache {self.path}: {e}", err=True)
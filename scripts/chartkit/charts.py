@@ -1,49 +1,46 @@
 import json
 import os
-import re
 import subprocess
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
 
 
 import click
-import ruamel.yaml
-from git import Blob
-
-from .files import files_to_chart_files, find_chart_files, load_chart
-from .git import get_commit_blob
-
-# YAML setup for round-trip and comment preservation
-yaml = ruamel.yaml.YAML()
-yaml.indent(mapping=2, sequence=4, offset=2)
-
-
-def _print_suite_summary(passed: bool, output: str) -> None:
-    """Print a compact one-line summary of a suite result.
-
-    Parses the suite name, test counts, and elapsed time from helm unittest
-    output. Full failure output is deferred and printed by the caller after
-    all suites complete, so failures don't interleave with other results.
-    """
-    ansi_escape = re.compile(r"\x1b\[[0-9;]*m")
-    suite_name = tests = time = ""
-    for line in output.splitlines():
-        line = ansi_escape.sub("", line)
-        if m := re.match(r"^\s+(?:PASS|FAIL)\s+(.+?)\t", line):
-            suite_name = m.group(1).strip()
-        elif m := re.match(r"^Tests:\s+(.+)$", line):
-            tests = m.group(1).strip()
-        elif m := re.match(r"^Time:\s+(.+)$", line):
-            time = m.group(1).strip()
-
-    status = (
-        click.style(" PASS ", fg="white", bg="green", bold=True)
-        if passed
-        else click.style(" FAIL ", fg="white", bg="red", bold=True)
-    )
-    click.echo(f"{status}  {suite_name}  ({tests}, {time})")
+
+from .cache import GraphCache
+from .chartyaml import ChartYamlBatch, WriteSummary
+from .dependencies import DependencyState
+from .packages import PackageCache
+from .files import (
+    find_chart_files,
+    is_chart_file,
+    load_chart,
+    make_path_root_relative,
+    parse_chart,
+    PathTrie,
+)
+from .git import changed_files, git_root, read_blobs
+from .profiling import phase, profiled, subprocess_phase
+from .reports import write_json_report, write_junit_xml
+from .resultcache import ResultCache
+from .testrunner import NDJSONReporter, TestSuite, UnitTestRunner
+from .timings import TimingDB
+
+if TYPE_CHECKING:
+    from git import Blob
 
 
 class ChartEdge(NamedTuple):
@@ -107,16 +104,27 @@ class ChartInfo:
         }
 
     @staticmethod
-    def from_yaml(chart: Path | Blob) -> Optional["ChartInfo"]:
+    def from_json(data: Dict[str, Any]) -> "ChartInfo":
+        return ChartInfo(
+            name=data["name"],
+            type=data["type"],
+            version=data["version"],
+            path=Path(data["path"]),
+            dependencies=data.get("dependencies", []),
+            deprecated=data.get("deprecated", False),
+        )
+
+    @staticmethod
+    def from_yaml(chart: "Path | Blob") -> Optional["ChartInfo"]:
         data: Optional[Dict[str, Any]] = None
         chart_path: Path
         try:
             if isinstance(chart, Path):
                 chart_path = chart.resolve()
                 data = load_chart(chart_path)
-            elif isinstance(chart, Blob):
+            else:
                 chart_path = Path(chart.path)
-                data = yaml.load(chart.data_stream.read().decode("utf-8"))
+                data = parse_chart(chart.data_stream.read().decode("utf-8"))
             if not data:
                 return None
         except Exception as e:
@@ -133,45 +141,39 @@ class ChartInfo:
             deprecated=bool(data.get("deprecated", False)),
         )
 
-    def save_chart_yaml(self):
-        chart_yaml_path = self.path / "Chart.yaml"
-        try:
-            with chart_yaml_path.open("r", encoding="utf-8") as f:
-                data = yaml.load(f) or {}
-        except Exception as e:
-            click.echo(f"WARN: Failed to parse {chart_yaml_path}: {e}", err=True)
-            return
-
-        data["version"] = self.version
-        data["type"] = self.type
-        data["name"] = self.name
-        data["dependencies"] = self.dependencies
-
-        try:
-            with chart_yaml_path.open("w", encoding="utf-8") as f:
-                yaml.dump(data, f)
-        except Exception as e:
-            click.echo(f"WARN: Failed to write {chart_yaml_path}: {e}", err=True)
-
-    def update_dependencies(self, dry_run: bool = False):
+    def save_chart_yaml(self) -> WriteSummary:
+        """Write the chart's metadata back to its Chart.yaml, atomically and
+        only if it changed. Use a ChartYamlBatch to save several charts."""
+        batch = ChartYamlBatch()
+        batch.update(self)
+        return batch.commit()
+
+    def update_dependencies(self, dry_run: bool = False) -> bool:
+        """Run helm dependency update for the chart. Returns False if it
+        failed; helm's output is only shown then, so that charts updated in
+        parallel don't interleave."""
         if len(self.dependencies) > 0:
             if dry_run:
                 click.echo(
                     f"DRY-RUN: Would update dependencies for chart {self.name}..."
                 )
-                return
+                return True
             click.echo(f"Updating dependencies for chart {self.name}...")
-            try:
-                subprocess.run(
-                    ["helm", "dependency", "update"], cwd=self.path, check=True
+            command = ["helm", "dependency", "update"]
+            with subprocess_phase(command):
+                result = subprocess.run(
+                    command, cwd=self.path, capture_output=True, text=True
                 )
-            except subprocess.CalledProcessError as e:
+            if result.returncode != 0:
                 click.echo(
-                    f"WARN: Failed to update dependencies for {self.name}: {e}",
+                    f"WARN: Failed to update dependencies for {self.name}:\n"
+                    f"{result.stdout}{result.stderr}",
                     err=True,
                 )
+                return False
         else:
             click.echo(f"No dependencies to update for chart {self.name}.")
+        return True
 
     def find_test_suites(self) -> List[Path]:
         """Return all helm-unittest suite files for this chart."""
@@ -182,28 +184,73 @@ class ChartInfo:
 
     def get_previous_version(self, commit: str = "HEAD") -> Optional[str]:
         """Check the version of the chart in a specific commit."""
-        chart_yaml_path = self.path / "Chart.yaml"
-        blob = get_commit_blob(commit, str(chart_yaml_path))
-        if blob is None:
-            return None
-        chart_info = ChartInfo.from_yaml(blob)
-        return chart_info.version if chart_info else None
+        return previous_versions([self], commit)[self.name]
 
 
 class ChartGraph:
     chart_files: List[Path]
     charts: Dict[str, ChartInfo]
     edges: Set[ChartEdge]
+    children: Dict[str, Set[str]]  # parent -> charts it depends on
+    parents: Dict[str, Set[str]]  # child -> charts that depend on it
+    _levels: Optional[List[List[str]]] = None
+    _depths: Optional[Dict[str, int]] = None
+    _path_index: Optional[PathTrie[ChartInfo]] = None
 
     def __init__(
         self,
         roots: List[str] = ["."],
         internal_only: bool = True,
+        use_cache: bool = True,
+        cache_path: Optional[Path] = None,
     ):
+        """cache_path overrides the graph cache file in .git/chartkit-cache,
+        e.g. for charts outside of the repository."""
         root_paths = [Path(p).resolve() for p in roots]
-        self.chart_files = find_chart_files(root_paths)
-        self.charts = self.collect_charts()
-        self.edges = self.build_graph(self.charts, internal_only)
+        self.roots = [str(p) for p in root_paths]
+        self.internal_only = internal_only
+        self.use_cache = use_cache
+        with phase("discovery"):
+            cache = GraphCache(root_paths, cache_path) if use_cache else None
+            chart_files = cache.get_chart_files() if cache else None
+            if chart_files is None:
+                dir_mtimes: Dict[str, int] = {}
+                chart_files = find_chart_files(root_paths, dir_mtimes)
+                if cache:
+                    cache.set_chart_files(chart_files, dir_mtimes)
+            else:
+                dir_mtimes = cache.get_dir_mtimes() if cache else {}
+            self.chart_files = chart_files
+            # taken before parsing, so that edits made meanwhile make it stale
+            self.dir_mtimes = dir_mtimes
+            self.chart_stats = {str(p): file_stamp(p) for p in chart_files}
+        with phase("parse", charts=len(chart_files)):
+            self.charts = self.collect_charts(cache)
+
+        with phase("build_graph"):
+            cached_edges = cache.get_edges(internal_only) if cache else None
+            if cached_edges is not None:
+                self.edges = {
+                    ChartEdge(parent, child) for parent, child in cached_edges
+                }
+                self.index_edges(self.edges)
+            else:
+                self.edges = self.build_graph(self.charts, internal_only)
+            if cache:
+                cache.save(list(self.edges), internal_only)
+
+    def is_stale(self) -> bool:
+        """Whether charts were added, moved or edited since the graph was
+        built: a directory scanned by discovery or a Chart.yaml changed."""
+        for directory, mtime in self.dir_mtimes.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return any(
+            file_stamp(Path(path)) != stamp for path, stamp in self.chart_stats.items()
+        )
 
     def ensure_charts_or_files(self, charts: List[str]) -> List[str]:
         """Ensure that the provided list contains valid chart names or file paths.
@@ -215,15 +262,45 @@ class ChartGraph:
 
         valid_charts = [c for c in charts if is_chart(c)]
         valid_charts.extend(
-            files_to_chart_files([c for c in charts if not is_chart(c)])
+            self.files_to_charts([c for c in charts if not is_chart(c)], True)
         )
         return valid_charts
 
-    def collect_charts(self) -> Dict[str, ChartInfo]:
+    def chart_of(self, path: "str | Path") -> Optional[ChartInfo]:
+        """The chart whose directory contains the path (the innermost one,
+        for charts nested in other charts), without touching the disk."""
+        if self._path_index is None:
+            self._path_index = PathTrie()
+            for chart in self.charts.values():
+                self._path_index.insert(chart.path, chart)
+        return self._path_index.longest_prefix(path)
+
+    def files_to_charts(self, file_paths: List[str], warn: bool = False) -> List[str]:
+        """Names of the charts changed by the files. Paths are absolute or
+        relative to the git root and may name deleted files or directories;
+        only the chart's content counts (see files.is_chart_file), not e.g.
+        its README or Chart.lock. With warn, paths outside of every chart
+        that do not exist either (e.g. misspelled chart names) are reported."""
+        root = str(git_root())
+        names: Set[str] = set()
+        for file_path in file_paths:
+            path = os.path.join(root, file_path)
+            chart = self.chart_of(path)
+            if chart is not None:
+                rel_path = os.path.relpath(os.path.normpath(path), chart.path)
+                if is_chart_file(rel_path):
+                    names.add(chart.name)
+            elif warn and not os.path.exists(path):
+                click.echo(f"WARN: Path does not exist: {path}", err=True)
+        return sorted(names)
+
+    def collect_charts(
+        self, cache: Optional[GraphCache] = None
+    ) -> Dict[str, ChartInfo]:
         charts: Dict[str, ChartInfo] = {}
 
         for chart_path in self.chart_files:
-            chart_info = ChartInfo.from_yaml(chart_path)
+            chart_info = self.load_chart_info(chart_path, cache)
             if not chart_info:
                 continue
             if chart_info.deprecated:
@@ -231,6 +308,24 @@ class ChartGraph:
             charts[chart_info.name] = chart_info
         return charts
 
+    def load_chart_info(
+        self, chart_path: Path, cache: Optional[GraphCache]
+    ) -> Optional[ChartInfo]:
+        """Parse a Chart.yaml, reusing the cached record if the file is unchanged."""
+        if cache is None:
+            return ChartInfo.from_yaml(chart_path)
+        hit, cached = cache.get_chart(chart_path)
+        if hit:
+            return ChartInfo.from_json(cached) if cached else None
+        chart_info = ChartInfo.from_yaml(chart_path)
+        record = (
+            chart_info.to_json() | {"deprecated": chart_info.deprecated}
+            if chart_info
+            else None
+        )
+        cache.put_chart(chart_path, record)
+        return chart_info
+
     def build_graph(
         self,
         charts: Dict[str, ChartInfo],
@@ -250,16 +345,27 @@ class ChartGraph:
                     # If alias not found, skip
                     continue
                 edges.add(ChartEdge(parent, child))
+        self.index_edges(edges)
         return edges
 
+    def index_edges(self, edges: Set[ChartEdge]):
+        """Build the parent->children and child->parents adjacency maps."""
+        self.children = {}
+        self.parents = {}
+        self._levels = None
+        self._depths = None
+        for parent, child in edges:
+            self.children.setdefault(parent, set()).add(child)
+            self.parents.setdefault(child, set()).add(parent)
+
     def get_roots(self) -> List[str]:
-        # get roots from edges
-        all_children = {child for _, child in self.edges}
-        roots = [name for name in self.charts.keys() if name not in all_children]
+        # roots are charts that no other chart depends on
+        roots = [name for name in self.charts.keys() if name not in self.parents]
         if not roots:
             roots = list(self.charts.keys())  # fallback to all charts
         return roots
 
+    @profiled("output")
     def print_dependency_graph(
         self,
         chart_name: Optional[str] = None,
@@ -283,6 +389,7 @@ class ChartGraph:
                     json_output=json_output,
                 )
 
+    @profiled("output")
     def print_dependent_graph(
         self, chart_name: str, json_output: bool = False, show_versions: bool = False
     ):
@@ -323,31 +430,20 @@ class ChartGraph:
                 )
 
     def make_edge_selector(
-        self,
-        edges: Set[ChartEdge],
-        comparator: Callable[[ChartEdge, str], bool],
-        selector: Callable[[ChartEdge], str],
+        self, index: Dict[str, Set[str]]
     ) -> Callable[[str], Set[str]]:
         def wrapper(root: str) -> Set[str]:
-            return {selector(edge) for edge in edges if comparator(edge, root)}
+            return set(index.get(root, ()))
 
         return wrapper
 
     def dependent_selector(self) -> Callable[[str], Set[str]]:
         """Return a function that finds all parents of a given chart."""
-        return self.make_edge_selector(
-            self.edges,
-            lambda edge, child: edge.child == child,
-            lambda edge: edge.parent,
-        )
+        return self.make_edge_selector(self.parents)
 
     def dependency_selector(self) -> Callable[[str], Set[str]]:
         """Return a function that finds all children of a given chart."""
-        return self.make_edge_selector(
-            self.edges,
-            lambda edge, parent: edge.parent == parent,
-            lambda edge: edge.child,
-        )
+        return self.make_edge_selector(self.children)
 
     def find_subtree(
         self, chart_name: str, selector: Callable[[str], Set[str]]
@@ -358,6 +454,22 @@ class ChartGraph:
             root.add_next(self.find_subtree(node, selector))
         return root
 
+    def find_closure(
+        self, chart_names: List[str], selector: Callable[[str], Set[str]]
+    ) -> Set[str]:
+        """Find every chart reachable from the given charts, including themselves.
+        Unlike find_subtree, shared descendants are only visited once.
+        """
+        seen: Set[str] = set()
+        stack = list(chart_names)
+        while stack:
+            name = stack.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            stack.extend(selector(name) - seen)
+        return seen
+
     def get_chart(self, chart_name: str) -> ChartInfo:
         """Get chart info by name."""
         try:
@@ -365,18 +477,77 @@ class ChartGraph:
         except KeyError:
             raise KeyError(f"Chart '{chart_name}' not found")
 
-    def get_chart_depth(self, chart_name: str) -> int:
-        """Get the depth of a chart in the dependency graph."""
+    def get_previous_versions(
+        self, chart_names: List[str], commit: str = "HEAD"
+    ) -> Dict[str, Optional[str]]:
+        """Versions of the charts at a commit, read in one pass."""
+        return previous_versions([self.get_chart(n) for n in chart_names], commit)
+
+    def get_changed_charts(self, chart_names: List[str], commit: str) -> Set[str]:
+        """The charts whose content differs from the commit (see
+        files_to_charts), including uncommitted and untracked files."""
+        root = git_root()
+        paths = [
+            os.path.relpath(self.get_chart(name).path, root) for name in chart_names
+        ]
+        if not paths:
+            return set()
+        return set(self.files_to_charts(changed_files(commit, paths))) & set(
+            chart_names
+        )
+
+    def get_levels(self) -> List[List[str]]:
+        """Group charts into dependency levels, shallowest first.
+
+        Level 1 holds charts without dependencies; every other chart sits one
+        level above its deepest dependency, so charts within a level never
+        depend on each other. Computed once per graph with Kahn's algorithm,
+        starting from the leaves.
+        """
+        if self._levels is not None:
+            return self._levels
+
+        nodes = set(self.charts) | set(self.children) | set(self.parents)
+        remaining = {name: len(self.children.get(name, ())) for name in nodes}
+        frontier = sorted(name for name, count in remaining.items() if count == 0)
+        levels: List[List[str]] = []
+        while frontier:
+            levels.append(frontier)
+            released: List[str] = []
+            for name in frontier:
+                for parent in self.parents.get(name, ()):
+                    remaining[parent] -= 1
+                    if remaining[parent] == 0:
+                        released.append(parent)
+            frontier = sorted(released)
+
+        placed = sum(len(level) for level in levels)
+        if placed != len(nodes):
+            cyclic = sorted(name for name, count in remaining.items() if count > 0)
+            raise click.ClickException(
+                f"Dependency cycle detected between charts: {', '.join(cyclic)}"
+            )
+
+        self._levels = levels
+        return levels
 
-        def _depth(name: str, visited: Set[str]) -> int:
-            visited.add(name)
-            children = self.dependency_selector()(name)
-            if not children:
-                return 1
-            return 1 + max(_depth(child, visited) for child in children)
+    def topological_order(self) -> List[str]:
+        """Return all charts ordered so dependencies come before dependents.
+        Charts on the same level are ordered by name, so the result is stable.
+        """
+        return [name for level in self.get_levels() for name in level]
 
+    def get_chart_depth(self, chart_name: str) -> int:
+        """Get the depth of a chart in the dependency graph. Raises KeyError
+        for names that are not in the graph."""
+        if self._depths is None:
+            self._depths = {
+                name: depth
+                for depth, level in enumerate(self.get_levels(), 1)
+                for name in level
+            }
         try:
-            return _depth(chart_name, set())
+            return self._depths[chart_name]
         except KeyError:
             raise KeyError(f"Chart '{chart_name}' not found")
 
@@ -384,10 +555,11 @@ class ChartGraph:
         """Sort chart names by their depth in the dependency graph (deepest first)."""
         return sorted(
             list(filter(lambda name: name in self.charts, chart_names)),
-            key=lambda name: self.get_chart_depth(name) if name in self.charts else 0,
+            key=self.get_chart_depth,
             reverse=reverse,
         )
 
+    @profiled("output")
     def print_charts(self, chart_names: List[str], json_output: bool = False):
         """Print chart information for the given chart names."""
         if json_output:
@@ -401,6 +573,7 @@ class ChartGraph:
             for name in chart_names:
                 self.print_chart_info(name)
 
+    @profiled("output")
     def print_chart_info(self, chart_name: str, json_output: bool = False):
         chart = self.get_chart(chart_name)
         if chart:
@@ -413,16 +586,37 @@ class ChartGraph:
 
     def get_affected_charts(self, files: List[str]) -> List[str]:
         """Return charts affected by the given files, including their dependents."""
-        changed_names = files_to_chart_files(files)
-        affected: Set[str] = set()
-        for name in changed_names:
-            if name not in self.charts:
+        affected = self.find_closure(
+            self.files_to_charts(files), self.dependent_selector()
+        )
+        return sorted(name for name in affected if name in self.charts)
+
+    def get_affected_suites(self, files: List[str]) -> List[Path]:
+        """Return the test suites affected by the given files, following
+        template includes instead of whole charts (see TemplateIndex)."""
+        from .templateindex import TemplateIndex
+
+        root = git_root()
+        return TemplateIndex(self).affected_suites(
+            (root / path).resolve() for path in files
+        )
+
+    def find_suite_charts(self, suite_paths: List[str]) -> List[TestSuite]:
+        """Resolve test suite files (relative to the git root or absolute) to
+        TestSuites of the charts containing them."""
+        suites: List[TestSuite] = []
+        for suite_path in suite_paths:
+            path = (git_root() / suite_path).resolve()
+            chart = self.chart_of(path)
+            if (
+                chart is None
+                or path.parent != chart.path / "tests"
+                or not path.is_file()
+            ):
+                click.echo(f"WARN: Not a test suite of a chart: {suite_path}", err=True)
                 continue
-            subtree = self.find_subtree(name, self.dependent_selector())
-            for chart_info in subtree.flatten():
-                if chart_info.name in self.charts:
-                    affected.add(chart_info.name)
-        return sorted(affected)
+            suites.append(TestSuite(chart, path))
+        return suites
 
     def run_unit_tests(
         self,
@@ -430,69 +624,167 @@ class ChartGraph:
         update_snapshot: bool = False,
         parallel: Optional[int] = None,
         verbose: bool = False,
+        timings_file: Optional[Path] = None,
+        batch_size: Optional[int] = 1,
+        use_cache: bool = True,
+        shard_index: int = 0,
+        shard_count: int = 1,
+        results_file: Optional[Path] = None,
+        suite_paths: Optional[List[str]] = None,
+        fail_fast: bool = False,
+        ndjson: bool = False,
+        junit_xml: Optional[Path] = None,
+        json_report: Optional[Path] = None,
+        cancel: Optional[threading.Event] = None,
     ) -> bool:
-        """Run helm unit tests in parallel for all non-deprecated charts."""
-        workers = parallel or os.cpu_count() or 4
-
+        """Run helm unit tests in parallel for all non-deprecated charts, or
+        for the given charts and test suite files.
+        With shard_count > 1 only the suites of shard shard_index are run.
+        With ndjson, results are written to stdout as JSON events instead of text.
+        junit_xml and json_report name files to write per-test reports to.
+        Setting cancel stops the run, terminating the running helm processes."""
         charts_to_test = (
             [self.charts[n] for n in chart_names if n in self.charts]
             if chart_names is not None
             else list(self.charts.values())
+            if not suite_paths
+            else []
         )
 
         suites = [
-            (chart, testfile)
+            TestSuite(chart, testfile)
             for chart in charts_to_test
             for testfile in chart.find_test_suites()
         ]
+        if suite_paths:
+            seen = {suite.path for suite in suites}
+            suites.extend(
+                suite
+                for suite in self.find_suite_charts(suite_paths)
+                if suite.path not in seen
+            )
 
-        if not suites:
-            click.echo("No test suites found.")
-            return True
-
-        click.echo(f"Running {len(suites)} test suites with PARALLEL={workers}...")
-
-        def run_suite(chart: ChartInfo, testfile: Path) -> tuple[bool, str]:
-            cmd = [
-                "helm",
-                "unittest",
-                str(chart.path),
-                "-f",
-                str(testfile),
-                "--with-subchart=false",
-            ]
-            if update_snapshot:
-                cmd.append("-u")
-            cmd.append("--color")
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            return result.returncode == 0, result.stdout + result.stderr
-
-        failures: List[str] = []
-        with ThreadPoolExecutor(max_workers=workers) as executor:
-            futures = [executor.submit(run_suite, chart, tf) for chart, tf in suites]
-            for future in as_completed(futures):
-                passed, output = future.result()
-                if verbose:
-                    click.echo(output, nl=False)
-                else:
-                    _print_suite_summary(passed, output)
-                if not passed:
-                    failures.append(output)
-
-        if not verbose and failures:
-            click.echo("\n--- Failures ---\n")
-            for output in failures:
-                click.echo(output, nl=False)
-
-        return not failures
+        sharded = shard_count > 1
+        runner = UnitTestRunner(
+            workers=parallel,
+            update_snapshot=update_snapshot,
+            verbose=verbose,
+            # every shard must split on the same weights: only an explicit
+            # timing file, which only unittest-merge updates, else suite sizes
+            timings=TimingDB(timings_file) if timings_file or not sharded else None,
+            record_timings=not sharded,
+            batch_size=batch_size,
+            result_cache=ResultCache() if use_cache else None,
+            fail_fast=fail_fast,
+            reporter=NDJSONReporter() if ndjson else None,
+            cancel=cancel,
+            test_cases=bool(junit_xml or json_report),
+        )
+        if sharded:
+            total = len(suites)
+            suites = runner.select_shard(suites, shard_index, shard_count)
+            runner.reporter.message(
+                f"Shard {shard_index + 1}/{shard_count}: "
+                f"{len(suites)} of {total} test suites."
+            )
+        passed = runner.run(suites)
+        if results_file:
+            runner.write_results(results_file, shard_index, shard_count)
+        if junit_xml:
+            write_junit_xml(
+                junit_xml, runner.results, runner.cancelled, runner.duration
+            )
+        if json_report:
+            write_json_report(
+                json_report, runner.results, runner.cancelled, runner.duration
+            )
+        return passed
 
     def update_dependencies(
-        self, chart_names: List[str], all: bool = False, dry_run: bool = False
-    ):
-        charts = self.charts.keys() if all else chart_names
-        for name in self.sort_by_depth(list(charts)):
-            chart = self.get_chart(name)
-            if chart:
-                chart.update_dependencies(dry_run=dry_run)
-            else:
-                click.echo(f"Chart '{name}' not found.", err=True)
+        self,
+        chart_names: List[str],
+        all: bool = False,
+        dry_run: bool = False,
+        parallel: Optional[int] = None,
+        force: bool = False,
+        use_package_cache: bool = True,
+    ) -> bool:
+        """Update the vendored dependencies of the given charts.
+
+        Charts are updated level by level, dependencies first, since helm
+        packages file:// subcharts together with their own vendored
+        dependencies. Charts on the same level don't depend on each other and
+        are updated in parallel. Charts whose Chart.lock and charts/ still
+        match their declared dependencies and local subcharts are skipped,
+        unless force is set. Charts depending only on file:// charts already
+        pinned by their Chart.lock get the archives from the package cache
+        instead of running helm. Returns False if any update failed.
+        """
+        names = set(self.charts) if all else set(chart_names)
+        for name in sorted(names - set(self.charts)):
+            click.echo(f"Chart '{name}' not found.", err=True)
+        state = DependencyState()
+        packages = PackageCache(state.tree_hash) if use_package_cache else None
+
+        def update(chart: ChartInfo) -> bool:
+            if packages is not None and packages.can_vendor(chart):
+                return packages.vendor(chart)
+            return chart.update_dependencies()
+
+        ok = True
+        with ThreadPoolExecutor(max_workers=parallel or os.cpu_count() or 4) as pool:
+            for level in self.get_levels():
+                stale: List[ChartInfo] = []
+                for name in level:
+                    if name not in names or name not in self.charts:
+                        continue
+                    chart = self.charts[name]
+                    if chart.dependencies and not force and state.is_fresh(chart):
+                        click.echo(f"Dependencies of chart {name} are up to date.")
+                    elif dry_run or not chart.dependencies:
+                        chart.update_dependencies(dry_run=dry_run)
+                    else:
+                        stale.append(chart)
+                updated = pool.map(update, stale)
+                for chart, success in zip(stale, updated):
+                    if success:
+                        state.record(chart)
+                    else:
+                        ok = False
+        if not dry_run:
+            state.save()
+        return ok
+
+
+def previous_versions(
+    charts: List[ChartInfo], commit: str = "HEAD"
+) -> Dict[str, Optional[str]]:
+    """Versions of the charts' Chart.yaml at a commit, or None where it did
+    not exist yet. The commit is resolved once and all blobs are read by a
+    single git process."""
+    paths = {
+        chart.name: make_path_root_relative(chart.path / "Chart.yaml").as_posix()
+        for chart in charts
+    }
+    blobs = read_blobs(commit, sorted(set(paths.values())))
+    versions: Dict[str, Optional[str]] = {}
+    for name, path in paths.items():
+        blob = blobs.get(path)
+        data: Optional[Dict[str, Any]] = None
+        if blob is not None:
+            try:
+                data = parse_chart(blob.decode("utf-8"))
+            except Exception as e:
+                click.echo(f"WARN: Failed to parse {path} at {commit}: {e}", err=True)
+        version = data.get("version") if data else None
+        versions[name] = str(version) if version else None
+    return versions
+
+
+def file_stamp(path: Path) -> Optional[Tuple[int, int]]:
+    """mtime and size of a file, or None if it is gone."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
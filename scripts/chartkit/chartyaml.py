@@ -0,0 +1,144 @@
+"""Batched, atomic Chart.yaml writes with comment preservation."""
+
+import functools
+import io
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import click
+
+from .profiling import profiled
+
+if TYPE_CHECKING:
+    from ruamel.yaml import YAML
+
+    from .charts import ChartInfo
+
+
+@functools.cache
+def round_trip_yaml() -> "YAML":
+    """YAML setup for round-trip and comment preservation, used when writing."""
+    from ruamel.yaml import YAML
+
+    yaml = YAML()
+    yaml.indent(mapping=2, sequence=4, offset=2)
+    return yaml
+
+
+@dataclass
+class LoadedChartYaml:
+    path: Path
+    text: str
+    data: Any
+
+
+@dataclass
+class WriteSummary:
+    written: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    bytes_written: int = 0
+
+
+def write_text_atomic(path: Path, content: str):
+    """Write to a temporary file next to path, flush it to disk and rename it
+    into place, so that a crash leaves either the old or the new file."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if path.exists():
+            shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class ChartYamlBatch:
+    """Chart.yaml changes collected and written together.
+
+    Each file is loaded once with the round-trip loader, keeping comments and
+    formatting. Charts are applied to the loaded document in place, down to
+    single dependency fields, so comments inside the dependencies survive.
+    commit() serializes every document, skips those whose content did not
+    change, and replaces the others atomically.
+    """
+
+    documents: Dict[Path, LoadedChartYaml]
+
+    def __init__(self):
+        self.documents = {}
+
+    @profiled("parse")
+    def load(self, chart_yaml_path: Path) -> Optional[LoadedChartYaml]:
+        if chart_yaml_path not in self.documents:
+            try:
+                text = chart_yaml_path.read_text(encoding="utf-8")
+                data = round_trip_yaml().load(text) or {}
+            except Exception as e:
+                click.echo(f"WARN: Failed to parse {chart_yaml_path}: {e}", err=True)
+                return None
+            self.documents[chart_yaml_path] = LoadedChartYaml(
+                chart_yaml_path, text, data
+            )
+        return self.documents[chart_yaml_path]
+
+    def update(self, chart: "ChartInfo"):
+        """Apply the chart's name, type, version and dependencies."""
+        loaded = self.load(chart.path / "Chart.yaml")
+        if loaded is None:
+            return
+        data = loaded.data
+        for key, value in [
+            ("version", chart.version),
+            ("type", chart.type),
+            ("name", chart.name),
+        ]:
+            if data.get(key) != value:
+                data[key] = value
+        update_dependencies(data, chart.dependencies)
+
+    @profiled("output")
+    def commit(self) -> WriteSummary:
+        """Write the changed documents and return what was written."""
+        summary = WriteSummary()
+        yaml = round_trip_yaml()
+        for loaded in self.documents.values():
+            stream = io.StringIO()
+            yaml.dump(loaded.data, stream)
+            content = stream.getvalue()
+            if content == loaded.text:
+                summary.unchanged += 1
+                continue
+            try:
+                write_text_atomic(loaded.path, content)
+            except OSError as e:
+                click.echo(f"WARN: Failed to write {loaded.path}: {e}", err=True)
+                summary.failed += 1
+                continue
+            loaded.text = content
+            summary.written += 1
+            summary.bytes_written += len(content.encode("utf-8"))
+        return summary
+
+
+def update_dependencies(data: Any, dependencies: List[Dict[str, Any]]):
+    """Update the dependencies of a round-trip document in place, field by
+    field, or replace the list if the dependencies were added or removed."""
+    current = data.get("dependencies") or []
+    names = [dep.get("name") for dep in current if hasattr(dep, "get")]
+    if names != [dep.get("name") for dep in dependencies]:
+        if current or dependencies:
+            data["dependencies"] = dependencies
+        return
+    for loaded, dep in zip(current, dependencies):
+        for key, value in dep.items():
+            if loaded.get(key) != value:
+                loaded[key] = value
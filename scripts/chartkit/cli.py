@@ -1,11 +1,67 @@
-from typing import List, Optional
+import functools
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, List, Optional
+import json as json_lib
 import click
-from semver import Version
 
+from .files import make_path_root_relative
 from .git import diff_files, git_root, staged_files
 from .charts import ChartGraph
-from .mermaid import MermaidDiagram
-from .versions import VersionManager
+
+if TYPE_CHECKING:
+    from .server import GraphServer
+
+# Startup latency matters because pre-commit runs chartkit repeatedly: heavy
+# dependencies (gitpython, ruamel.yaml, semver) are imported by the commands
+# that need them, and the chart graph is only built once a command asks for it.
+
+
+class LazyGraph:
+    """Builds the ChartGraph on first access, or takes the warm one from
+    chartkit serve when the command runs in the daemon."""
+
+    graph: Optional[ChartGraph]
+
+    def __init__(
+        self,
+        roots: List[str],
+        internal_only: bool,
+        use_cache: bool,
+        server: Optional["GraphServer"] = None,
+    ):
+        self.roots = roots
+        self.internal_only = internal_only
+        self.use_cache = use_cache
+        self.server = server
+        self.graph = None
+
+    def get(self) -> ChartGraph:
+        if self.graph is None:
+            # find the git root
+            roots = self.roots or [git_root().as_posix()]
+            if self.server is not None:
+                self.graph = self.server.graph(roots, self.internal_only)
+            else:
+                self.graph = ChartGraph(
+                    roots=roots,
+                    internal_only=self.internal_only,
+                    use_cache=self.use_cache,
+                )
+        return self.graph
+
+
+def pass_graph(f: Callable[..., Any]) -> Callable[..., Any]:
+    """Like click.pass_obj, but passes the (lazily built) ChartGraph."""
+
+    @click.pass_context
+    def wrapper(ctx: click.Context, *args, **kwargs):
+        lazy_graph = ctx.find_object(LazyGraph)
+        if lazy_graph is None:
+            raise click.ClickException("Chart graph is not configured.")
+        return ctx.invoke(f, lazy_graph.get(), *args, **kwargs)
+
+    return functools.update_wrapper(wrapper, f)
 
 
 @click.group()
@@ -22,23 +78,95 @@ from .versions import VersionManager
     default=False,
     help="Only include dependencies that are also found in the scanned charts.",
 )
+@click.option(
+    "--no-graph-cache",
+    is_flag=True,
+    default=False,
+    help="Rescan and reparse all charts instead of using the cache in .git.",
+)
+@click.option(
+    "--no-daemon",
+    is_flag=True,
+    default=False,
+    help="Run the command in this process even if chartkit serve is running.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Print wall and CPU time per phase and the slowest subprocesses to stderr.",
+)
+@click.option(
+    "--profile-trace",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Write the phases as Chrome trace events (JSON) to this file.",
+)
+@click.option(
+    "--profile-stats",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Write cProfile statistics of the main thread to this file.",
+)
 @click.version_option(message="ChartKit %(version)s")
 @click.pass_context
-def cli(ctx: click.Context, roots: list[str], internal_only: bool):
+def cli(
+    ctx: click.Context,
+    roots: list[str],
+    internal_only: bool,
+    no_graph_cache: bool,
+    no_daemon: bool,
+    profile: bool,
+    profile_trace: Optional[Path],
+    profile_stats: Optional[Path],
+):
     """ChartKit: CLI tooling for Helm chart dependencies and utilities."""
+    if profile or profile_trace or profile_stats:
+        start_profile(ctx, profile, profile_trace, profile_stats)
+    # no_daemon is handled by the entry point (chartkit.client); ctx.obj is
+    # the GraphServer for commands run by chartkit serve
+    ctx.obj = LazyGraph(
+        roots=list(roots),
+        internal_only=internal_only,
+        use_cache=not no_graph_cache,
+        server=ctx.obj,
+    )
 
-    # find the git root
-    if not roots or len(roots) == 0:
-        roots = [git_root().as_posix()]
 
-    ctx.obj = ChartGraph(roots=roots, internal_only=internal_only)
+def start_profile(
+    ctx: click.Context,
+    table: bool,
+    trace: Optional[Path],
+    stats: Optional[Path],
+):
+    """Profile the command, and report once its context closes (also when it
+    fails)."""
+    from . import profiling
+
+    command = " ".join(["chartkit", *sys.argv[1:]])
+    profiling.start(command, cprofile=stats is not None)
+
+    def report():
+        profile = profiling.stop()
+        if profile is None:
+            return
+        if table:
+            click.echo(profile.format_table(), err=True, nl=False)
+        if trace:
+            profile.write_trace(trace)
+            click.echo(f"Profile trace written to {trace}", err=True)
+        if stats:
+            profile.write_stats(stats)
+            click.echo(f"cProfile statistics written to {stats}", err=True)
+
+    ctx.call_on_close(report)
 
 
 @cli.command()
 @click.option("--json", is_flag=True, default=False, help="Output as JSON.")
 @click.option("--sort", is_flag=True, default=False, help="Sort charts by depth.")
 @click.option("--reverse", is_flag=True, default=False, help="Reverse the sort order.")
-@click.pass_obj
+@pass_graph
 def charts(
     graph: ChartGraph,
     json: bool = False,
@@ -62,7 +190,7 @@ def charts(
     help="Type of tree to display.",
 )
 @click.argument("chart", type=str)
-@click.pass_obj
+@pass_graph
 def chart(graph: ChartGraph, chart: str, json: bool, mode: str):
     """Prints Helm either a single chart details or the a tree of dependents or dependencies."""
     if mode == "dependency":
@@ -83,13 +211,57 @@ def chart(graph: ChartGraph, chart: str, json: bool, mode: str):
     default=False,
     help="Show what would be changed, but do not write changes.",
 )
+@click.option(
+    "--parallel",
+    "-p",
+    default=None,
+    type=int,
+    help="Number of charts to update at once (default: CPU count).",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Update charts even if their dependencies are up to date.",
+)
+@click.option(
+    "--no-package-cache",
+    is_flag=True,
+    default=False,
+    help="Always run helm dependency update instead of vendoring local "
+    "subcharts from the package cache.",
+)
 @click.argument("charts", nargs=-1, type=str)
-@click.pass_obj
+@pass_graph
 def update_dependencies(
-    graph: ChartGraph, all: bool, charts: list[str], dry_run: bool = False
+    graph: ChartGraph,
+    all: bool,
+    charts: list[str],
+    dry_run: bool = False,
+    parallel: Optional[int] = None,
+    force: bool = False,
+    no_package_cache: bool = False,
 ):
-    """Updates the dependencies for all charts."""
-    graph.update_dependencies(charts, all=all, dry_run=dry_run)
+    """Updates the dependencies for all charts.
+
+    Charts are updated dependencies first, and charts that don't depend on
+    each other in parallel. A chart is skipped while its Chart.lock and
+    charts/ are unchanged since its last update and its declared
+    dependencies and file:// subcharts are too.
+
+    file:// subcharts are packaged once per content hash and linked into
+    their dependents' charts/ directories, as long as Chart.lock already
+    pins their current versions. Otherwise helm updates the chart.
+    """
+    if not graph.update_dependencies(
+        list(charts),
+        all=all,
+        dry_run=dry_run,
+        parallel=parallel,
+        force=force,
+        use_package_cache=not no_package_cache,
+    ):
+        raise SystemExit(1)
 
 
 @cli.command()
@@ -102,31 +274,119 @@ def update_dependencies(
 @click.option(
     "--output",
     default=None,
-    help="Output file for the diagram.",
+    help="Text output file for the diagram.",
 )
 @click.option(
     "--svg-output",
     default=None,
-    help="Output file for the diagram.",
+    help="SVG output file for the diagram.",
+)
+@click.option(
+    "--dot-output",
+    default=None,
+    help="Graphviz DOT output file for the diagram.",
+)
+@click.option(
+    "--renderer",
+    default="native",
+    type=click.Choice(["native", "mermaid-cli"]),
+    help="How --svg-output is drawn: in-process, or with mermaid-cli through "
+    "npx (needs network access and a headless browser).",
+)
+@click.option(
+    "--check",
+    is_flag=True,
+    default=False,
+    help="Check that the output files are up to date instead of writing them; "
+    "exits 1 if any is not.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    help="Generate the diagram even if an identical one is cached.",
 )
 @click.argument("chart", required=False, type=str)
-@click.pass_obj
+@pass_graph
 def mermaid(
     graph: ChartGraph,
     chart: Optional[str] = None,
     include_attrs: bool = False,
     output: Optional[str] = None,
     svg_output: Optional[str] = None,
+    dot_output: Optional[str] = None,
+    renderer: str = "native",
+    check: bool = False,
+    no_cache: bool = False,
 ):
-    """Generates a diagram of Helm chart dependencies."""
-    diagram = MermaidDiagram(graph, include_attrs, root_chart=chart)
+    """Generates a diagram of Helm chart dependencies.
+
+    Prints a Mermaid ER diagram, or writes it to --output. --svg-output draws
+    the graph as SVG in-process, with dependents above their dependencies,
+    and --dot-output exports it for Graphviz.
+
+    Diagram files embed a fingerprint of the charts, edges and options they
+    were drawn from, and diagrams are cached by it in
+    .git/chartkit-cache/diagrams.
+    --check compares the fingerprints of the output files with the current
+    graph without generating anything, e.g. to verify committed diagrams in
+    CI.
+
+    \b
+    Examples:
+      # Fail if docs/charts.svg no longer matches the charts
+      chartkit mermaid --include-attrs --svg-output docs/charts.svg --check
+    """
+    from .mermaid import DiagramCache, MermaidDiagram
+
+    diagram = MermaidDiagram(
+        graph,
+        include_attrs,
+        root_chart=chart,
+        cache=None if no_cache else DiagramCache(),
+    )
+    if check:
+        files = [
+            (fmt, path)
+            for fmt, path in [
+                ("mermaid", output),
+                ("svg", svg_output),
+                ("dot", dot_output),
+            ]
+            if path
+        ]
+        if not files:
+            raise click.UsageError(
+                "--check needs --output, --svg-output and/or --dot-output."
+            )
+        stale = [
+            path for fmt, path in files if not diagram.is_current(fmt, path, renderer)
+        ]
+        for _, path in files:
+            if path in stale:
+                click.echo(f"ERROR: {path} is out of date.", err=True)
+            else:
+                click.echo(f"{path} is up to date.")
+        if stale:
+            click.echo(
+                "Run the same command without --check to regenerate it.", err=True
+            )
+            raise SystemExit(1)
+        return
+
     if output:
         diagram.write_mermaid_to_file(output)
 
     if svg_output:
-        diagram.write_mermaid_to_svg(svg_output)
+        if renderer == "mermaid-cli":
+            diagram.write_mermaid_to_svg(svg_output)
+        else:
+            diagram.write_svg(svg_output)
+
+    if dot_output:
+        diagram.write_dot(dot_output)
 
-    if not output and not svg_output:
+    if not output and not svg_output and not dot_output:
         click.echo(diagram.mermaid_str)
 
 
@@ -136,25 +396,46 @@ def mermaid(
     default=None,
     help="Git ref to diff against (e.g. origin/main). Defaults to staged files.",
 )
-@click.pass_obj
-def affected(graph: ChartGraph, base: Optional[str]):
+@click.option(
+    "--suites",
+    is_flag=True,
+    default=False,
+    help="List affected test suite files instead of charts.",
+)
+@pass_graph
+def affected(graph: ChartGraph, base: Optional[str], suites: bool):
     """List charts affected by file changes (one per line).
 
     Includes changed charts and all their dependents.
     With no --base, uses staged git files.
 
+    With --suites, lists the test suites (relative to the git root) whose
+    output may change instead: a template change only selects the suites
+    rendering that template or, through include/template, a named template
+    it defines, also in charts depending on a changed library chart.
+
     \b
     Examples:
       # Show charts affected by staged changes
       chartkit affected
 
+    \b
       # Show charts affected by a PR branch
       chartkit affected --base origin/main
 
+    \b
       # Run tests for affected charts
       chartkit affected --base origin/main | chartkit unittest
+
+    \b
+      # Run only the affected test suites
+      chartkit affected --suites | xargs chartkit unittest
     """
     files = diff_files(base) if base else staged_files()
+    if suites:
+        for suite in graph.get_affected_suites(files):
+            click.echo(make_path_root_relative(suite).as_posix())
+        return
     for chart in graph.get_affected_charts(files):
         click.echo(chart)
 
@@ -182,37 +463,664 @@ def affected(graph: ChartGraph, base: Optional[str]):
     envvar="CI",
     help="Verbose output. Enabled automatically when the CI environment variable is set.",
 )
-@click.pass_obj
+@click.option(
+    "--timings-file",
+    default=None,
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Suite duration history used for scheduling "
+    "(default: .git/chartkit-cache/timings.json). Sharded runs only read it, "
+    "and only when given.",
+)
+@click.option(
+    "--batch-size",
+    default="1",
+    callback=lambda ctx, param, value: parse_batch_size(value),
+    help="Maximum suites per helm process, or 'auto' to size batches from the "
+    "CPU count and suite timing history (default: 1).",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    help="Run every suite, even if its inputs are unchanged since it last passed.",
+)
+@click.option(
+    "--shard-index",
+    default=0,
+    type=click.IntRange(min=0),
+    help="0-based index of the shard to run (with --shard-count).",
+)
+@click.option(
+    "--shard-count",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Split the suites into this many shards, e.g. one per CI node.",
+)
+@click.option(
+    "--results-file",
+    default=None,
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write per-suite results as JSON, for unittest-merge.",
+)
+@click.option(
+    "--fail-fast",
+    is_flag=True,
+    default=False,
+    help="Stop at the first failing suite, cancelling the suites still running "
+    "or waiting.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "ndjson"]),
+    default="text",
+    help="Output format. ndjson writes one JSON event per line as results "
+    "arrive (start, suite, output, cancelled, message, end).",
+)
+@click.option(
+    "--junit-xml",
+    default=None,
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write a JUnit XML report with per-test results and durations.",
+)
+@click.option(
+    "--json-report",
+    default=None,
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write a JSON report with per-suite and per-test results, durations, "
+    "templates and helm commands.",
+)
+@pass_graph
 def run_unittest(
     graph: ChartGraph,
     charts: tuple,
     update_snapshot: bool,
     parallel: int,
     verbose: bool,
+    timings_file: Optional[Path],
+    batch_size: Optional[int],
+    no_cache: bool,
+    shard_index: int,
+    shard_count: int,
+    results_file: Optional[Path],
+    fail_fast: bool,
+    output_format: str,
+    junit_xml: Optional[Path],
+    json_report: Optional[Path],
 ):
     """Run helm unit tests in parallel for all non-deprecated charts.
 
-    If CHART arguments are given, only those charts are tested.
+    If CHART arguments are given, only those charts are tested. Arguments
+    ending in _test.yaml are test suite files (relative to the git root, as
+    listed by "chartkit affected --suites") and run just that suite.
     If no arguments are given, all non-deprecated charts are tested.
 
+    Suite durations are recorded after each run and used to start the
+    longest-expected suites first on the next one. With --batch-size, suites
+    of the same chart share a helm process, saving helm startup and chart
+    loading for each suite.
+
+    Suites that passed before are not run again while the suite, its
+    snapshot, the chart's files and its vendored subcharts are unchanged.
+
+    --shard-index/--shard-count split the suites across CI nodes, balanced by
+    the --timings-file given (or suite size), and --results-file records each
+    shard's results for unittest-merge. Shards never write timings, so all
+    of them compute the same split; unittest-merge records the durations.
+
+    Results are reported as soon as helm prints them. --fail-fast stops the
+    run at the first failure, and --format ndjson streams JSON events for
+    other tools to consume.
+
+    --junit-xml and --json-report write per-suite and per-test results and
+    durations, read from the JUnit output of helm unittest, for CI dashboards.
+
     \b
     Examples:
       # Run all tests
       chartkit unittest
 
+    \b
       # Run tests for specific charts
       chartkit unittest mozcloud mozcloud-gateway
+
+    \b
+      # Run the suites affected by staged changes
+      chartkit unittest $(chartkit affected --suites)
     """
+    if shard_index >= shard_count:
+        raise click.BadParameter(
+            f"must be less than --shard-count ({shard_count})",
+            param_hint="--shard-index",
+        )
+    suite_paths = [c for c in charts if c.endswith("_test.yaml")]
+    chart_names = [c for c in charts if not c.endswith("_test.yaml")]
     passed = graph.run_unit_tests(
-        chart_names=list(charts) or None,
+        chart_names=chart_names or None,
+        suite_paths=suite_paths,
         update_snapshot=update_snapshot,
         parallel=parallel,
         verbose=verbose,
+        timings_file=timings_file,
+        batch_size=batch_size,
+        use_cache=not no_cache,
+        shard_index=shard_index,
+        shard_count=shard_count,
+        results_file=results_file,
+        fail_fast=fail_fast,
+        ndjson=output_format == "ndjson",
+        junit_xml=junit_xml,
+        json_report=json_report,
     )
     if not passed:
         raise SystemExit(1)
 
 
+@cli.command("watch")
+@click.option(
+    "--parallel",
+    "-p",
+    default=None,
+    type=int,
+    help="Number of parallel workers (default: CPU count).",
+)
+@click.option(
+    "--verbose",
+    is_flag=True,
+    default=False,
+    help="Verbose output.",
+)
+@click.option(
+    "--batch-size",
+    default="1",
+    callback=lambda ctx, param, value: parse_batch_size(value),
+    help="Maximum suites per helm process, or 'auto' (default: 1).",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    help="Run every affected suite, even if its inputs are unchanged since it "
+    "last passed.",
+)
+@click.option(
+    "--debounce",
+    default=0.3,
+    type=click.FloatRange(min=0),
+    show_default=True,
+    help="Seconds without further changes before suites are run.",
+)
+@click.option(
+    "--poll",
+    is_flag=True,
+    default=False,
+    help="Poll file modification times instead of using inotify.",
+)
+@click.option(
+    "--interval",
+    default=1.0,
+    type=click.FloatRange(min=0.05),
+    show_default=True,
+    help="Seconds between scans with --poll.",
+)
+@pass_graph
+def watch(
+    graph: ChartGraph,
+    parallel: Optional[int],
+    verbose: bool,
+    batch_size: Optional[int],
+    no_cache: bool,
+    debounce: float,
+    poll: bool,
+    interval: float,
+):
+    """Re-runs the unit test suites affected by file changes until interrupted.
+
+    Watches the chart directories (with inotify on Linux, by polling
+    elsewhere), waits for a burst of edits to settle, and runs the suites the
+    changed files affect, as "chartkit affected --suites" selects them. The
+    chart graph and template index stay in memory between runs. Changes
+    arriving while suites run cancel the run and start a new one with both
+    sets of suites. Snapshot files (__snapshot__) are not watched, since helm
+    writes them itself.
+
+    \b
+    Examples:
+      # Re-run affected suites on every save
+      chartkit watch
+
+    \b
+      # On file systems without inotify (e.g. some network mounts)
+      chartkit watch --poll --interval 2
+    """
+    from .watch import watch as watch_charts
+
+    watch_charts(
+        graph,
+        debounce=debounce,
+        poll=poll,
+        interval=interval,
+        parallel=parallel,
+        verbose=verbose,
+        batch_size=batch_size,
+        use_cache=not no_cache,
+    )
+
+
+@cli.command("unittest-merge")
+@click.argument(
+    "results_files",
+    nargs=-1,
+    required=True,
+    type=click.Path(dir_okay=False, path_type=Path),
+)
+@click.option(
+    "--timings-file",
+    default=None,
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Record the merged suite durations in this timing file.",
+)
+def unittest_merge(results_files: tuple, timings_file: Optional[Path]):
+    """Combines sharded unittest results into one summary and exit code.
+
+    Fails if any suite failed, if any shard's results are missing, or if
+    the shards did not split the same suites: a suite run twice or not at
+    all, or shards that used different timing files.
+
+    \b
+    Examples:
+      # On each of three CI nodes, with the timings.json of the last merge
+      chartkit unittest --shard-index 0 --shard-count 3 \\
+        --timings-file timings.json --results-file shard-0.json
+
+    \b
+      # Afterwards, on one node
+      chartkit unittest-merge shard-*.json --timings-file timings.json
+    """
+    from .testrunner import merge_results
+    from .timings import TimingDB
+
+    timings = TimingDB(timings_file) if timings_file else None
+    if not merge_results(list(results_files), timings):
+        raise SystemExit(1)
+
+
+@cli.group()
+def cache():
+    """Manage chartkit caches in .git/chartkit-cache."""
+    pass
+
+
+@cache.command("prune")
+@click.option(
+    "--max-size",
+    default=None,
+    callback=lambda ctx, param, value: parse_size(value),
+    help="Evict least recently used entries until the cache fits, e.g. 500M.",
+)
+@click.option(
+    "--max-age",
+    default=None,
+    callback=lambda ctx, param, value: parse_age(value),
+    help="Evict entries not used for this long, e.g. 30d or 12h.",
+)
+@click.option(
+    "--packages",
+    is_flag=True,
+    default=False,
+    help="Prune the chart package cache used by update-dependencies instead.",
+)
+@click.option(
+    "--diagrams",
+    is_flag=True,
+    default=False,
+    help="Prune the diagram cache used by mermaid instead.",
+)
+def cache_prune(
+    max_size: Optional[int], max_age: Optional[float], packages: bool, diagrams: bool
+):
+    """Evicts unit test results from the result cache, chart archives from
+    the package cache with --packages, or diagrams with --diagrams.
+
+    \b
+    Examples:
+      # Drop results unused for two weeks, then keep at most 200 MB
+      chartkit cache prune --max-age 14d --max-size 200M
+
+    \b
+      # Empty the result cache
+      chartkit cache prune --max-size 0
+
+    \b
+      # Drop chart archives unused for a month
+      chartkit cache prune --packages --max-age 30d
+
+    \b
+      # Keep at most 50 MB of generated diagrams
+      chartkit cache prune --diagrams --max-size 50M
+    """
+    from .resultcache import ResultCache
+
+    if max_size is None and max_age is None:
+        raise click.UsageError("Specify --max-size and/or --max-age.")
+    if packages and diagrams:
+        raise click.UsageError("--packages and --diagrams are mutually exclusive.")
+    if diagrams:
+        from .mermaid import DiagramCache
+
+        removed, freed = DiagramCache().prune(max_bytes=max_size, max_age=max_age)
+        click.echo(f"Removed {removed} diagrams ({freed / 1024:.1f} KiB).")
+        return
+    if packages:
+        from .packages import PackageCache
+
+        removed, freed = PackageCache().prune(max_bytes=max_size, max_age=max_age)
+        click.echo(f"Removed {removed} chart archives ({freed / 1024:.1f} KiB).")
+        return
+    removed, freed = ResultCache().prune(max_bytes=max_size, max_age=max_age)
+    click.echo(f"Removed {removed} cached results ({freed / 1024:.1f} KiB).")
+
+
+@cli.group()
+def bench():
+    """Benchmark chartkit internals."""
+    pass
+
+
+@bench.command("yaml")
+@click.option(
+    "--iterations",
+    "-n",
+    default=20,
+    type=int,
+    help="Number of times each Chart.yaml is parsed per loader.",
+)
+@click.option("--json", is_flag=True, default=False, help="Output as JSON.")
+@pass_graph
+def bench_yaml(graph: ChartGraph, iterations: int, json: bool):
+    """Compares YAML loader speed on the scanned Chart.yaml files."""
+    from .bench import benchmark_yaml_loaders
+
+    results = benchmark_yaml_loaders(graph.chart_files, iterations)
+    if json:
+        click.echo(json_lib.dumps(results, indent=2))
+        return
+    click.echo(
+        f"{'Loader':<12} {'Parser':<16} {'Files':>6} {'us/file':>10} {'Speedup':>8}"
+    )
+    for r in results:
+        click.echo(
+            f"{r['loader']:<12} {r['parser']:<16} {r['files']:>6} "
+            f"{r['per_file_us']:>10.1f} {r['speedup']:>7.2f}x"
+        )
+
+
+@bench.command("import")
+@click.option(
+    "--budget-ms",
+    default=150.0,
+    type=float,
+    help="Fail if importing the CLI takes longer than this many milliseconds.",
+)
+@click.option(
+    "--repeat", default=3, type=int, help="Number of runs; the fastest is used."
+)
+@click.option("--top", default=10, type=int, help="Number of slowest imports shown.")
+def bench_import(budget_ms: float, repeat: int, top: int):
+    """Measures CLI startup import time and fails if it exceeds the budget.
+
+    Also fails if gitpython, ruamel.yaml or semver are imported at startup;
+    those must only be imported by the commands that use them.
+    """
+    from .bench import measure_import_time
+
+    result = measure_import_time(repeat=repeat)
+    slowest = sorted(result["imports"], key=lambda i: i["self_us"], reverse=True)
+    for i in slowest[:top]:
+        click.echo(f"{i['self_us'] / 1000:>8.1f} ms  {i['module']}")
+
+    total_ms = result["total_us"] / 1000
+    click.echo(f"Import time for {result['module']}: {total_ms:.1f} ms")
+    failed = False
+    if result["lazy_modules_imported"]:
+        click.echo(
+            f"ERROR: Imported at startup: {', '.join(result['lazy_modules_imported'])}",
+            err=True,
+        )
+        failed = True
+    if total_ms > budget_ms:
+        click.echo(f"ERROR: Exceeds the budget of {budget_ms:.0f} ms.", err=True)
+        failed = True
+    if failed:
+        raise SystemExit(1)
+
+
+@bench.command("graph")
+@click.option(
+    "--charts", default=2000, type=click.IntRange(min=1), help="Number of charts."
+)
+@click.option(
+    "--fan-out",
+    default=4,
+    type=click.IntRange(min=0),
+    help="Maximum number of other apps each app depends on.",
+)
+@click.option(
+    "--hubs",
+    default=5,
+    type=click.IntRange(min=1),
+    help="Number of library charts most charts depend on (fan-in).",
+)
+@click.option(
+    "--chain-depth",
+    default=50,
+    type=click.IntRange(min=0),
+    help="Length of a chain of charts each depending on the next.",
+)
+@click.option(
+    "--diamonds",
+    default=50,
+    type=click.IntRange(min=0),
+    help="Number of diamond-shaped dependency groups (four charts each).",
+)
+@click.option(
+    "--deprecated",
+    default=5.0,
+    type=click.FloatRange(0, 100),
+    help="Percentage of deprecated charts.",
+)
+@click.option("--seed", default=0, type=int, help="Seed of the generated layout.")
+@click.option(
+    "--repeat", default=3, type=int, help="Runs per benchmark; fastest and median."
+)
+@click.option(
+    "--keep",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Generate the charts in this directory and keep them.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Write the results as JSON to this file.",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Compare with results written by --output earlier.",
+)
+@click.option(
+    "--max-regression",
+    default=25.0,
+    type=float,
+    help="Fail if a benchmark is this many percent slower than the baseline.",
+)
+@click.option("--json", is_flag=True, default=False, help="Output as JSON.")
+def bench_graph(
+    charts: int,
+    fan_out: int,
+    hubs: int,
+    chain_depth: int,
+    diamonds: int,
+    deprecated: float,
+    seed: int,
+    repeat: int,
+    keep: Optional[Path],
+    output: Optional[Path],
+    baseline: Optional[Path],
+    max_regression: float,
+    json: bool,
+):
+    """Benchmarks chart graph operations on a generated monorepo.
+
+    Generates thousands of synthetic charts (hub libraries with a large
+    fan-in, apps with a configurable fan-out, diamonds, a deep chain and
+    deprecated charts) in a temporary directory, and times discovery, graph
+    building, graph queries, affected charts and suites and dry-run version
+    bumps. Runs offline and without helm.
+
+    \b
+    Examples:
+      # Record a baseline, then compare a change against it
+      chartkit bench graph --output baseline.json
+      chartkit bench graph --baseline baseline.json
+
+    \b
+      # Keep the charts, e.g. to profile a command on them
+      chartkit bench graph --charts 5000 --keep /tmp/monorepo
+      chartkit -r /tmp/monorepo --profile version bump --dry-run lib-000
+    """
+    import tempfile
+
+    from .bench import benchmark_graph, compare_results
+    from .synthetic import MonorepoSpec, generate_monorepo
+
+    spec = MonorepoSpec(
+        charts=charts,
+        fan_out=fan_out,
+        hubs=hubs,
+        chain_depth=chain_depth,
+        diamonds=diamonds,
+        deprecated=deprecated / 100,
+        seed=seed,
+    )
+    previous = None
+    if baseline:
+        previous = json_lib.loads(baseline.read_text(encoding="utf-8"))
+        if previous.get("spec") != spec.to_json():
+            click.echo(
+                f"WARN: {baseline} was measured on a different monorepo: "
+                f"{previous.get('spec')}",
+                err=True,
+            )
+
+    with tempfile.TemporaryDirectory(prefix="chartkit-bench-") as tmp:
+        if keep and keep.exists() and any(keep.iterdir()):
+            raise click.ClickException(f"{keep} is not empty.")
+        root = keep.resolve() if keep else Path(tmp) / "monorepo"
+        try:
+            repo = generate_monorepo(root, spec)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        result = benchmark_graph(
+            repo, repeat, cache_path=Path(tmp) / "graph-cache.json"
+        )
+
+    comparison = compare_results(result, previous, max_regression) if previous else []
+    if output:
+        output.write_text(json_lib.dumps(result, indent=2) + "\n", encoding="utf-8")
+    if json:
+        click.echo(json_lib.dumps(result | {"comparison": comparison}, indent=2))
+    else:
+        stats = result["stats"]
+        click.echo(
+            f"{stats['charts']} charts ({stats['chart_files']} Chart.yaml files), "
+            f"{stats['edges']} dependencies, {stats['levels']} levels, "
+            f"{stats['suites']} test suites"
+        )
+        changes = {row["name"]: row for row in comparison}
+        header = f"{'Benchmark':<48} {'Min ms':>9} {'Median ms':>10}"
+        if previous:
+            header += f" {'Baseline':>9} {'Change':>8}"
+        click.echo(header)
+        for r in result["results"]:
+            if "skipped" in r:
+                click.echo(f"{r['name']:<48} skipped: {r['skipped']}")
+                continue
+            line = f"{r['name']:<48} {r['min_ms']:>9.2f} {r['median_ms']:>10.2f}"
+            row = changes.get(r["name"])
+            if row:
+                line += f" {row['baseline_ms']:>9.2f} {row['ratio'] - 1:>+8.0%}"
+                if row["regressed"]:
+                    line += "  REGRESSED"
+            click.echo(line)
+    if output:
+        click.echo(f"Results written to {output}", err=True)
+    if keep:
+        click.echo(f"Charts kept in {keep}", err=True)
+
+    regressed = [row["name"] for row in comparison if row["regressed"]]
+    if regressed:
+        click.echo(
+            f"ERROR: {len(regressed)} benchmarks are over {max_regression:.0f}% "
+            "slower than the baseline.",
+            err=True,
+        )
+        raise SystemExit(1)
+
+
+@cli.command()
+@click.option(
+    "--idle-timeout",
+    default=None,
+    callback=lambda ctx, param, value: parse_age(value),
+    help="Stop after no request for this long, e.g. 30m or 8h.",
+)
+@click.option(
+    "--status", is_flag=True, default=False, help="Show the running daemon's state."
+)
+@click.option("--stop", is_flag=True, default=False, help="Stop the running daemon.")
+def serve(idle_timeout: Optional[float], status: bool, stop: bool):
+    """Runs a daemon answering affected, chart, charts and version check from
+    a warm chart graph.
+
+    The daemon listens on a Unix socket in .git/chartkit-cache and rebuilds
+    only charts that changed between queries. While it runs, chartkit sends
+    these commands to it instead of building the graph itself; --no-daemon or
+    CHARTKIT_NO_DAEMON=1 turns that off.
+
+    \b
+    Examples:
+      # Serve in the background for the working day
+      chartkit serve --idle-timeout 8h &
+
+    \b
+      # Check on it, and stop it
+      chartkit serve --status
+      chartkit serve --stop
+    """
+    from .client import DaemonError, call, socket_path
+    from .git import git_dir
+
+    path = socket_path(git_dir())
+    if status or stop:
+        try:
+            result = call(path, "shutdown" if stop else "status")
+        except (OSError, DaemonError) as e:
+            raise click.ClickException(f"chartkit serve is not running ({e}).")
+        if stop:
+            click.echo("Stopped chartkit serve.")
+        else:
+            click.echo(json_lib.dumps(result, indent=2))
+        return
+
+    from .server import serve as run_server
+
+    run_server(path, git_root(), idle_timeout)
+
+
 @cli.group()
 def version():
     """Manage chart versions."""
@@ -221,7 +1129,7 @@ def version():
 
 @version.command("list")
 @click.argument("charts", nargs=-1, type=str)
-@click.pass_obj
+@pass_graph
 def list_versions(graph: ChartGraph, charts: list[str]):
     """Lists the versions of all charts."""
     charts = graph.ensure_charts_or_files(charts)
@@ -258,7 +1166,7 @@ def list_versions(graph: ChartGraph, charts: list[str]):
     help="Bump versions for charts with staged changes (in git).",
 )
 @click.argument("charts", nargs=-1, type=str)
-@click.pass_obj
+@pass_graph
 def bump(
     graph: ChartGraph,
     charts: List[str],
@@ -268,6 +1176,7 @@ def bump(
     staged: bool = False,
 ):
     """Bumps the version of a chart and cascades to dependents. Deprecated charts are ignored."""
+    from .versions import VersionManager
 
     charts = get_chart_arguments(graph, charts, staged)
     if not charts:
@@ -278,20 +1187,22 @@ def bump(
         raise SystemExit(1)
 
     vm = VersionManager(graph)
-    # Sort by depth (shallowest first) to ensure dependencies are processed before dependents
-    sorted_charts = graph.sort_by_depth(charts)
-    for chart_name in sorted_charts:
-        target_chart = graph.get_chart(chart_name)
-        if not target_chart:
+    for chart_name in charts:
+        if chart_name not in graph.charts:
             click.echo(f"Chart '{chart_name}' not found.", err=True)
-            continue
-        vm.cascade_bump(target_chart, release_type)
+    vm.cascade_bump(list(charts), release_type)
 
     vm.print_updates(output_format=output_format, release_type=release_type)
 
     if not dry_run:
-        vm.save_versions()
-        click.echo("Chart versions updated.", err=True)
+        summary = vm.save_versions()
+        click.echo(
+            f"Chart versions updated: wrote {summary.written} Chart.yaml files "
+            f"({summary.bytes_written} bytes), {summary.unchanged} unchanged.",
+            err=True,
+        )
+        if summary.failed:
+            raise SystemExit(1)
     else:
         click.echo("Dry run; no changes made.", err=True)
 
@@ -302,24 +1213,43 @@ def bump(
     default="HEAD",
     help="Git commit to check against (default: HEAD).",
 )
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    help="Output format for check results (text or json).",
+)
 @click.argument("charts", nargs=-1, type=str)
-@click.pass_obj
-def check(graph: ChartGraph, charts: List[str], commit: str):
+@pass_graph
+def check(graph: ChartGraph, charts: List[str], commit: str, output_format: str):
     """Checks the previous version of a chart against a specific commit.
-    If the file has changed but not the version, it indicates that a version bump is needed."""
-    # resolve charts from staged files if needed
-    charts = get_chart_arguments(graph, charts, staged=True)
-    charts_to_bump = []
-    for chart in charts:
-        current_version = Version.parse(graph.get_chart(chart).version)
-        previous_version = Version.parse(
-            graph.get_chart(chart).get_previous_version(commit) or "0.0.0"
-        )
-        needs_bump = (
-            current_version == previous_version or current_version < previous_version
+    If the file has changed but not the version, it indicates that a version bump is needed.
+    Without arguments, the charts with staged changes are checked. Named
+    charts whose files are the same as at the commit are up to date."""
+    from .versions import VersionManager
+
+    # resolve charts from staged files if none are given
+    staged = not charts
+    charts = get_chart_arguments(graph, charts, staged=staged)
+    # staged charts have changed; named ones only if they differ from the commit
+    changed = None if staged else graph.get_changed_charts(charts, commit)
+    checks = VersionManager(graph).check_versions(charts, commit, changed)
+    charts_to_bump = [c.name for c in checks if c.needs_bump]
+    if output_format == "json":
+        click.echo(
+            json_lib.dumps(
+                {
+                    "commit": commit,
+                    "charts": [c.to_json() for c in checks],
+                    "needs_bump": charts_to_bump,
+                },
+                indent=2,
+            )
         )
-        if needs_bump:
-            charts_to_bump.append(chart)
+        if charts_to_bump:
+            raise SystemExit(1)
+        return
     if len(charts_to_bump) == 0:
         click.echo("All specified charts are up to date.")
     else:
@@ -330,7 +1260,48 @@ Please bump their versions using the 'bump' command. eg:
 """,
             err=True,
         )
-        exit(1)
+        raise SystemExit(1)
+
+
+def parse_batch_size(value: str) -> Optional[int]:
+    """Parse --batch-size: a positive number of suites, or 'auto' (None)."""
+    if value == "auto":
+        return None
+    try:
+        size = int(value)
+    except ValueError:
+        size = 0
+    if size < 1:
+        raise click.BadParameter("must be a positive integer or 'auto'")
+    return size
+
+
+def parse_size(value: Optional[str]) -> Optional[int]:
+    """Parse a size in bytes with an optional K, M or G suffix."""
+    if value is None:
+        return None
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    number, unit = value.upper().rstrip("IB"), 1
+    if number and number[-1] in units:
+        number, unit = number[:-1], units[number[-1]]
+    try:
+        return int(float(number) * unit)
+    except ValueError:
+        raise click.BadParameter(f"invalid size '{value}'")
+
+
+def parse_age(value: Optional[str]) -> Optional[float]:
+    """Parse a duration in seconds with an optional s, m, h or d suffix."""
+    if value is None:
+        return None
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    number, unit = value.lower(), 1
+    if number and number[-1] in units:
+        number, unit = number[:-1], units[number[-1]]
+    try:
+        return float(number) * unit
+    except ValueError:
+        raise click.BadParameter(f"invalid age '{value}'")
 
 
 def get_chart_arguments(
@@ -0,0 +1,144 @@
+"""Entry point of the chartkit command, with the client of chartkit serve.
+
+Read-only queries (see SERVED_COMMANDS) are sent to a running daemon, which
+answers them from a warm chart graph. Anything else, or any failure to reach
+the daemon, runs the regular CLI in this process. Until then only the
+standard library is imported, so a served query costs little more than
+starting Python.
+"""
+
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .git import find_git_dirs
+
+# Commands the daemon answers, as their words on the command line.
+SERVED_COMMANDS = ["affected", "chart", "charts", "version check"]
+# Global options taking a value, and those the daemon must not handle.
+VALUE_OPTIONS = ["-r", "--roots"]
+LOCAL_OPTIONS = [
+    "--no-daemon",
+    "--no-graph-cache",
+    "--profile",
+    "--profile-trace",
+    "--profile-stats",
+    "--help",
+    "--version",
+]
+# Set to run every command in-process.
+NO_DAEMON_ENV = "CHARTKIT_NO_DAEMON"
+
+CONNECT_TIMEOUT = 0.5  # seconds
+# Generous, since the daemon may have to rebuild a large graph first.
+RESPONSE_TIMEOUT = 120.0
+
+
+class DaemonError(Exception):
+    """The daemon could not answer a request."""
+
+
+def socket_path(git_dir: Path) -> Path:
+    """Address of the daemon: .git/chartkit-cache/serve.sock, or a path in the
+    temporary directory if that is too long for a Unix socket."""
+    path = git_dir / "chartkit-cache" / "serve.sock"
+    if len(os.fsencode(path)) < 100:
+        return path
+    import hashlib
+    import tempfile
+
+    digest = hashlib.sha256(os.fsencode(git_dir)).hexdigest()[:16]
+    return Path(tempfile.gettempdir()) / f"chartkit-{digest}.sock"
+
+
+def split_command(argv: List[str]) -> Optional[Tuple[List[str], str, List[str]]]:
+    """Split a command line into global options, a served command and its
+    arguments, or return None if the command must run in-process."""
+    index = 0
+    global_args: List[str] = []
+    while index < len(argv) and argv[index].startswith("-"):
+        arg = argv[index]
+        if arg.split("=")[0] in LOCAL_OPTIONS:
+            return None
+        global_args.append(arg)
+        if arg in VALUE_OPTIONS:
+            if index + 1 == len(argv):
+                return None
+            global_args.append(argv[index + 1])
+            index += 1
+        index += 1
+    rest = argv[index:]
+    if "--help" in rest:
+        return None
+    for method in SERVED_COMMANDS:
+        words = method.split()
+        if rest[: len(words)] == words:
+            return global_args, method, rest[len(words) :]
+    return None
+
+
+def call(path: Path, method: str, params: Optional[Dict[str, Any]] = None) -> Any:
+    """Send one JSON-RPC request to the daemon and return its result."""
+    request = {"jsonrpc": "2.0", "id": 1, "method": method, "params": params or {}}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(str(path))
+        sock.settimeout(RESPONSE_TIMEOUT)
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as stream:
+            line = stream.readline()
+    if not line:
+        raise DaemonError("connection closed")
+    response = json.loads(line)
+    if "error" in response:
+        raise DaemonError(response["error"].get("message", "unknown error"))
+    return response["result"]
+
+
+def run_in_daemon(argv: List[str]) -> Optional[int]:
+    """Run a served command in the daemon and return its exit code, or None
+    if it has to run in-process."""
+    if os.environ.get(NO_DAEMON_ENV):
+        return None
+    command = split_command(argv)
+    if command is None:
+        return None
+    try:
+        root, git_dir = find_git_dirs()
+    except Exception:
+        return None
+    path = socket_path(git_dir)
+    if not path.exists():
+        return None
+    global_args, method, args = command
+    params = {
+        "global_args": global_args,
+        "args": args,
+        "cwd": os.getcwd(),
+        "root": str(root),
+        "color": sys.stdout.isatty(),
+        # e.g. GIT_INDEX_FILE, set by git for hooks of "git commit -a"
+        "env": {k: v for k, v in os.environ.items() if k.startswith("GIT_")},
+    }
+    try:
+        result = call(path, method, params)
+        stdout, stderr = str(result["stdout"]), str(result["stderr"])
+        exit_code = int(result["exit_code"])
+    except (OSError, ValueError, KeyError, TypeError, DaemonError):
+        # e.g. a daemon left a stale socket behind, or serves another tree
+        return None
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    return exit_code
+
+
+def main():
+    exit_code = run_in_daemon(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+    from .cli import cli
+
+    cli()
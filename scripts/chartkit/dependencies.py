@@ -0,0 +1,108 @@
+"""Freshness of vendored chart dependencies (Chart.lock and charts/)."""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional
+
+import click
+
+from .cache import cache_dir, write_json_atomic
+from .resultcache import hash_tree
+
+if TYPE_CHECKING:
+    from .charts import ChartInfo
+
+DEPENDENCY_STATE_VERSION = 1
+FILE_REPOSITORY = "file://"
+
+
+def local_dependency_path(chart: "ChartInfo", dependency: Dict) -> Optional[Path]:
+    """Directory of a file:// dependency, or None for chart repositories."""
+    repository = str(dependency.get("repository") or "")
+    if not repository.startswith(FILE_REPOSITORY):
+        return None
+    return (chart.path / repository.removeprefix(FILE_REPOSITORY)).resolve()
+
+
+class DependencyState:
+    """What each chart's dependencies were last updated from.
+
+    After a successful helm dependency update, the chart's inputs (its
+    declared dependencies and the content of its file:// subcharts, vendored
+    subcharts included) are stored with a hash of the outputs (Chart.lock and
+    the archives in charts/). A chart is up to date while both still match:
+    the declarations and local subcharts are unchanged, and Chart.lock and
+    charts/ have not been removed or edited since. Stored as JSON in
+    .git/chartkit-cache, keyed by the chart directory.
+    """
+
+    path: Path
+    charts: Dict[str, Dict[str, str]]
+    tree_hashes: Dict[Path, str]
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or cache_dir() / "dependencies.json"
+        self.tree_hashes = {}
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("version") != DEPENDENCY_STATE_VERSION:
+                raise ValueError("outdated dependency state")
+            self.charts = dict(data.get("charts", {}))
+        except (OSError, ValueError, AttributeError):
+            self.charts = {}
+
+    def tree_hash(self, path: Path) -> str:
+        """Content hash of a local subchart, computed once per run: its
+        dependencies are updated before it is hashed for its dependents."""
+        if path not in self.tree_hashes:
+            self.tree_hashes[path] = hash_tree(path) if path.is_dir() else ""
+        return self.tree_hashes[path]
+
+    def inputs(self, chart: "ChartInfo") -> str:
+        digest = hashlib.sha256()
+        digest.update(json.dumps(chart.dependencies, sort_keys=True).encode())
+        for dependency in chart.dependencies:
+            local_path = local_dependency_path(chart, dependency)
+            if local_path is not None:
+                digest.update(b"\0" + self.tree_hash(local_path).encode())
+        return digest.hexdigest()
+
+    def outputs(self, chart: "ChartInfo") -> str:
+        digest = hashlib.sha256()
+        lock = chart.path / "Chart.lock"
+        digest.update(lock.read_bytes() if lock.is_file() else b"")
+        charts_dir = chart.path / "charts"
+        digest.update(
+            b"\0" + (hash_tree(charts_dir) if charts_dir.is_dir() else "").encode()
+        )
+        return digest.hexdigest()
+
+    def is_fresh(self, chart: "ChartInfo") -> bool:
+        """Whether the chart's vendored dependencies match its declarations."""
+        stored = self.charts.get(str(chart.path))
+        if not stored or not (chart.path / "Chart.lock").is_file():
+            return False
+        if stored.get("inputs") != self.inputs(chart):
+            return False
+        return stored.get("outputs") == self.outputs(chart)
+
+    def record(self, chart: "ChartInfo"):
+        """Remember a successful update. The chart's own content changed, so
+        it is hashed again when a dependent needs it."""
+        self.charts[str(chart.path)] = {
+            "inputs": self.inputs(chart),
+            "outputs": self.outputs(chart),
+        }
+        self.tree_hashes.pop(chart.path.resolve(), None)
+
+    def save(self):
+        try:
+            write_json_atomic(
+                self.path,
+                {"version": DEPENDENCY_STATE_VERSION, "charts": self.charts},
+            )
+        except OSError as e:
+            click.echo(
+                f"WARN: Failed to write dependency state {self.path}: {e}", err=True
+            )
@@ -1,63 +1,200 @@
-from pathlib import Path
-from typing import Any, Dict, List, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePath
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+import fnmatch
 import os
+import functools
 import click
-from ruamel.yaml import YAML
 
 from .git import git_root
 
-yaml = YAML()
+if TYPE_CHECKING:
+    from ruamel.yaml import YAML
 
+IGNORE_FILE = ".chartkitignore"
 
-def files_to_chart_files(file_paths: List[str]) -> Set[str]:
-    """Find chart names (in Chart.yaml files) from a list of file paths.
-    - If a path is a Chart.yaml file, include it directly.
-    - If the path is a values.yaml or values.schema.json file, look for Chart.yaml in the same directory.
-    - If the path is a template file or in the templates directory, look for Chart.yaml in the parent directory.
+T = TypeVar("T")
+
+# Directories that never hold charts we manage: VCS and tool metadata,
+# helm-unittest snapshots and the deprecated chart tree.
+DEFAULT_IGNORE_PATTERNS = [
+    ".git",
+    ".venv",
+    "node_modules",
+    "__pycache__",
+    "__snapshot__",
+    "deprecated",
+]
+
+
+# Files, relative to their chart directory, whose changes change the chart.
+# Mirrored by isChartRelevant in .github/workflows/release-helm-chart-automatic.yaml.
+CHART_FILE_NAMES = ["Chart.yaml", "values.yaml", "values.schema.json"]
+CHART_FILE_DIRS = ["templates", "tests"]
+
+
+def is_chart_file(rel_path: "str | PurePath") -> bool:
+    """Whether a path relative to its chart directory belongs to the chart's
+    content: Chart.yaml, values, templates (and *.tpl helpers) and tests.
+    Documentation, Chart.lock and .helmignore do not count. The chart
+    directory itself (".") does."""
+    parts = PurePath(rel_path).parts
+    if not parts:
+        return True
+    return (
+        parts[-1] in CHART_FILE_NAMES
+        or parts[-1].endswith(".tpl")
+        or any(part in CHART_FILE_DIRS for part in parts)
+    )
+
+
+class PathTrie(Generic[T]):
+    """Values stored at directories, looked up by the longest directory
+    prefix of a path, one path component per trie level. Lookups are pure
+    string operations, so they are cheap and also work for paths that no
+    longer exist."""
+
+    def __init__(self):
+        self.children: Dict[str, "PathTrie[T]"] = {}
+        self.value: Optional[T] = None
+
+    @staticmethod
+    def split(path: "str | PurePath") -> List[str]:
+        return os.path.normpath(path).split(os.sep)
+
+    def insert(self, path: "str | PurePath", value: T):
+        node = self
+        for part in self.split(path):
+            node = node.children.setdefault(part, PathTrie())
+        node.value = value
+
+    def longest_prefix(self, path: "str | PurePath") -> Optional[T]:
+        """The value of the innermost directory containing the path (or of
+        the path itself)."""
+        node, found = self, self.value
+        for part in self.split(path):
+            next_node = node.children.get(part)
+            if next_node is None:
+                break
+            node = next_node
+            if node.value is not None:
+                found = node.value
+        return found
+
+
+def load_ignore_patterns(roots: List[Path]) -> List[str]:
+    """Collect ignore patterns: the defaults, then each .chartkitignore found in
+    the git root and the scan roots. Later patterns take precedence, and a
+    pattern starting with '!' re-includes paths ignored by an earlier one.
     """
-    charts: Set[Path] = set()
-    for path in file_paths:
-        path = Path(path)
-        chart_yaml: Optional[Path] = None
-        if not path.is_absolute():
-            path = git_root() / path
-        if not path.exists():
-            click.echo(f"WARN: Path does not exist: {path}", err=True)
+    patterns = list(DEFAULT_IGNORE_PATTERNS)
+    ignore_files: List[Path] = []
+    for directory in [git_root(), *roots]:
+        ignore_file = directory / IGNORE_FILE
+        if ignore_file not in ignore_files and ignore_file.is_file():
+            ignore_files.append(ignore_file)
+    for ignore_file in ignore_files:
+        for line in ignore_file.read_text(encoding="utf-8").splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                patterns.append(line.rstrip("/"))
+    return patterns
+
+
+def is_ignored(rel_path: str, name: str, patterns: List[str]) -> bool:
+    """Check a directory against ignore patterns (last match wins).
+    Patterns without a slash match the directory name at any depth; patterns
+    with a slash match the path relative to the scan root.
+    """
+    ignored = False
+    for pattern in patterns:
+        negate = pattern.startswith("!")
+        if negate:
+            pattern = pattern[1:]
+        target = rel_path if "/" in pattern else name
+        if fnmatch.fnmatchcase(target, pattern.lstrip("/")):
+            ignored = not negate
+    return ignored
+
+
+def _scan_dir(
+    root: Path, directory: Path, patterns: List[str]
+) -> Tuple[Optional[Path], List[Path], int]:
+    """List one directory. Returns its Chart.yaml (if any), the subdirectories
+    still to be scanned and the directory's mtime. Ignored directories and the
+    vendored charts/ directory of a chart are pruned."""
+    with os.scandir(directory) as it:
+        entries = list(it)
+    mtime = os.stat(directory).st_mtime_ns
+
+    chart_file = next(
+        (Path(e.path) for e in entries if e.name == "Chart.yaml" and e.is_file()),
+        None,
+    )
+    subdirs: List[Path] = []
+    for entry in entries:
+        if not entry.is_dir(follow_symlinks=False):
             continue
-        if os.path.isdir(path):
-            chart_yaml = Path(path) / "Chart.yaml"
-        elif path.name == "Chart.yaml":
-            chart_yaml = path
-        elif path.name in ["values.yaml", "values.schema.json"]:
-            chart_yaml = Path(path).parent / "Chart.yaml"
-        elif (
-            path.suffix == ".tpl" or "templates" in path.parts or "tests" in path.parts
-        ):
-            # find the directory containing 'templates' or 'tests'
-            parts = path.parts
-            idx = next(
-                (i for i, p in enumerate(parts) if p in ("templates", "tests")), None
-            )
-            if idx is not None:
-                chart_yaml = Path(*parts[:idx]) / "Chart.yaml"
-        if chart_yaml and chart_yaml.exists():
-            charts.add(chart_yaml)
-
-    return {
-        str(load_chart(chart).get("name"))
-        for chart in charts
-        if load_chart(chart) is not None
-    }
-
-
-def find_chart_files(roots: List[Path]) -> List[Path]:
+        if chart_file and entry.name == "charts":
+            continue
+        rel_path = Path(entry.path).relative_to(root).as_posix()
+        if is_ignored(rel_path, entry.name, patterns):
+            continue
+        subdirs.append(Path(entry.path))
+    return chart_file, subdirs, mtime
+
+
+def _scan_tree(
+    root: Path, start: Path, patterns: List[str]
+) -> Tuple[List[Path], Dict[str, int]]:
+    """Depth-first scan of one subtree of a root for Chart.yaml files."""
+    chart_files: List[Path] = []
+    dir_mtimes: Dict[str, int] = {}
+    stack = [start]
+    while stack:
+        directory = stack.pop()
+        try:
+            chart_file, subdirs, mtime = _scan_dir(root, directory, patterns)
+        except OSError as e:
+            click.echo(f"WARN: Failed to scan {directory}: {e}", err=True)
+            continue
+        dir_mtimes[str(directory)] = mtime
+        if chart_file:
+            chart_files.append(chart_file)
+        stack.extend(subdirs)
+    return chart_files, dir_mtimes
+
+
+def find_chart_files(
+    roots: List[Path],
+    dir_mtimes: Optional[Dict[str, int]] = None,
+    workers: Optional[int] = None,
+) -> List[Path]:
     """
     Recursively find all Chart.yaml files in the given root directories.
-    Excludes Chart.lock files and handles various edge cases.
+    Directories matching the ignore patterns (see load_ignore_patterns) and the
+    vendored charts/ directory of each chart are not descended into, and the
+    top-level subdirectories of every root are scanned concurrently.
+    If dir_mtimes is given, it is filled with the mtime of every scanned
+    directory and ignore file so a cached result can later be checked for
+    staleness.
     """
     chart_files: List[Path] = []
     seen_paths: Set[Path] = set()
+    mtimes: Dict[str, int] = {}
+    patterns = load_ignore_patterns(roots)
 
+    subtrees: List[Tuple[Path, Path]] = []
     for root in roots:
         if not root.exists():
             click.echo(f"WARN: Root path does not exist: {root}", err=True)
@@ -65,37 +202,69 @@ def find_chart_files(roots: List[Path]) -> List[Path]:
         if not root.is_dir():
             click.echo(f"WARN: Root path is not a directory: {root}", err=True)
             continue
+        try:
+            chart_file, subdirs, mtime = _scan_dir(root, root, patterns)
+        except OSError as e:
+            click.echo(f"WARN: Failed to scan {root}: {e}", err=True)
+            continue
+        mtimes[str(root)] = mtime
+        if chart_file:
+            chart_files.append(chart_file)
+        subtrees.extend((root, subdir) for subdir in subdirs)
 
-        # Use rglob to recursively find all Chart.yaml files
-        for p in root.rglob("Chart.yaml"):
-            # Skip if this is actually Chart.lock or other variants
-            if p.name != "Chart.yaml":
-                continue
-
-            # Skip if we've already seen this path (handles overlapping roots)
-            resolved_path = p.resolve()
-            if resolved_path in seen_paths:
-                continue
-            seen_paths.add(resolved_path)
+    max_workers = workers or min(32, os.cpu_count() or 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(lambda t: _scan_tree(t[0], t[1], patterns), subtrees)
+        for found, subtree_mtimes in results:
+            chart_files.extend(found)
+            mtimes.update(subtree_mtimes)
 
-            # Skip if the file is not readable
-            if not p.is_file() or not p.exists():
-                continue
+    if dir_mtimes is not None:
+        dir_mtimes.update(mtimes)
+        for directory in [git_root(), *roots]:
+            ignore_file = directory / IGNORE_FILE
+            if ignore_file.is_file():
+                dir_mtimes[str(ignore_file)] = ignore_file.stat().st_mtime_ns
 
-            chart_files.append(p)
+    unique_files: List[Path] = []
+    for p in chart_files:
+        # Skip if we've already seen this path (handles overlapping roots)
+        resolved_path = p.resolve()
+        if resolved_path in seen_paths:
+            continue
+        seen_paths.add(resolved_path)
+        unique_files.append(p)
 
-    return sorted(chart_files)  # Sort for consistent output
+    return sorted(unique_files)  # Sort for consistent output
 
 
 def load_chart(chart_yaml_path: Path) -> Dict[str, Any]:
     try:
         with chart_yaml_path.open("r", encoding="utf-8") as f:
-            return yaml.load(f) or {}
+            return parse_chart(f.read())
     except Exception as e:
         click.echo(f"WARN: Failed to parse {chart_yaml_path}: {e}", err=True)
         return {}
 
 
+@functools.cache
+def read_yaml() -> "YAML":
+    """Read-only YAML loader, created on first use.
+
+    Chart.yaml files are only parsed for their values here, so the safe loader
+    (C-accelerated when ruamel.yaml.clib is installed) is used. Comment
+    preserving round-trip loading is left to chartyaml.ChartYamlBatch.
+    """
+    from ruamel.yaml import YAML
+
+    return YAML(typ="safe")
+
+
+def parse_chart(content: str) -> Dict[str, Any]:
+    """Parse Chart.yaml content for reading. Use save_chart_yaml to modify it."""
+    return read_yaml().load(content) or {}
+
+
 def make_path_root_relative(path: Path) -> Path:
     """Make a path relative to the git root."""
     try:
@@ -1,25 +1,59 @@
+import functools
 import subprocess
 from pathlib import Path
-from typing import Optional
-import click
-from git import Blob, Repo
+from typing import TYPE_CHECKING, Dict, List, Optional
 
+from .profiling import profiled, subprocess_phase
 
-repo = Repo(search_parent_directories=True)
+# gitpython is slow to import; it is only loaded once a git query is made.
+# click is imported where errors are raised, so that the daemon client
+# (chartkit.client) can locate the repository without it.
+if TYPE_CHECKING:
+    from git import Blob, Repo
+
+
+@functools.cache
+@profiled("git")
+def get_repo() -> "Repo":
+    """Open the git repository containing the working directory."""
+    from git import Repo
+
+    return Repo(search_parent_directories=True)
+
+
+@functools.cache
+def find_git_dirs() -> tuple[Path, Path]:
+    """Locate the working tree root and .git directory without gitpython by
+    searching the working directory and its parents for a .git entry. A .git
+    file (worktrees, submodules) points at the real git directory."""
+    cwd = Path.cwd().resolve()
+    for directory in [cwd, *cwd.parents]:
+        dot_git = directory / ".git"
+        if dot_git.is_dir():
+            return directory, dot_git
+        if dot_git.is_file():
+            content = dot_git.read_text(encoding="utf-8").strip()
+            if content.startswith("gitdir:"):
+                return directory, (directory / content[7:].strip()).resolve()
+    raise Exception("No git repository found.")
 
 
 def git_root() -> Path:
     """Locate the root of the git repository."""
-    if repo.working_tree_dir is None:
-        raise Exception("No git repository found.")
-    return Path(repo.working_tree_dir)
+    return find_git_dirs()[0]
+
+
+def git_dir() -> Path:
+    """Locate the .git directory of the current repository (or worktree)."""
+    return find_git_dirs()[1]
 
 
+@profiled("git")
 def staged_files() -> list[str]:
     """Get files staged for commit."""
     # a_path = path in HEAD, b_path = path in index; both collected to handle renames
     paths = set()
-    for diff in repo.index.diff("HEAD"):
+    for diff in get_repo().index.diff("HEAD"):
         if diff.a_path:
             paths.add(diff.a_path)
         if diff.b_path:
@@ -27,28 +61,58 @@ def staged_files() -> list[str]:
     return list(paths)
 
 
+@profiled("git")
 def diff_files(base_ref: str) -> list[str]:
     """Get files changed between base_ref and HEAD (three-dot diff)."""
-    result = subprocess.run(
-        ["git", "diff", "--name-only", f"{base_ref}...HEAD"],
-        capture_output=True,
-        text=True,
-        cwd=str(git_root()),
-    )
+    command = ["git", "diff", "--name-only", f"{base_ref}...HEAD"]
+    with subprocess_phase(command):
+        result = subprocess.run(
+            command, capture_output=True, text=True, cwd=str(git_root())
+        )
     if result.returncode != 0:
+        import click
+
         raise click.ClickException(
             f"git diff failed for ref '{base_ref}':\n{result.stderr.strip()}"
         )
     return [line for line in result.stdout.splitlines() if line]
 
 
+@profiled("git")
+def changed_files(commit: str, paths: List[str]) -> list[str]:
+    """Files below the paths that differ between commit and the working tree,
+    staged or not, and untracked files there; relative to the git root."""
+    commit_id = resolve_commit(commit)
+    files: List[str] = []
+    for command in (
+        ["git", "diff", "--name-only", commit_id, "--", *paths],
+        ["git", "ls-files", "--others", "--exclude-standard", "--", *paths],
+    ):
+        with subprocess_phase(command):
+            result = subprocess.run(
+                command, capture_output=True, text=True, cwd=str(git_root())
+            )
+        if result.returncode != 0:
+            import click
+
+            raise click.ClickException(
+                f"{' '.join(command[:2])} failed:\n{result.stderr.strip()}"
+            )
+        files.extend(line for line in result.stdout.splitlines() if line)
+    return files
+
+
+@profiled("git")
 def get_commit_tree(commit: str):
     """Get the tree object for a specific commit."""
-    return repo.commit(commit).tree
+    return get_repo().commit(commit).tree
 
 
-def get_commit_blob(commit: str, file_path: str) -> Optional[Blob]:
+@profiled("git")
+def get_commit_blob(commit: str, file_path: str) -> Optional["Blob"]:
     """Get the contents of a file at a specific commit."""
+    from git import Blob
+
     from .files import make_path_root_relative
 
     tree = get_commit_tree(commit)
@@ -56,3 +120,61 @@ def get_commit_blob(commit: str, file_path: str) -> Optional[Blob]:
     if isinstance(blob, Blob):
         return blob
     return None
+
+
+@profiled("git")
+def resolve_commit(commit: str) -> str:
+    """Resolve a commit-ish (branch, tag, HEAD~1, ...) to its commit id."""
+    command = ["git", "rev-parse", "--verify", "--quiet", f"{commit}^{{commit}}"]
+    with subprocess_phase(command):
+        result = subprocess.run(
+            command, capture_output=True, text=True, cwd=str(git_root())
+        )
+    if result.returncode != 0:
+        import click
+
+        raise click.ClickException(f"Unknown git commit '{commit}'.")
+    return result.stdout.strip()
+
+
+@profiled("git")
+def read_blobs(commit: str, file_paths: List[str]) -> Dict[str, Optional[bytes]]:
+    """Get the contents of several files at a commit from a single git
+    cat-file --batch process. Paths are relative to the git root; files
+    missing at the commit map to None."""
+    if not file_paths:
+        return {}
+    commit_id = resolve_commit(commit)
+    requests = "".join(f"{commit_id}:{path}\n" for path in file_paths)
+    command = ["git", "cat-file", "--batch"]
+    with subprocess_phase(command):
+        result = subprocess.run(
+            command,
+            input=requests.encode("utf-8"),
+            capture_output=True,
+            cwd=str(git_root()),
+        )
+    if result.returncode != 0:
+        import click
+
+        raise click.ClickException(
+            f"git cat-file failed:\n{result.stderr.decode(errors='replace').strip()}"
+        )
+    blobs: Dict[str, Optional[bytes]] = {}
+    output, offset = result.stdout, 0
+    for path in file_paths:
+        end = output.index(b"\n", offset)
+        header = output[offset:end]
+        offset = end + 1
+        # "<sha> <type> <size>", or "<object> missing" where the object
+        # names the path, which may contain whitespace: split from the right
+        if header.rsplit(b" ", 1)[-1] == b"missing":
+            blobs[path] = None
+            continue
+        _, object_type, size = header.rsplit(b" ", 2)
+        # a directory (tree) at that path counts as missing
+        blobs[path] = (
+            output[offset : offset + int(size)] if object_type == b"blob" else None
+        )
+        offset += int(size) + 1
+    return blobs
@@ -2,26 +2,144 @@ import sys
 import subprocess
 import tempfile
 import os
-from typing import Dict, List, Optional, Set
+import hashlib
+import json
+import re
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 import click
+from .cache import cache_dir, prune_entries, write_text_atomic
 from .charts import ChartEdge, ChartGraph, ChartInfo
+from .profiling import profiled, subprocess_phase
+from .render import DiagramNode, layered_layout, render_dot, render_svg
+
+# Characters replaced in Mermaid identifiers.
+UNSAFE_IDENTIFIER_CHARS = re.compile(r"[^A-Za-z0-9_]")
+
+# Part of every fingerprint; bump it when the generated diagrams change, so
+# cached diagrams are not reused and committed ones show up as out of date.
+DIAGRAM_VERSION = 1
+
+# How each format carries the fingerprint of the graph it was drawn from.
+FINGERPRINT_COMMENTS = {
+    "mermaid": "%% chartkit-fingerprint: {}\n",
+    "svg": "<!-- chartkit-fingerprint: {} -->\n",
+    "dot": "// chartkit-fingerprint: {}\n",
+}
+FINGERPRINT = re.compile(rb"chartkit-fingerprint: ([0-9a-f]{64})")
+EXTENSIONS = {"mermaid": "mmd", "svg": "svg", "dot": "dot"}
+
+
+def graph_fingerprint(
+    charts: Dict[str, ChartInfo], edges: Set[ChartEdge], **options: Any
+) -> str:
+    """sha256 of everything a diagram shows: the charts and their types, the
+    edges, and the diagram options. Versions only count when they are drawn
+    (include_attrs), so a version bump leaves other diagrams current."""
+    include_attrs = bool(options.get("include_attrs"))
+    data = {
+        "version": DIAGRAM_VERSION,
+        "charts": sorted(
+            [name, info.type, info.version if include_attrs else None]
+            for name, info in charts.items()
+        ),
+        "edges": sorted([edge.parent, edge.child] for edge in edges),
+        "options": options,
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def embed_fingerprint(fmt: str, text: str, fingerprint: str) -> str:
+    """Add the fingerprint as a comment: after a Mermaid diagram, before the
+    root element of an SVG and at the top of a DOT graph."""
+    comment = FINGERPRINT_COMMENTS[fmt].format(fingerprint)
+    if fmt == "mermaid":
+        return text + comment
+    if fmt == "svg" and text.startswith("<?xml"):
+        end = text.index("?>") + 2
+        return text[:end] + "\n" + comment + text[end:].lstrip("\n")
+    return comment + text
+
+
+def read_fingerprint(path: str) -> Optional[str]:
+    """The fingerprint embedded in a diagram file, if any."""
+    try:
+        with open(path, "rb") as f:
+            match = FINGERPRINT.search(f.read())
+    except OSError:
+        return None
+    return match.group(1).decode() if match else None
+
+
+class DiagramCache:
+    """Generated diagrams keyed by their fingerprint, one file per diagram in
+    .git/chartkit-cache/diagrams."""
+
+    path: Path
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or cache_dir() / "diagrams"
+
+    def entry(self, fingerprint: str, fmt: str) -> Path:
+        return self.path / f"{fingerprint}.{EXTENSIONS[fmt]}"
+
+    def get(self, fingerprint: str, fmt: str) -> Optional[str]:
+        """Return a cached diagram. Hits are touched so pruning evicts the
+        least recently used entries first."""
+        entry = self.entry(fingerprint, fmt)
+        try:
+            text = entry.read_text(encoding="utf-8")
+            os.utime(entry)
+        except OSError:
+            return None
+        return text
+
+    def put(self, fingerprint: str, fmt: str, text: str):
+        entry = self.entry(fingerprint, fmt)
+        try:
+            write_text_atomic(entry, text)
+        except OSError as e:
+            click.echo(f"WARN: Failed to write diagram cache {entry}: {e}", err=True)
+
+    def prune(
+        self, max_bytes: Optional[int] = None, max_age: Optional[float] = None
+    ) -> Tuple[int, int]:
+        """Evict diagrams older than max_age seconds (by last use), then the
+        least recently used ones until the cache fits in max_bytes.
+        Returns the number of entries and bytes removed."""
+        return prune_entries(
+            (p for p in self.path.glob("*.*") if not p.name.startswith(".")),
+            max_bytes,
+            max_age,
+        )
 
 
 class MermaidDiagram:
-    """Class to generate Mermaid ER diagrams from Helm chart dependency graphs."""
+    """Class to generate Mermaid ER diagrams from Helm chart dependency graphs.
+
+    Every diagram file embeds a fingerprint of the drawn graph and options
+    (see graph_fingerprint); the diagram printed by mermaid_str does not. With a DiagramCache, diagrams of an unchanged graph
+    are read from the cache instead of being generated again.
+    """
 
     MERMAID_HEADER = """
     erDiagram
     """
 
-    mermaid_str: str
+    charts: Dict[str, ChartInfo]
+    edges: Set[ChartEdge]
+    include_attrs: bool
+    root_chart: Optional[str]
+    cache: Optional[DiagramCache]
 
     def __init__(
         self,
         chart_graph: ChartGraph,
         include_attrs: bool,
         root_chart: Optional[str] = None,
+        cache: Optional[DiagramCache] = None,
     ):
         """Generate a Mermaid ER diagram from the given chartgraph."""
         charts = chart_graph.charts
@@ -38,8 +156,58 @@ class MermaidDiagram:
             # filter edges to those that connect to subcharts
             edges = {e for e in edges if e.parent in subcharts}
 
-        self.mermaid_str = self.generate(charts, edges, include_attrs)
+        self.charts = charts
+        self.edges = edges
+        self.include_attrs = include_attrs
+        self.root_chart = root_chart
+        self.cache = cache
+
+    def fingerprint(self, fmt: str, renderer: str = "native") -> str:
+        """Fingerprint of the diagram in a format ("mermaid", "svg", "dot")."""
+        options: Dict[str, Any] = {
+            "format": fmt,
+            "include_attrs": self.include_attrs,
+            "root_chart": self.root_chart,
+        }
+        if fmt == "svg":
+            options["renderer"] = renderer
+        return graph_fingerprint(self.charts, self.edges, **options)
+
+    def artifact(
+        self, fmt: str, build: Callable[[], str], renderer: str = "native"
+    ) -> str:
+        """The diagram in a format with its fingerprint embedded; cached, or
+        built with build() and cached."""
+        fingerprint = self.fingerprint(fmt, renderer)
+        if self.cache is not None:
+            text = self.cache.get(fingerprint, fmt)
+            if text is not None:
+                return text
+        text = embed_fingerprint(fmt, build(), fingerprint)
+        if self.cache is not None:
+            self.cache.put(fingerprint, fmt, text)
+        return text
+
+    def is_current(self, fmt: str, path: str, renderer: str = "native") -> bool:
+        """Whether a diagram file was generated from the current graph with
+        the same options. Only its embedded fingerprint is compared; nothing
+        is generated."""
+        return read_fingerprint(path) == self.fingerprint(fmt, renderer)
+
+    def render_mermaid(self) -> str:
+        """The Mermaid diagram with its fingerprint, as written to a file."""
+        return self.artifact(
+            "mermaid",
+            lambda: self.generate(self.charts, self.edges, self.include_attrs),
+        )
 
+    @cached_property
+    def mermaid_str(self) -> str:
+        """The Mermaid diagram as printed, without the fingerprint comment."""
+        comment = FINGERPRINT_COMMENTS["mermaid"].format(self.fingerprint("mermaid"))
+        return self.render_mermaid().removesuffix(comment)
+
+    @profiled("output")
     def generate(
         self, charts: Dict[str, ChartInfo], edges: Set[ChartEdge], include_attrs: bool
     ) -> str:
@@ -67,8 +235,8 @@ class MermaidDiagram:
         # Emit relationships (parent depends on child)
         # Using: PARENT ||--o{ CHILD : DEPENDS_ON
         for parent, child in sorted(edges):
-            p = id_map.get(parent, self.sanitize_identifier(parent))
-            c = id_map.get(child, self.sanitize_identifier(child))
+            p = id_map.get(parent) or self.sanitize_identifier(parent)
+            c = id_map.get(child) or self.sanitize_identifier(child)
             lines.append(f"    {p} ||--o{{ {c} : DEPENDS_ON")
 
         # Emit legend mapping as comments
@@ -83,21 +251,66 @@ class MermaidDiagram:
         Mermaid ER likes [A-Za-z0-9_] and dislikes hyphens/spaces.
         We'll replace non-alnum with underscores and ensure it doesn't start with a digit.
         """
-        import re
-
-        ident = re.sub(r"[^A-Za-z0-9_]", "_", name)
+        ident = UNSAFE_IDENTIFIER_CHARS.sub("_", name)
         if ident and ident[0].isdigit():
             ident = f"_{ident}"
         return ident or "_unnamed_"
 
+    @profiled("output")
     def write_mermaid_to_file(self, output_path: str) -> None:
         """Write the Mermaid diagram string to the specified file."""
         with open(output_path, "w") as f:
-            f.write(self.mermaid_str)
+            f.write(self.render_mermaid())
         click.echo(f"Mermaid diagram written to {output_path}")
 
+    def diagram_nodes(self) -> List[DiagramNode]:
+        """The charts with their labels, for the SVG and DOT renderers."""
+        return [
+            DiagramNode(
+                name,
+                [name, info.version, info.type] if self.include_attrs else [name],
+                library=info.type == "library",
+            )
+            for name, info in self.charts.items()
+        ]
+
+    def render_svg(self) -> str:
+        """The diagram as SVG, laid out in-process (see render.layered_layout)."""
+        edges = [(edge.parent, edge.child) for edge in self.edges]
+        return self.artifact(
+            "svg", lambda: render_svg(layered_layout(self.diagram_nodes(), edges))
+        )
+
+    def render_dot(self) -> str:
+        """The diagram as a Graphviz digraph."""
+        edges = [(edge.parent, edge.child) for edge in self.edges]
+        return self.artifact("dot", lambda: render_dot(self.diagram_nodes(), edges))
+
+    @profiled("output")
+    def write_svg(self, output_path: str) -> None:
+        """Write the diagram as an SVG file, without external tools."""
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(self.render_svg())
+        click.echo(f"SVG written to {output_path}")
+
+    @profiled("output")
+    def write_dot(self, output_path: str) -> None:
+        """Write the diagram as a Graphviz DOT file."""
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(self.render_dot())
+        click.echo(f"DOT graph written to {output_path}")
+
+    @profiled("output")
     def write_mermaid_to_svg(self, output_path: str) -> None:
-        """Write the Mermaid diagram as an SVG file using the mermaid CLI tool."""
+        """Write the Mermaid diagram as an SVG file using the mermaid CLI tool,
+        which npx downloads and which runs a headless browser."""
+        fingerprint = self.fingerprint("svg", "mermaid-cli")
+        cached = self.cache.get(fingerprint, "svg") if self.cache else None
+        if cached is not None:
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(cached)
+            click.echo(f"SVG written to {output_path}")
+            return
 
         with tempfile.NamedTemporaryFile(
             mode="w", suffix=".mmd", delete=False
@@ -117,7 +330,14 @@ class MermaidDiagram:
         ]
         click.echo(f"Running Mermaid CLI to generate SVG: {' '.join(cmd)}")
         try:
-            subprocess.run(cmd, check=True)
+            with subprocess_phase(cmd):
+                subprocess.run(cmd, check=True)
+            with open(output_path, encoding="utf-8") as f:
+                svg = embed_fingerprint("svg", f.read(), fingerprint)
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(svg)
+            if self.cache is not None:
+                self.cache.put(fingerprint, "svg", svg)
             click.echo(f"SVG written to {output_path}")
         except Exception as e:
             click.echo(f"ERROR: Failed to generate SVG: {e}", file=sys.stderr)
@@ -0,0 +1,149 @@
+"""Content-addressed cache of packaged internal charts, used to vendor
+file:// dependencies without running helm dependency update."""
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+import click
+
+from .cache import cache_dir, prune_entries
+from .dependencies import local_dependency_path
+from .files import load_chart
+from .profiling import subprocess_phase
+from .resultcache import hash_tree
+
+if TYPE_CHECKING:
+    from .charts import ChartInfo
+
+
+class PackageCache:
+    """Chart archives keyed by the content hash of the chart directory.
+
+    Each internal chart is packaged with helm package once per content hash
+    (its vendored subcharts included) and stored in
+    .git/chartkit-cache/packages. Dependents get the archive hard-linked (or
+    copied, across file systems) into their charts/ directory. Only charts
+    whose Chart.lock already pins the current versions of their file://
+    dependencies are vendored this way; anything else, like repository
+    dependencies or a lock that needs to change, is left to helm.
+    """
+
+    path: Path
+    tree_hash: Callable[[Path], str]
+
+    def __init__(
+        self,
+        tree_hash: Optional[Callable[[Path], str]] = None,
+        path: Optional[Path] = None,
+    ):
+        """tree_hash(directory) returns the content hash of a chart directory,
+        e.g. DependencyState.tree_hash to share hashes computed in a run."""
+        self.path = path or cache_dir() / "packages"
+        self.tree_hash = tree_hash or hash_tree
+        self.locks: Dict[str, threading.Lock] = {}
+        self.locks_lock = threading.Lock()
+
+    def archive(self, chart_dir: Path) -> Optional[Path]:
+        """Return the cached archive of a chart directory, packaging it first
+        if its current content has not been packaged before."""
+        chart = load_chart(chart_dir / "Chart.yaml")
+        if not chart:
+            return None
+        digest = self.tree_hash(chart_dir)[:16]
+        key = f"{chart.get('name')}-{chart.get('version')}-{digest}"
+        target = self.path / f"{key}.tgz"
+        with self.locks_lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+        with lock:
+            if target.is_file():
+                # mark as recently used for prune
+                os.utime(target)
+                return target
+            self.path.mkdir(parents=True, exist_ok=True)
+            with tempfile.TemporaryDirectory(dir=self.path) as tmp:
+                command = ["helm", "package", str(chart_dir), "--destination", tmp]
+                with subprocess_phase(command):
+                    result = subprocess.run(command, capture_output=True, text=True)
+                packaged = list(Path(tmp).glob("*.tgz"))
+                if result.returncode != 0 or len(packaged) != 1:
+                    click.echo(
+                        f"WARN: Failed to package {chart_dir}:\n"
+                        f"{result.stdout}{result.stderr}",
+                        err=True,
+                    )
+                    return None
+                os.replace(packaged[0], target)
+        return target
+
+    def prune(
+        self, max_bytes: Optional[int] = None, max_age: Optional[float] = None
+    ) -> Tuple[int, int]:
+        """Evict archives by age and size, like ResultCache.prune. Archives
+        already linked into charts/ directories stay there."""
+        return prune_entries(self.path.glob("*.tgz"), max_bytes, max_age)
+
+    def can_vendor(self, chart: "ChartInfo") -> bool:
+        """Whether all dependencies are file:// charts pinned by Chart.lock at
+        their current versions, so that only the archives need replacing."""
+        lock_file = chart.path / "Chart.lock"
+        lock = load_chart(lock_file) if lock_file.is_file() else {}
+        locked = {
+            (d.get("name"), d.get("repository")): str(d.get("version"))
+            for d in lock.get("dependencies") or []
+        }
+        if len(locked) != len(chart.dependencies):
+            return False
+        for dependency in chart.dependencies:
+            local_path = local_dependency_path(chart, dependency)
+            if local_path is None:
+                return False
+            current = load_chart(local_path / "Chart.yaml")
+            key = (dependency.get("name"), dependency.get("repository"))
+            if not current or locked.get(key) != str(current.get("version")):
+                return False
+            if str(dependency.get("version")) != str(current.get("version")):
+                # a version range; let helm check that it is satisfied
+                return False
+        return True
+
+    def vendor(self, chart: "ChartInfo") -> bool:
+        """Place the cached archives of the chart's dependencies in charts/,
+        replacing other versions of them. Returns False on failure."""
+        charts_dir = chart.path / "charts"
+        charts_dir.mkdir(exist_ok=True)
+        vendored: List[str] = []
+        for dependency in chart.dependencies:
+            local_path = local_dependency_path(chart, dependency)
+            archive = self.archive(local_path) if local_path else None
+            if archive is None:
+                return False
+            dependency_name = str(dependency["name"])
+            name = f"{dependency_name}-{dependency['version']}.tgz"
+            other_versions = re.compile(re.escape(dependency_name) + r"-\d.*\.tgz")
+            for stale in charts_dir.glob(f"{dependency_name}-*.tgz"):
+                if stale.name != name and other_versions.fullmatch(stale.name):
+                    stale.unlink()
+            link(archive, charts_dir / name)
+            vendored.append(name)
+        click.echo(
+            f"Vendored {', '.join(vendored)} into chart {chart.name} "
+            "from the package cache."
+        )
+        return True
+
+
+def link(source: Path, target: Path):
+    """Hard-link source to target, replacing it, or copy it if linking fails."""
+    tmp = target.with_name(f".{target.name}.tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(source, tmp)
+    except OSError:
+        shutil.copy2(source, tmp)
+    os.replace(tmp, target)
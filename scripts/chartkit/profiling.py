@@ -0,0 +1,292 @@
+"""Per-phase timing of a chartkit command (the global --profile options).
+
+Code marks its phases with `phase` (or the `profiled` decorator) and its
+external processes with `subprocess_phase`. Spans record wall time and the
+CPU time of the thread running them; nested spans on the same thread are
+subtracted from their parent's self time, so the self times of one thread
+add up to its wall time. Helm and git run in child processes, whose CPU time
+is only known in total.
+
+When profiling is off a span is a shared no-op context manager, so marking
+a phase costs a function call. Only the standard library is imported here.
+"""
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Sequence
+
+# Phases reported in this order; spans may use other names too.
+PHASES = ["discovery", "parse", "build_graph", "git", "subprocess", "output"]
+# The whole command; its self time is the time spent outside every phase.
+COMMAND = "command"
+
+NO_SPAN = contextlib.nullcontext()
+
+
+@dataclass
+class Span:
+    phase: str
+    name: str
+    args: Dict[str, Any]
+    thread_id: int
+    thread_name: str
+    start: float = 0.0
+    wall: float = 0.0
+    cpu: float = 0.0
+    # wall and CPU time of the spans nested in this one on its thread
+    child_wall: float = 0.0
+    child_cpu: float = 0.0
+    _cpu_start: float = 0.0
+
+    @property
+    def self_wall(self) -> float:
+        return self.wall - self.child_wall
+
+    @property
+    def self_cpu(self) -> float:
+        return self.cpu - self.child_cpu
+
+
+class Profile:
+    """Spans recorded while a command runs, and optionally a cProfile of the
+    main thread."""
+
+    def __init__(self, command: str, cprofile: bool = False):
+        self.command = command
+        self.spans: List[Span] = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.origin = time.perf_counter()
+        self.cpu_origin = time.process_time()
+        self.children_origin = children_cpu()
+        self.profiler = None
+        if cprofile:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+        self.root = self.enter(COMMAND, command, {})
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stack(self) -> List[Span]:
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def enter(self, phase: str, name: str, args: Dict[str, Any]) -> Span:
+        thread = threading.current_thread()
+        span = Span(phase, name, args, thread.ident or 0, thread.name)
+        self.stack().append(span)
+        span._cpu_start = time.thread_time()
+        span.start = time.perf_counter()
+        return span
+
+    def exit(self, span: Span):
+        span.wall = time.perf_counter() - span.start
+        span.cpu = time.thread_time() - span._cpu_start
+        stack = self.stack()
+        if span in stack:
+            stack.remove(span)
+        if stack:
+            stack[-1].child_wall += span.wall
+            stack[-1].child_cpu += span.cpu
+        with self.lock:
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def span(self, phase: str, name: str, args: Dict[str, Any]):
+        span = self.enter(phase, name, args)
+        try:
+            yield span
+        finally:
+            self.exit(span)
+
+    def finish(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.exit(self.root)
+        self.cpu = time.process_time() - self.cpu_origin
+        self.children_cpu = children_cpu() - self.children_origin
+
+    def phase_totals(self) -> List[Dict[str, Any]]:
+        """Calls, wall, self and CPU seconds per phase, in PHASES order
+        followed by other phases and the command itself."""
+        totals: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans:
+            total = totals.setdefault(
+                span.phase,
+                {"phase": span.phase, "calls": 0, "wall": 0.0, "self": 0.0, "cpu": 0.0},
+            )
+            total["calls"] += 1
+            total["wall"] += span.wall
+            total["self"] += span.self_wall
+            total["cpu"] += span.self_cpu
+        order = PHASES + sorted(set(totals) - set(PHASES) - {COMMAND}) + [COMMAND]
+        return [totals[phase] for phase in order if phase in totals]
+
+    def subprocesses(self) -> List[Span]:
+        return sorted(
+            (s for s in self.spans if s.phase == "subprocess"),
+            key=lambda s: s.wall,
+            reverse=True,
+        )
+
+    def format_table(self, top: int = 10) -> str:
+        lines = [
+            f"Profile of {self.command}: {self.root.wall * 1000:.1f} ms wall, "
+            f"{self.cpu * 1000:.1f} ms CPU in chartkit, "
+            f"{self.children_cpu * 1000:.1f} ms CPU in subprocesses",
+            "",
+            f"{'Phase':<14}{'Calls':>7}{'Wall ms':>11}{'Self ms':>11}{'CPU ms':>11}",
+        ]
+        for total in self.phase_totals():
+            phase = "(other)" if total["phase"] == COMMAND else total["phase"]
+            lines.append(
+                f"{phase:<14}{total['calls']:>7}{total['wall'] * 1000:>11.1f}"
+                f"{total['self'] * 1000:>11.1f}{total['cpu'] * 1000:>11.1f}"
+            )
+        processes = self.subprocesses()
+        if processes:
+            shown = processes[:top]
+            lines += [
+                "",
+                f"Subprocesses ({len(processes)}, "
+                + (
+                    f"slowest {len(shown)}"
+                    if len(shown) < len(processes)
+                    else "slowest first"
+                )
+                + "):",
+                f"{'Wall ms':>9}  {'Thread':<24}Command",
+            ]
+            for span in shown:
+                command = str(span.args.get("command", span.name))
+                if len(command) > 100:
+                    command = command[:97] + "..."
+                lines.append(
+                    f"{span.wall * 1000:>9.1f}  {span.thread_name[:23]:<24}{command}"
+                )
+        lines.append(
+            "\nSelf and CPU ms exclude nested phases; phases on worker threads "
+            "overlap the main thread's."
+        )
+        return "\n".join(lines) + "\n"
+
+    def trace_events(self) -> Dict[str, Any]:
+        """The spans as Chrome trace events (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": 0,
+                "args": {"name": self.command},
+            }
+        ]
+        threads = {span.thread_id: span.thread_name for span in self.spans}
+        for thread_id, thread_name in sorted(threads.items()):
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": thread_id,
+                    "args": {"name": thread_name},
+                }
+            )
+        for span in sorted(self.spans, key=lambda s: s.start):
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.phase,
+                    "ph": "X",
+                    "ts": round((span.start - self.origin) * 1e6, 3),
+                    "dur": round(span.wall * 1e6, 3),
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": {**span.args, "cpu_ms": round(span.cpu * 1000, 3)},
+                }
+            )
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "command": self.command,
+                "cpu_ms": round(self.cpu * 1000, 3),
+                "children_cpu_ms": round(self.children_cpu * 1000, 3),
+            },
+        }
+
+    def write_trace(self, path: Path):
+        path.write_text(json.dumps(self.trace_events()) + "\n", encoding="utf-8")
+
+    def write_stats(self, path: Path):
+        if self.profiler is not None:
+            self.profiler.dump_stats(str(path))
+
+
+_profile: Optional[Profile] = None
+
+
+def start(command: str, cprofile: bool = False) -> Profile:
+    """Start recording spans (and a cProfile of this thread, if asked)."""
+    global _profile
+    _profile = Profile(command, cprofile)
+    return _profile
+
+
+def stop() -> Optional[Profile]:
+    """Stop recording and return what was recorded."""
+    global _profile
+    profile, _profile = _profile, None
+    if profile is not None:
+        profile.finish()
+    return profile
+
+
+def phase(phase_name: str, name: Optional[str] = None, **args) -> ContextManager:
+    """Time the enclosed code as a span of the phase."""
+    if _profile is None:
+        return NO_SPAN
+    return _profile.span(phase_name, name or phase_name, args)
+
+
+def subprocess_phase(command: Sequence[str]) -> ContextManager:
+    """Time an external command; spans are named after the program and its
+    first argument, e.g. "helm unittest"."""
+    if _profile is None:
+        return NO_SPAN
+    words = [os.path.basename(str(command[0])), *map(str, command[1:2])]
+    return _profile.span(
+        "subprocess", " ".join(words), {"command": " ".join(map(str, command))}
+    )
+
+
+def profiled(phase_name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator timing every call of a function as a span of the phase."""
+
+    def decorator(f: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if _profile is None:
+                return f(*args, **kwargs)
+            with _profile.span(phase_name, f.__qualname__, {}):
+                return f(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def children_cpu() -> float:
+    """CPU seconds used by waited-for child processes."""
+    times = os.times()
+    return times.children_user + times.children_system
@@ -0,0 +1,463 @@
+"""Offline rendering of chart dependency diagrams: a layered (Sugiyama)
+layout drawn as SVG, and Graphviz DOT export."""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+# Estimated glyph size of the SVG font, for sizing boxes without measuring.
+CHAR_WIDTH = 7.2
+LINE_HEIGHT = 16
+PADDING_X = 12
+PADDING_Y = 8
+# Gaps between boxes in a layer and between layers.
+NODE_GAP = 24
+LAYER_GAP = 56
+MARGIN = 16
+# Sweeps of crossing reduction; it stops earlier once a sweep doesn't help.
+ORDER_ITERATIONS = 12
+# Rounds of moving nodes towards their neighbours.
+POSITION_ITERATIONS = 4
+# Most dummy nodes routing long edges through the layers they cross. In large
+# monorepos edges to shared libraries span dozens of layers; the longest
+# edges beyond this budget are drawn as direct curves instead.
+DUMMY_BUDGET = 5000
+
+
+@dataclass
+class DiagramNode:
+    """A chart to draw: its name, and the lines of its label."""
+
+    name: str
+    label: List[str]
+    library: bool = False
+    # a dependency outside of the diagram's charts
+    external: bool = False
+
+
+@dataclass
+class LayoutNode:
+    id: str
+    layer: int
+    # None for the points where a long edge crosses a layer
+    node: Optional[DiagramNode] = None
+    order: int = 0
+    x: float = 0.0  # center
+    y: float = 0.0  # top
+    width: float = 0.0
+    height: float = 0.0
+
+    @property
+    def dummy(self) -> bool:
+        return self.node is None
+
+
+@dataclass
+class LayoutEdge:
+    parent: str
+    child: str
+    # from the parent's bottom to the child's top, through the dummy nodes
+    points: List[Tuple[float, float]] = field(default_factory=list)
+
+
+@dataclass
+class Layout:
+    nodes: Dict[str, LayoutNode]
+    layers: List[List[LayoutNode]]
+    edges: List[LayoutEdge]
+    width: float
+    height: float
+    crossings: int
+
+
+def remove_cycles(
+    names: List[str], children: Dict[str, List[str]]
+) -> Set[Tuple[str, str]]:
+    """Edges closing a cycle, found by depth-first search; the layout draws
+    them reversed so that the graph it layers is acyclic."""
+    state: Dict[str, int] = {}  # 1: on the DFS stack, 2: done
+    back: Set[Tuple[str, str]] = set()
+    for start in names:
+        if start in state:
+            continue
+        state[start] = 1
+        stack = [(start, iter(children.get(start, ())))]
+        while stack:
+            node, pending = stack[-1]
+            child = next(pending, None)
+            if child is None:
+                state[node] = 2
+                stack.pop()
+            elif state.get(child) == 1:
+                back.add((node, child))
+            elif child not in state:
+                state[child] = 1
+                stack.append((child, iter(children.get(child, ()))))
+    return back
+
+
+def assign_layers(names: List[str], children: Dict[str, List[str]]) -> Dict[str, int]:
+    """Longest path layering: charts nothing depends on are on top, and every
+    chart is one layer below its lowest dependent."""
+    indegree = {name: 0 for name in names}
+    for name in names:
+        for child in children.get(name, ()):
+            indegree[child] += 1
+    layer = {name: 0 for name in names}
+    frontier = [name for name in names if indegree[name] == 0]
+    while frontier:
+        name = frontier.pop()
+        for child in children.get(name, ()):
+            layer[child] = max(layer[child], layer[name] + 1)
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                frontier.append(child)
+    return layer
+
+
+def count_crossings(
+    upper: List[LayoutNode], lower: List[LayoutNode], down: Dict[str, List[LayoutNode]]
+) -> int:
+    """Crossings between the edges of two adjacent layers, counted as the
+    inversions of the edges' lower ends when sorted by their upper ends,
+    with a Fenwick tree over the lower layer's positions."""
+    tree = [0] * (len(lower) + 1)
+    crossings = seen = 0
+    for node in upper:
+        children = down.get(node.id, ())
+        # edges drawn directly to a lower layer are not counted
+        positions = sorted(c.order for c in children if c.layer == node.layer + 1)
+        for position in positions:
+            # edges seen so far (further left above) ending right of this one
+            i, before = position + 1, 0
+            while i > 0:
+                before += tree[i]
+                i -= i & -i
+            crossings += seen - before
+            i = position + 1
+            while i <= len(lower):
+                tree[i] += 1
+                i += i & -i
+            seen += 1
+    return crossings
+
+
+def order_layers(
+    layers: List[List[LayoutNode]],
+    up: Dict[str, List[LayoutNode]],
+    down: Dict[str, List[LayoutNode]],
+) -> int:
+    """Reduce edge crossings with barycenter sweeps, alternately down and up
+    the layers; keeps the best ordering seen and returns its crossings."""
+
+    def total() -> int:
+        return sum(
+            count_crossings(layers[i], layers[i + 1], down)
+            for i in range(len(layers) - 1)
+        )
+
+    def renumber(layer: List[LayoutNode]):
+        for order, node in enumerate(layer):
+            node.order = order
+
+    def sweep(indices: Iterable[int], neighbours: Dict[str, List[LayoutNode]]):
+        for i in indices:
+            layer = layers[i]
+
+            def barycenter(node: LayoutNode) -> float:
+                adjacent = neighbours.get(node.id)
+                if not adjacent:
+                    return node.order
+                return sum(n.order for n in adjacent) / len(adjacent)
+
+            layer.sort(key=barycenter)
+            renumber(layer)
+
+    best = total()
+    best_orders = [list(layer) for layer in layers]
+    for iteration in range(ORDER_ITERATIONS):
+        if best == 0:
+            break
+        if iteration % 2 == 0:
+            sweep(range(1, len(layers)), up)
+        else:
+            sweep(range(len(layers) - 2, -1, -1), down)
+        crossings = total()
+        if crossings < best:
+            best = crossings
+            best_orders = [list(layer) for layer in layers]
+        elif iteration % 2 == 1:
+            # a full round without improvement
+            break
+    for i, layer in enumerate(best_orders):
+        layers[i] = layer
+        renumber(layer)
+    return best
+
+
+def place_nodes(
+    layers: List[List[LayoutNode]],
+    up: Dict[str, List[LayoutNode]],
+    down: Dict[str, List[LayoutNode]],
+):
+    """Assign x coordinates in layer order, moving every node towards the
+    mean of its neighbours while keeping NODE_GAP between boxes."""
+
+    def separation(left: LayoutNode, right: LayoutNode) -> float:
+        return (left.width + right.width) / 2 + NODE_GAP
+
+    for layer in layers:
+        x = 0.0
+        for i, node in enumerate(layer):
+            if i:
+                x += separation(layer[i - 1], node)
+            node.x = x
+
+    def align(layer: List[LayoutNode], neighbours: Dict[str, List[LayoutNode]]):
+        desired = [
+            sum(n.x for n in neighbours[node.id]) / len(neighbours[node.id])
+            if neighbours.get(node.id)
+            else node.x
+            for node in layer
+        ]
+        # the closest placements to desired pushing right, and pushing left;
+        # their mean keeps the gaps and doesn't drift either way
+        rightwards = list(desired)
+        for i in range(1, len(layer)):
+            rightwards[i] = max(
+                rightwards[i], rightwards[i - 1] + separation(layer[i - 1], layer[i])
+            )
+        leftwards = list(desired)
+        for i in range(len(layer) - 2, -1, -1):
+            leftwards[i] = min(
+                leftwards[i], leftwards[i + 1] - separation(layer[i], layer[i + 1])
+            )
+        for node, right, left in zip(layer, rightwards, leftwards):
+            node.x = (right + left) / 2
+
+    for _ in range(POSITION_ITERATIONS):
+        for layer in layers[1:]:
+            align(layer, up)
+        for layer in reversed(layers[:-1]):
+            align(layer, down)
+
+
+def layered_layout(
+    nodes: List[DiagramNode], edges: Iterable[Tuple[str, str]]
+) -> Layout:
+    """Lay out a dependency graph top-down, dependents above dependencies.
+
+    The steps of Sugiyama's method: edges closing cycles are reversed, charts
+    are assigned to layers by longest path, edges spanning several layers get
+    a dummy node in every layer they cross, crossings are reduced by
+    barycenter ordering, and nodes are moved towards their neighbours.
+    """
+    by_name = {node.name: node for node in nodes}
+    edge_list = sorted({(p, c) for p, c in edges if p != c})
+    for name in sorted({n for edge in edge_list for n in edge} - by_name.keys()):
+        # e.g. dependencies outside of the scanned charts
+        by_name[name] = DiagramNode(name, [name], external=True)
+    names = sorted(by_name)
+
+    children: Dict[str, List[str]] = {}
+    for parent, child in edge_list:
+        children.setdefault(parent, []).append(child)
+    reversed_edges = remove_cycles(names, children)
+    acyclic: Dict[str, List[str]] = {}
+    for parent, child in edge_list:
+        if (parent, child) in reversed_edges:
+            parent, child = child, parent
+        acyclic.setdefault(parent, []).append(child)
+    layer_of = assign_layers(names, acyclic)
+
+    layout_nodes: Dict[str, LayoutNode] = {}
+    for name in names:
+        node = by_name[name]
+        layout_nodes[name] = LayoutNode(
+            id=name,
+            layer=layer_of[name],
+            node=node,
+            width=max(len(line) for line in node.label) * CHAR_WIDTH + 2 * PADDING_X,
+            height=len(node.label) * LINE_HEIGHT + 2 * PADDING_Y,
+        )
+
+    up: Dict[str, List[LayoutNode]] = {}
+    down: Dict[str, List[LayoutNode]] = {}
+    oriented = [
+        ((child, parent) if (parent, child) in reversed_edges else (parent, child))
+        for parent, child in edge_list
+    ]
+    # route the shortest edges through dummy nodes, as many as the budget allows
+    spans = Counter(layer_of[bottom] - layer_of[top] for top, bottom in oriented)
+    max_span, dummies = 1, 0
+    for span in sorted(spans):
+        dummies += spans[span] * (span - 1)
+        if dummies > DUMMY_BUDGET:
+            break
+        max_span = span
+    # per original edge, the ids of its points from top to bottom
+    routes: List[Tuple[str, str, List[str]]] = []
+    for (parent, child), (top, bottom) in zip(edge_list, oriented):
+        route = [top]
+        if layer_of[bottom] - layer_of[top] <= max_span:
+            for layer in range(layer_of[top] + 1, layer_of[bottom]):
+                dummy = LayoutNode(id=f"{top}->{bottom}#{layer}", layer=layer)
+                layout_nodes[dummy.id] = dummy
+                route.append(dummy.id)
+        route.append(bottom)
+        for upper, lower in zip(route, route[1:]):
+            down.setdefault(upper, []).append(layout_nodes[lower])
+            up.setdefault(lower, []).append(layout_nodes[upper])
+        if (parent, child) in reversed_edges:
+            route.reverse()
+        routes.append((parent, child, route))
+
+    layers: List[List[LayoutNode]] = [
+        [] for _ in range(max(layer_of.values(), default=-1) + 1)
+    ]
+    # initial order: depth-first from the top, so related charts start close
+    visited: Set[str] = set()
+    for name in names:
+        if layer_of[name] != 0:
+            continue
+        stack = [layout_nodes[name]]
+        while stack:
+            node = stack.pop()
+            if node.id in visited:
+                continue
+            visited.add(node.id)
+            node.order = len(layers[node.layer])
+            layers[node.layer].append(node)
+            stack.extend(reversed(down.get(node.id, [])))
+    for node in layout_nodes.values():
+        if node.id not in visited:
+            node.order = len(layers[node.layer])
+            layers[node.layer].append(node)
+
+    crossings = order_layers(layers, up, down)
+    place_nodes(layers, up, down)
+
+    left = min((n.x - n.width / 2 for n in layout_nodes.values()), default=0.0)
+    right = max((n.x + n.width / 2 for n in layout_nodes.values()), default=0.0)
+    y = float(MARGIN)
+    for layer in layers:
+        height = max((n.height for n in layer), default=0.0)
+        for node in layer:
+            node.x += MARGIN - left
+            node.y = y + (height - node.height) / 2
+        y += height + LAYER_GAP
+
+    edges_out: List[LayoutEdge] = []
+    for parent, child, route in routes:
+        points = [layout_nodes[route[0]], *map(layout_nodes.get, route[1:-1])]
+        start, end = layout_nodes[route[0]], layout_nodes[route[-1]]
+        downwards = start.layer < end.layer
+        path = [(start.x, start.y + start.height if downwards else start.y)]
+        path += [(n.x, n.y) for n in points[1:] if n is not None]
+        path.append((end.x, end.y if downwards else end.y + end.height))
+        edges_out.append(LayoutEdge(parent, child, path))
+
+    return Layout(
+        nodes=layout_nodes,
+        layers=layers,
+        edges=edges_out,
+        width=right - left + 2 * MARGIN,
+        height=max(y - LAYER_GAP + MARGIN, 2 * MARGIN),
+        crossings=crossings,
+    )
+
+
+SVG_STYLE = """
+    .chart rect { fill: #eef3fb; stroke: #4a6fa5; stroke-width: 1.2; }
+    .chart.library rect { fill: #f4f0fa; stroke: #7a5ea8; }
+    .chart.external rect { fill: #f5f5f5; stroke: #999; stroke-dasharray: 4 2; }
+    .chart text { font-family: Helvetica, Arial, sans-serif; font-size: 12px;
+      fill: #1d2733; text-anchor: middle; }
+    .chart text.attr { fill: #5a6675; font-size: 11px; }
+    .edge { fill: none; stroke: #8894a5; stroke-width: 1.1; }
+"""
+
+
+def render_svg(layout: Layout) -> str:
+    """Draw a layout as a standalone SVG document."""
+    width, height = f"{layout.width:.0f}", f"{layout.height:.0f}"
+    parts = [
+        '<svg xmlns="http://www.w3.org/2000/svg" '
+        f'width="{width}" height="{height}" viewBox="0 0 {width} {height}">',
+        f"<style>{SVG_STYLE}</style>",
+        "<defs>"
+        '<marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" '
+        'markerWidth="7" markerHeight="7" orient="auto-start-reverse">'
+        '<path d="M0,0 L10,5 L0,10 z" fill="#8894a5"/></marker>'
+        "</defs>",
+    ]
+    for edge in layout.edges:
+        if len(edge.points) == 2:
+            # a curve leaving and entering the boxes vertically
+            (x1, y1), (x2, y2) = edge.points
+            bend = (y2 - y1) / 2
+            d = (
+                f"M{x1:.1f},{y1:.1f} C{x1:.1f},{y1 + bend:.1f} "
+                f"{x2:.1f},{y2 - bend:.1f} {x2:.1f},{y2:.1f}"
+            )
+        else:
+            d = " ".join(
+                f"{'M' if i == 0 else 'L'}{x:.1f},{y:.1f}"
+                for i, (x, y) in enumerate(edge.points)
+            )
+        parts.append(
+            f'<path class="edge" d="{d}" marker-end="url(#arrow)">'
+            f"<title>{escape(edge.parent)} depends on {escape(edge.child)}</title>"
+            "</path>"
+        )
+    for node in layout.nodes.values():
+        if node.node is None:
+            continue
+        classes = "chart"
+        if node.node.library:
+            classes += " library"
+        if node.node.external:
+            classes += " external"
+        parts.append(
+            f"<g class={quoteattr(classes)}>"
+            f"<title>{escape(' '.join(node.node.label))}</title>"
+            f'<rect x="{node.x - node.width / 2:.1f}" y="{node.y:.1f}" '
+            f'width="{node.width:.1f}" height="{node.height:.1f}" rx="4"/>'
+        )
+        for i, line in enumerate(node.node.label):
+            baseline = node.y + PADDING_Y + (i + 1) * LINE_HEIGHT - 4
+            css = ' class="attr"' if i else ""
+            parts.append(
+                f'<text{css} x="{node.x:.1f}" y="{baseline:.1f}">{escape(line)}</text>'
+            )
+        parts.append("</g>")
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
+
+
+def dot_id(name: str) -> str:
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def render_dot(nodes: List[DiagramNode], edges: Iterable[Tuple[str, str]]) -> str:
+    """A Graphviz digraph of the charts, dependents above dependencies."""
+    lines = [
+        "digraph charts {",
+        "  rankdir=TB;",
+        '  node [shape=box, style="rounded,filled", fillcolor="#eef3fb", '
+        'fontname="Helvetica", fontsize=12];',
+        '  edge [color="#8894a5"];',
+    ]
+    for node in sorted(nodes, key=lambda n: n.name.lower()):
+        label = "\\n".join(
+            line.replace("\\", "\\\\").replace('"', '\\"') for line in node.label
+        )
+        attrs = f'label="{label}"'
+        if node.library:
+            attrs += ', fillcolor="#f4f0fa"'
+        lines.append(f"  {dot_id(node.name)} [{attrs}];")
+    for parent, child in sorted(set(edges)):
+        lines.append(f"  {dot_id(parent)} -> {dot_id(child)};")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
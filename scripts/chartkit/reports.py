@@ -0,0 +1,250 @@
+"""Machine-readable unit test reports (JUnit XML and JSON), built from the
+JUnit output of helm unittest (-t JUnit -o FILE)."""
+
+import json
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+import click
+
+from .files import read_yaml
+
+if TYPE_CHECKING:
+    from .testrunner import SuiteResult, TestSuite
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+DOCUMENT_SEPARATOR = re.compile(r"^---\s*$", re.MULTILINE)
+
+
+@dataclass
+class TestCaseResult:
+    suite_name: str  # the helm-unittest suite (its suite: field)
+    name: str  # the test's it: description
+    passed: bool
+    duration: float
+    failure: str = ""
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "suite_name": self.suite_name,
+            "name": self.name,
+            "passed": self.passed,
+            "duration": self.duration,
+        } | ({"failure": self.failure} if self.failure else {})
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> "TestCaseResult":
+        return TestCaseResult(
+            suite_name=data.get("suite_name", ""),
+            name=data.get("name", ""),
+            passed=data.get("passed", True),
+            duration=data.get("duration", 0.0),
+            failure=data.get("failure", ""),
+        )
+
+
+def count_documents(path: Path) -> int:
+    """Number of suites in a suite file: helm-unittest runs every non-empty
+    YAML document as a suite of its own."""
+    try:
+        text = path.read_text(encoding="utf-8")
+    except OSError:
+        return 1
+    documents = [
+        doc
+        for doc in DOCUMENT_SEPARATOR.split(text)
+        if any(
+            line.strip() and not line.lstrip().startswith("#")
+            for line in doc.splitlines()
+        )
+    ]
+    return max(len(documents), 1)
+
+
+def parse_junit(path: Path) -> List[Tuple[str, List[TestCaseResult]]]:
+    """Read the suites of a helm unittest JUnit report, in report order, as
+    (suite name, test cases) pairs. Returns nothing if the report is missing
+    or unreadable, e.g. when helm failed before writing it."""
+    try:
+        root = ET.parse(path).getroot()
+    except (OSError, ET.ParseError):
+        return []
+    suites: List[Tuple[str, List[TestCaseResult]]] = []
+    for testsuite in root.iter("testsuite"):
+        name = testsuite.get("name", "")
+        cases: List[TestCaseResult] = []
+        for testcase in testsuite.iter("testcase"):
+            problem = testcase.find("failure")
+            if problem is None:
+                problem = testcase.find("error")
+            failure = ""
+            if problem is not None:
+                failure = (problem.text or problem.get("message") or "failed").strip()
+            cases.append(
+                TestCaseResult(
+                    suite_name=name,
+                    name=testcase.get("name", ""),
+                    passed=problem is None,
+                    duration=float(testcase.get("time") or 0.0),
+                    failure=failure,
+                )
+            )
+        suites.append((name, cases))
+    return suites
+
+
+def test_templates(path: Path) -> Dict[Tuple[str, str], List[str]]:
+    """Templates each test of a suite file renders, by (suite name, test name):
+    the test's own template(s), or else the suite's templates: list."""
+    try:
+        docs = list(read_yaml().load_all(path.read_text(encoding="utf-8")))
+    except Exception:
+        return {}
+    templates: Dict[Tuple[str, str], List[str]] = {}
+    for suite in docs:
+        if not isinstance(suite, dict):
+            continue
+        suite_templates = [str(t) for t in suite.get("templates") or []]
+        for test in suite.get("tests") or []:
+            if not isinstance(test, dict):
+                continue
+            own = [str(t) for t in test.get("templates") or []]
+            if test.get("template"):
+                own.append(str(test["template"]))
+            key = (str(suite.get("suite", "")), str(test.get("it", "")))
+            templates[key] = own or suite_templates
+    return templates
+
+
+def write_json_report(
+    path: Path,
+    results: List["SuiteResult"],
+    cancelled: List["TestSuite"],
+    duration: float,
+):
+    """Write per-suite and per-test results and durations as JSON."""
+    suites: List[Dict[str, Any]] = []
+    for result in sorted(results, key=lambda r: r.suite.key):
+        templates = test_templates(result.suite.path)
+        tests = [
+            test.to_json()
+            | {"templates": templates.get((test.suite_name, test.name), [])}
+            for test in result.tests
+        ]
+        suites.append(
+            {
+                "suite": result.suite.key,
+                "chart": result.suite.chart.name,
+                "names": sorted({t.suite_name for t in result.tests}),
+                "passed": result.passed,
+                "cached": result.cached,
+                "duration": result.duration,
+                "batch_size": result.batch_size,
+                "command": result.command,
+                "tests": tests,
+            }
+            | ({} if result.passed else {"output": ANSI_ESCAPE.sub("", result.output)})
+        )
+    data = {
+        "passed": all(r.passed for r in results) and not cancelled,
+        "duration": duration,
+        "suites": suites,
+        "cancelled": sorted(s.key for s in cancelled),
+    }
+    _write(path, json.dumps(data, indent=2) + "\n")
+
+
+def write_junit_xml(
+    path: Path,
+    results: List["SuiteResult"],
+    cancelled: List["TestSuite"],
+    duration: float,
+):
+    """Write the results as a JUnit XML report, one testsuite per suite file.
+
+    Suites without structured results (helm failed before reporting them)
+    get a single failed test case with the helm output. Cancelled suites
+    are reported as skipped.
+    """
+    root = ET.Element("testsuites", name="chartkit unittest", time=f"{duration:.3f}")
+    total = failures = skipped = 0
+    for result in sorted(results, key=lambda r: r.suite.key):
+        tests = result.tests or [
+            TestCaseResult(
+                suite_name=result.suite.key,
+                name=result.suite.path.name,
+                passed=result.passed,
+                duration=result.duration,
+                failure="" if result.passed else ANSI_ESCAPE.sub("", result.output),
+            )
+        ]
+        suite_failures = sum(1 for t in tests if not t.passed)
+        testsuite = ET.SubElement(
+            root,
+            "testsuite",
+            name=", ".join(sorted({t.suite_name for t in tests})),
+            file=result.suite.key,
+            tests=str(len(tests)),
+            failures=str(suite_failures),
+            errors="0",
+            skipped="0",
+            time=f"{result.duration:.3f}",
+        )
+        properties = ET.SubElement(testsuite, "properties")
+        for name, value in [
+            ("chart", result.suite.chart.name),
+            ("cached", str(result.cached).lower()),
+            ("batch_size", str(result.batch_size)),
+            ("command", " ".join(result.command)),
+        ]:
+            ET.SubElement(properties, "property", name=name, value=value)
+        for test in tests:
+            testcase = ET.SubElement(
+                testsuite,
+                "testcase",
+                classname=test.suite_name,
+                name=test.name,
+                file=result.suite.key,
+                time=f"{test.duration:.3f}",
+            )
+            if not test.passed:
+                failure = ET.SubElement(testcase, "failure", message="failed")
+                failure.text = test.failure
+        total += len(tests)
+        failures += suite_failures
+
+    for suite in sorted(cancelled, key=lambda s: s.key):
+        testsuite = ET.SubElement(
+            root,
+            "testsuite",
+            name=suite.key,
+            file=suite.key,
+            tests="1",
+            failures="0",
+            errors="0",
+            skipped="1",
+            time="0.000",
+        )
+        testcase = ET.SubElement(
+            testsuite, "testcase", classname=suite.key, name=suite.path.name
+        )
+        ET.SubElement(testcase, "skipped", message="cancelled by --fail-fast")
+        total += 1
+        skipped += 1
+
+    root.set("tests", str(total))
+    root.set("failures", str(failures))
+    root.set("skipped", str(skipped))
+    ET.indent(root)
+    _write(path, ET.tostring(root, encoding="unicode", xml_declaration=True) + "\n")
+
+
+def _write(path: Path, content: str):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+    except OSError as e:
+        raise click.ClickException(f"Failed to write report {path}: {e}")
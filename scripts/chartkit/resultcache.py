@@ -0,0 +1,134 @@
+"""Content-addressed cache of passing unit test suite results."""
+
+import hashlib
+import json
+import os
+import subprocess
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+import click
+
+from .cache import cache_dir, prune_entries, write_json_atomic
+from .profiling import subprocess_phase
+
+if TYPE_CHECKING:
+    from .charts import ChartInfo
+    from .testrunner import TestSuite
+
+RESULT_CACHE_VERSION = 1
+
+
+def hash_tree(root: Path, skip: Optional[Callable[[str], bool]] = None) -> str:
+    """Hash every file below root (paths and contents), in a stable order.
+    skip(relative_path) may return True to leave a file out."""
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = Path(dirpath) / name
+            rel_path = path.relative_to(root).as_posix()
+            if skip and skip(rel_path):
+                continue
+            digest.update(rel_path.encode() + b"\0")
+            digest.update(path.read_bytes() + b"\0")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Passing suite results keyed by a hash of everything the suite reads.
+
+    The key covers the suite file and its snapshot, every other file in the
+    chart (templates, values, schema, Chart.yaml/Chart.lock, test values and
+    the vendored subcharts in charts/), and the helm and helm-unittest
+    versions. Other suites of the chart and their snapshots are left out, so
+    editing one suite does not invalidate the rest. Entries live in
+    .git/chartkit-cache/results, one JSON file per key.
+    """
+
+    path: Path
+    chart_digests: Dict[Path, str]
+    _toolchain: Optional[str]
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or cache_dir() / "results"
+        self.chart_digests = {}
+        self._toolchain = None
+
+    def toolchain(self) -> str:
+        """Version of helm and its plugins, part of every key."""
+        if self._toolchain is None:
+            versions = []
+            for cmd in (["helm", "version", "--short"], ["helm", "plugin", "list"]):
+                try:
+                    with subprocess_phase(cmd):
+                        result = subprocess.run(cmd, capture_output=True, text=True)
+                    versions.append(result.stdout.strip())
+                except OSError:
+                    versions.append("unknown")
+            self._toolchain = "\n".join(versions)
+        return self._toolchain
+
+    def chart_digest(self, chart: "ChartInfo") -> str:
+        if chart.path not in self.chart_digests:
+
+            def skip(rel_path: str) -> bool:
+                return rel_path.startswith("tests/__snapshot__/") or (
+                    rel_path.startswith("tests/") and rel_path.endswith("_test.yaml")
+                )
+
+            self.chart_digests[chart.path] = hash_tree(chart.path, skip)
+        return self.chart_digests[chart.path]
+
+    def key(self, suite: "TestSuite") -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{RESULT_CACHE_VERSION}\0{self.toolchain()}\0".encode())
+        digest.update(self.chart_digest(suite.chart).encode())
+        digest.update(suite.path.read_bytes() + b"\0")
+        snapshot = suite.path.parent / "__snapshot__" / f"{suite.path.name}.snap"
+        if snapshot.is_file():
+            digest.update(snapshot.read_bytes())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached passing result for a suite key. Hits are touched so
+        pruning evicts the least recently used entries first."""
+        entry = self.path / f"{key}.json"
+        try:
+            data = json.loads(entry.read_text(encoding="utf-8"))
+            os.utime(entry)
+        except (OSError, ValueError):
+            return None
+        return data
+
+    def put(
+        self,
+        key: str,
+        suite: "TestSuite",
+        output: str,
+        duration: float,
+        tests: Optional[List[Dict[str, Any]]] = None,
+        command: Optional[List[str]] = None,
+    ):
+        """Store a passing result, its test cases (if collected) and the helm
+        command that ran it under the key computed before the run."""
+        entry = self.path / f"{key}.json"
+        data = {
+            "suite": suite.key,
+            "output": output,
+            "duration": duration,
+            "tests": tests or [],
+            "command": command or [],
+        }
+        try:
+            write_json_atomic(entry, data)
+        except OSError as e:
+            click.echo(f"WARN: Failed to write result cache {entry}: {e}", err=True)
+
+    def prune(
+        self, max_bytes: Optional[int] = None, max_age: Optional[float] = None
+    ) -> Tuple[int, int]:
+        """Evict entries older than max_age seconds (by last use), then the
+        least recently used ones until the cache fits in max_bytes.
+        Returns the number of entries and bytes removed."""
+        return prune_entries(self.path.glob("*.json"), max_bytes, max_age)
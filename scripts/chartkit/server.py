@@ -0,0 +1,302 @@
+"""chartkit serve: a daemon answering read-only queries from warm chart graphs.
+
+The protocol is JSON-RPC 2.0 over a Unix socket, one request or response
+per line. Each served command (client.SERVED_COMMANDS) is a method taking
+the command line's global options and arguments, the client's working
+directory, git root and GIT_* environment variables, and returning the
+command's exit code and output:
+
+    {"jsonrpc": "2.0", "id": 1, "method": "affected",
+     "params": {"global_args": [], "args": ["--base", "origin/main"],
+                "cwd": "/src/charts", "root": "/src/charts", "env": {}}}
+    {"jsonrpc": "2.0", "id": 1,
+     "result": {"exit_code": 0, "stdout": "mozcloud\\n", "stderr": ""}}
+
+"status" and "shutdown" manage the daemon itself.
+"""
+
+import contextlib
+import io
+import json
+import os
+import signal
+import socketserver
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+
+from .charts import ChartGraph
+from .client import SERVED_COMMANDS
+from .git import git_dir
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+class GraphServer:
+    """Chart graphs kept in memory between requests, one per set of roots.
+
+    Before each query the graph is checked against the directory and
+    Chart.yaml mtimes recorded when it was built (ChartGraph.is_stale). A
+    stale graph is rebuilt through the graph cache, which parses only the
+    charts that changed. Commands run one at a time: they share the
+    process's working directory, standard streams and environment, which
+    gets the client's GIT_* variables (e.g. the temporary index of a
+    pre-commit hook) while its command runs.
+    """
+
+    root: Path
+    graphs: Dict[Tuple[Tuple[str, ...], bool], ChartGraph]
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.graphs = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.last_request = time.monotonic()
+        self.requests = 0
+        self.rebuilds = 0
+
+    def graph(self, roots: List[str], internal_only: bool) -> ChartGraph:
+        key = (tuple(str(Path(r).resolve()) for r in roots), internal_only)
+        graph = self.graphs.get(key)
+        if graph is None or graph.is_stale():
+            graph = ChartGraph(
+                roots=list(key[0]), internal_only=internal_only, use_cache=True
+            )
+            self.graphs[key] = graph
+            self.rebuilds += 1
+        return graph
+
+    def handle(self, request: Any) -> Dict[str, Any]:
+        """Answer a JSON-RPC request."""
+        if not isinstance(request, dict):
+            return error_response(None, INVALID_PARAMS, "Invalid request")
+        request_id = request.get("id")
+        method = request.get("method")
+        params = request.get("params") or {}
+        self.last_request = time.monotonic()
+        try:
+            if method == "status":
+                result = self.status()
+            elif method in SERVED_COMMANDS:
+                result = self.run(str(method), params)
+            else:
+                return error_response(
+                    request_id, METHOD_NOT_FOUND, f"Method not found: {method}"
+                )
+        except ValueError as e:
+            return error_response(request_id, INVALID_PARAMS, str(e))
+        except Exception as e:
+            return error_response(request_id, INTERNAL_ERROR, str(e))
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "root": str(self.root),
+            "uptime": time.time() - self.started,
+            "requests": self.requests,
+            "rebuilds": self.rebuilds,
+            "graphs": [
+                {
+                    "roots": list(roots),
+                    "internal_only": internal_only,
+                    "charts": len(graph.charts),
+                }
+                for (roots, internal_only), graph in self.graphs.items()
+            ],
+        }
+
+    def run(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a served command as the CLI would and capture its output."""
+        if params.get("root") != str(self.root):
+            raise ValueError(f"Not serving {params.get('root')}")
+        cwd = params.get("cwd")
+        if not isinstance(cwd, str) or not os.path.isdir(cwd):
+            raise ValueError(f"Invalid working directory: {cwd}")
+        env = params.get("env") or {}
+        if not isinstance(env, dict) or not all(
+            str(name).startswith("GIT_") for name in env
+        ):
+            raise ValueError("Invalid environment")
+        env = {str(name): str(value) for name, value in env.items()}
+        self.check_repository(env, cwd)
+        argv = [
+            *map(str, params.get("global_args") or []),
+            *method.split(),
+            *map(str, params.get("args") or []),
+        ]
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with (
+            self.lock,
+            contextlib.chdir(cwd),
+            git_environment(env),
+            contextlib.redirect_stdout(stdout),
+            contextlib.redirect_stderr(stderr),
+        ):
+            self.requests += 1
+            exit_code = self.invoke(argv, color=bool(params.get("color")))
+        return {
+            "exit_code": exit_code,
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue(),
+        }
+
+    def check_repository(self, env: Dict[str, str], cwd: str):
+        """Refuse clients whose GIT_DIR or GIT_WORK_TREE name another
+        repository than the one served; they run the command themselves."""
+        served = {"GIT_DIR": git_dir(), "GIT_WORK_TREE": self.root}
+        for name, path in served.items():
+            if name in env and (Path(cwd) / env[name]).resolve() != path.resolve():
+                raise ValueError(f"Not serving {name}={env[name]}")
+
+    def invoke(self, argv: List[str], color: bool) -> int:
+        from .cli import cli
+
+        try:
+            cli.main(
+                args=argv,
+                prog_name="chartkit",
+                standalone_mode=False,
+                obj=self,
+                color=color,
+            )
+        except click.ClickException as e:
+            e.show()
+            return e.exit_code
+        except click.exceptions.Exit as e:
+            return e.exit_code
+        except click.Abort:
+            click.echo("Aborted!", err=True)
+            return 1
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                return e.code or 0
+            click.echo(e.code, err=True)
+            return 1
+        return 0
+
+
+@contextlib.contextmanager
+def git_environment(env: Dict[str, str]):
+    """Replace the GIT_* variables of this process with env for the duration,
+    so git commands run by a served command see the client's."""
+    saved = {
+        name: value for name, value in os.environ.items() if name.startswith("GIT_")
+    }
+    for name in saved:
+        del os.environ[name]
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        for name in [name for name in os.environ if name.startswith("GIT_")]:
+            del os.environ[name]
+        os.environ.update(saved)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    server: "DaemonSocketServer"
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                response = error_response(None, PARSE_ERROR, "Parse error")
+            else:
+                if isinstance(request, dict) and request.get("method") == "shutdown":
+                    response = {"jsonrpc": "2.0", "id": request.get("id"), "result": {}}
+                    self.write(response)
+                    self.server.stop()
+                    return
+                response = self.server.graph_server.handle(request)
+            self.write(response)
+
+    def write(self, response: Dict[str, Any]):
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class DaemonSocketServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    graph_server: GraphServer
+
+    def stop(self):
+        # shutdown() waits for serve_forever, so it can't run on its thread
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+
+def error_response(request_id: Any, code: int, message: str) -> Dict[str, Any]:
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "error": {"code": code, "message": message},
+    }
+
+
+def is_running(path: Path) -> bool:
+    """Whether a daemon accepts connections on the socket."""
+    from .client import call
+
+    try:
+        call(path, "status")
+        return True
+    except Exception:
+        return False
+
+
+def serve(path: Path, root: Path, idle_timeout: Optional[float] = None):
+    """Run the daemon in the foreground until it is stopped, or has not
+    received a request for idle_timeout seconds."""
+    from .git import get_repo
+
+    if is_running(path):
+        raise click.ClickException(f"chartkit serve is already running on {path}.")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # a socket left behind by a daemon that was killed
+    path.unlink(missing_ok=True)
+
+    graph_server = GraphServer(root)
+    # warm up the default graph (the CLI's roots and options) and git state
+    graph_server.graph([root.as_posix()], False)
+    get_repo()
+
+    # only the user may connect
+    umask = os.umask(0o177)
+    try:
+        server = DaemonSocketServer(str(path), RequestHandler)
+    finally:
+        os.umask(umask)
+    server.graph_server = graph_server
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    if idle_timeout is not None:
+        threading.Thread(
+            target=stop_when_idle, args=(server, idle_timeout), daemon=True
+        ).start()
+
+    click.echo(f"Serving {root} on {path}", err=True)
+    try:
+        server.serve_forever(poll_interval=0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
+    click.echo("chartkit serve stopped.", err=True)
+
+
+def stop_when_idle(server: DaemonSocketServer, idle_timeout: float):
+    while True:
+        idle = time.monotonic() - server.graph_server.last_request
+        if idle >= idle_timeout:
+            server.stop()
+            return
+        time.sleep(min(idle_timeout - idle, 1.0) + 0.01)
@@ -0,0 +1,237 @@
+"""Synthetic chart monorepos, for benchmarking chartkit at scale offline."""
+
+import os
+import random
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Apps depend on apps among this many charts generated before them, which
+# makes dependency chains a few dozen levels deep rather than logarithmic.
+DEPENDENCY_WINDOW = 100
+# Charts per team directory.
+TEAM_SIZE = 50
+
+
+@dataclass
+class MonorepoSpec:
+    """Shape of a generated monorepo. Every chart counts towards charts:
+    hubs (library charts many charts depend on), one chain of chain_depth
+    charts, four charts per diamond, deprecated charts and, for the rest,
+    apps with up to fan_out dependencies each."""
+
+    charts: int = 2000
+    fan_out: int = 4
+    hubs: int = 5
+    chain_depth: int = 50
+    diamonds: int = 50
+    # fraction of the charts that are deprecated; half of them are in
+    # deprecated/ directories, half are marked deprecated in Chart.yaml
+    deprecated: float = 0.05
+    # fraction of the charts depending on a chart from a remote repository
+    external: float = 0.1
+    seed: int = 0
+
+    def to_json(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class SyntheticChart:
+    name: str
+    # directory relative to the monorepo root
+    directory: str
+    type: str
+    version: str
+    dependencies: List[str] = field(default_factory=list)
+    external: bool = False
+    deprecated: bool = False
+
+
+@dataclass
+class Monorepo:
+    root: Path
+    spec: MonorepoSpec
+    charts: Dict[str, SyntheticChart]
+    hubs: List[str]
+    # chain[0] depends on chain[1], and so on
+    chain: List[str]
+    # the top chart of every diamond
+    diamonds: List[str]
+    apps: List[str]
+
+    def path(self, name: str) -> Path:
+        return self.root / self.charts[name].directory
+
+
+def plan_monorepo(spec: MonorepoSpec) -> Dict[str, Any]:
+    """Decide the charts and their dependencies; deterministic for a seed."""
+    rng = random.Random(spec.seed)
+    deprecated = int(spec.charts * spec.deprecated)
+    apps = spec.charts - spec.hubs - spec.chain_depth - 4 * spec.diamonds - deprecated
+    if spec.hubs < 1 or apps < 1:
+        raise ValueError(
+            f"{spec.charts} charts are too few for {spec.hubs} hubs, a chain of "
+            f"{spec.chain_depth}, {spec.diamonds} diamonds and {deprecated} "
+            "deprecated charts; at least one hub and one app are needed."
+        )
+
+    def version() -> str:
+        return f"{rng.randint(0, 3)}.{rng.randint(0, 20)}.{rng.randint(0, 50)}"
+
+    charts: Dict[str, SyntheticChart] = {}
+
+    def add(name: str, directory: str, chart_type: str = "application", **kwargs):
+        charts[name] = SyntheticChart(name, directory, chart_type, version(), **kwargs)
+        return name
+
+    # hubs: the first is used by the other hubs, like a labels library
+    hubs = [
+        add(f"lib-{i:03d}", f"libraries/lib-{i:03d}", "library")
+        for i in range(spec.hubs)
+    ]
+    for hub in hubs[1:]:
+        charts[hub].dependencies.append(hubs[0])
+
+    chain = [
+        add(f"chain-{i:03d}", f"chains/chain-{i:03d}") for i in range(spec.chain_depth)
+    ]
+    for parent, child in zip(chain, chain[1:]):
+        charts[parent].dependencies.append(child)
+    if chain:
+        charts[chain[-1]].dependencies.append(hubs[0])
+
+    diamonds: List[str] = []
+    for i in range(spec.diamonds):
+        base = f"diamonds/diamond-{i:03d}"
+        top, left, right, bottom = (
+            add(f"diamond-{i:03d}-{part}", f"{base}/{part}")
+            for part in ("top", "left", "right", "bottom")
+        )
+        charts[top].dependencies += [left, right]
+        charts[left].dependencies.append(bottom)
+        charts[right].dependencies.append(bottom)
+        charts[bottom].dependencies.append(rng.choice(hubs))
+        diamonds.append(top)
+
+    app_names: List[str] = []
+    for i in range(apps):
+        name = add(f"app-{i:05d}", f"team-{i // TEAM_SIZE:03d}/app-{i:05d}")
+        dependencies = charts[name].dependencies
+        if rng.random() < 0.8:
+            dependencies.append(rng.choice(hubs))
+        earlier = app_names[-DEPENDENCY_WINDOW:]
+        count = min(rng.randint(0, spec.fan_out), len(earlier))
+        dependencies += rng.sample(earlier, count)
+        charts[name].external = rng.random() < spec.external
+        app_names.append(name)
+    # the chain and the diamonds are used by apps too
+    for top in [*chain[:1], *diamonds]:
+        charts[rng.choice(app_names)].dependencies.append(top)
+
+    for i in range(deprecated):
+        if i % 2:
+            add(
+                f"old-{i:04d}",
+                f"team-{i % max(1, apps // TEAM_SIZE):03d}/old-{i:04d}",
+                dependencies=[rng.choice(hubs)],
+                deprecated=True,
+            )
+        else:
+            # skipped by discovery
+            add(f"retired-{i:04d}", f"deprecated/retired-{i:04d}")
+
+    return {
+        "charts": charts,
+        "hubs": hubs,
+        "chain": chain,
+        "diamonds": diamonds,
+        "apps": app_names,
+    }
+
+
+def chart_yaml(chart: SyntheticChart, charts: Dict[str, SyntheticChart]) -> str:
+    lines = [
+        "apiVersion: v2",
+        f"name: {chart.name}",
+        "description: Synthetic chart for chartkit benchmarks",
+        "",
+        "# application or library",
+        f"type: {chart.type}",
+        f"version: {chart.version}",
+        "appVersion: 1.0.0",
+    ]
+    if chart.deprecated:
+        lines.append("deprecated: true")
+    if chart.dependencies or chart.external:
+        lines.append("")
+        lines.append("dependencies:")
+    for name in chart.dependencies:
+        dependency = charts[name]
+        repository = os.path.relpath(dependency.directory, chart.directory)
+        lines += [
+            f"  - name: {name}",
+            f"    version: {dependency.version}",
+            f"    repository: file://{repository}",
+        ]
+    if chart.external:
+        lines += [
+            "  - name: redis",
+            "    version: 18.0.0",
+            "    repository: oci://registry-1.docker.io/bitnamicharts",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def helpers_tpl(chart: SyntheticChart) -> str:
+    """Labels template including the labels of every local dependency."""
+    includes = "".join(
+        f'{{{{ include "{name}.labels" . }}}}\n' for name in chart.dependencies
+    )
+    return (
+        f'{{{{- define "{chart.name}.labels" -}}}}\n'
+        f"app.kubernetes.io/name: {chart.name}\n"
+        f"{includes}"
+        "{{- end }}\n"
+    )
+
+
+def configmap_yaml(chart: SyntheticChart) -> str:
+    return (
+        "apiVersion: v1\n"
+        "kind: ConfigMap\n"
+        "metadata:\n"
+        "  name: {{ .Release.Name }}\n"
+        "  labels:\n"
+        f'    {{{{- include "{chart.name}.labels" . | nindent 4 }}}}\n'
+    )
+
+
+CONFIGMAP_TEST = """suite: ConfigMap
+templates:
+  - configmap.yaml
+tests:
+  - it: renders a ConfigMap
+    asserts:
+      - isKind:
+          of: ConfigMap
+"""
+
+
+def generate_monorepo(root: Path, spec: MonorepoSpec) -> Monorepo:
+    """Write the charts of a spec under root: a Chart.yaml, a labels helper
+    and, for applications, a ConfigMap template with a test suite."""
+    plan = plan_monorepo(spec)
+    charts: Dict[str, SyntheticChart] = plan["charts"]
+    for chart in charts.values():
+        directory = root / chart.directory
+        (directory / "templates").mkdir(parents=True, exist_ok=True)
+        (directory / "Chart.yaml").write_text(chart_yaml(chart, charts))
+        (directory / "templates" / "_helpers.tpl").write_text(helpers_tpl(chart))
+        if chart.type == "application":
+            (directory / "templates" / "configmap.yaml").write_text(
+                configmap_yaml(chart)
+            )
+            (directory / "tests").mkdir(exist_ok=True)
+            (directory / "tests" / "configmap_test.yaml").write_text(CONFIGMAP_TEST)
+    return Monorepo(root=root, spec=spec, **plan)
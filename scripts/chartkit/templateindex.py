@@ -0,0 +1,331 @@
+import fnmatch
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set
+
+import click
+
+from .files import read_yaml
+
+if TYPE_CHECKING:
+    from .charts import ChartGraph, ChartInfo
+
+# Template actions, e.g. {{- include "mozcloud.labels" . | nindent 4 }}.
+# Comments ({{/* ... */}}) are matched too, so that they can be skipped.
+ACTION = re.compile(r"{{-?\s*(/\*.*?\*/|.*?)\s*-?}}", re.DOTALL)
+# Actions that open a block closed by {{ end }}.
+BLOCK_START = re.compile(r"^(define|block|if|range|with)\b")
+DEFINE = re.compile(r'^(?:define|block)\s+"([^"]+)"')
+# Named template references. "block" both defines and renders a template.
+REFERENCE = re.compile(r'\b(?:include|template|block)\s+"([^"]+)"')
+# include/template with a computed name, which can only be resolved by helm.
+DYNAMIC_REFERENCE = re.compile(r"\b(?:include|template)\s+[^\s\"]")
+
+# Files of a chart that do not change what helm renders.
+DOC_FILES = ["README*", "*.md", "LICENSE*", ".helmignore"]
+
+# Node ids in the dependency index: a named template, or the top-level
+# content of a template file (what helm renders from it).
+ROOT = "<file>"
+
+
+def template_node(path: Path) -> str:
+    return f"{ROOT}{path}"
+
+
+@dataclass
+class TemplateFile:
+    path: Path
+    # named templates defined in the file
+    defines: Set[str] = field(default_factory=set)
+    # node id (named template or file content) -> named templates it uses
+    references: Dict[str, Set[str]] = field(default_factory=dict)
+    # node ids whose include/template names are computed at render time
+    dynamic: Set[str] = field(default_factory=set)
+
+
+def parse_template(path: Path, content: str) -> TemplateFile:
+    """Find the named templates a template file defines and uses."""
+    result = TemplateFile(path)
+    root = template_node(path)
+    # Stack of open blocks: the node id for define/block, None otherwise.
+    stack: List[Optional[str]] = []
+
+    def current() -> str:
+        return next((node for node in reversed(stack) if node), root)
+
+    for match in ACTION.finditer(content):
+        action = match.group(1)
+        if action.startswith("/*"):
+            continue
+        if action == "end" or action.startswith("end "):
+            if stack:
+                stack.pop()
+            continue
+        node = current()
+        for name in REFERENCE.findall(action):
+            result.references.setdefault(node, set()).add(name)
+        if DYNAMIC_REFERENCE.search(action):
+            result.dynamic.add(node)
+        if BLOCK_START.match(action):
+            define = DEFINE.match(action)
+            if define:
+                result.defines.add(define.group(1))
+                stack.append(define.group(1))
+            else:
+                stack.append(None)
+    return result
+
+
+@dataclass
+class SuiteTargets:
+    path: Path
+    chart: "ChartInfo"
+    # template files the suite renders; None if it renders all of them
+    templates: Optional[Set[Path]]
+    # values files the suite reads
+    values: Set[Path]
+
+
+def load_suite_targets(chart: "ChartInfo", path: Path) -> SuiteTargets:
+    """Read which templates and values files a helm-unittest suite file uses
+    (all of its suites, when it holds several YAML documents)."""
+    try:
+        docs = list(read_yaml().load_all(path.read_text(encoding="utf-8")))
+    except Exception as e:
+        click.echo(f"WARN: Failed to parse {path}: {e}", err=True)
+        docs = []
+    patterns: List[str] = []
+    values: List[str] = []
+    renders_all = not docs
+    for suite in docs:
+        if not isinstance(suite, dict):
+            continue
+        suite_patterns = list(suite.get("templates") or [])
+        values.extend(suite.get("values") or [])
+        patterns.extend(suite_patterns)
+        for test in suite.get("tests") or []:
+            if not isinstance(test, dict):
+                continue
+            test_patterns = list(test.get("templates") or [])
+            if test.get("template"):
+                test_patterns.append(test["template"])
+            values.extend(test.get("values") or [])
+            patterns.extend(test_patterns)
+            # a test naming no templates renders the suite's, or all of them
+            renders_all = renders_all or not (test_patterns or suite_patterns)
+        renders_all = renders_all or not patterns
+
+    templates: Optional[Set[Path]] = None
+    if not renders_all:
+        templates_dir = chart.path / "templates"
+        candidates = [
+            p.relative_to(templates_dir).as_posix()
+            for p in templates_dir.rglob("*")
+            if p.is_file()
+        ]
+        templates = set()
+        for pattern in patterns:
+            # Suites may name templates relative to the chart, too.
+            pattern = str(pattern).removeprefix("templates/")
+            templates.update(
+                templates_dir / c for c in fnmatch.filter(candidates, pattern)
+            )
+    return SuiteTargets(
+        path=path,
+        chart=chart,
+        templates=templates,
+        values={(path.parent / v).resolve() for v in values if isinstance(v, str)},
+    )
+
+
+class TemplateIndex:
+    """Template-level dependencies of the charts in a ChartGraph.
+
+    Tracks which named templates ({{ define }}) every template file defines
+    and which ones its content and each definition use ({{ include }} and
+    {{ template }}), across charts, since library charts share their named
+    templates with the charts depending on them. Test suites are mapped to
+    the template files they render (their templates: lists), so a change to
+    a template only selects the suites whose output it can alter.
+    """
+
+    def __init__(self, graph: "ChartGraph"):
+        self.graph = graph
+        self.files: Dict[Path, TemplateFile] = {}
+        # named template -> files defining it
+        self.defined_in: Dict[str, Set[Path]] = {}
+        # named template -> node ids using it
+        self.users: Dict[str, Set[str]] = {}
+        self.dynamic: Set[str] = set()
+        self.suites: Dict[Path, SuiteTargets] = {}
+
+        for chart in graph.charts.values():
+            templates_dir = chart.path / "templates"
+            if templates_dir.is_dir():
+                for path in sorted(templates_dir.rglob("*")):
+                    if path.is_file():
+                        self.add_template(path)
+            for suite in chart.find_test_suites():
+                self.suites[suite] = load_suite_targets(chart, suite)
+
+    def add_template(self, path: Path):
+        try:
+            content = path.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError) as e:
+            click.echo(f"WARN: Failed to read {path}: {e}", err=True)
+            return
+        parsed = parse_template(path, content)
+        self.files[path] = parsed
+        for name in parsed.defines:
+            self.defined_in.setdefault(name, set()).add(path)
+        for node, names in parsed.references.items():
+            for name in names:
+                self.users.setdefault(name, set()).add(node)
+        self.dynamic.update(parsed.dynamic)
+
+    def remove_template(self, path: Path):
+        parsed = self.files.pop(path, None)
+        if parsed is None:
+            return
+        for name in parsed.defines:
+            self.defined_in.get(name, set()).discard(path)
+        for node, names in parsed.references.items():
+            for name in names:
+                self.users.get(name, set()).discard(node)
+        self.dynamic -= parsed.dynamic
+
+    def refresh(self, files: Iterable[Path]):
+        """Read changed, added and deleted template and suite files again.
+        Adding or removing a template re-reads the chart's suites, whose
+        templates: patterns may match it."""
+        reload_suites: Set[str] = set()
+        for path in files:
+            chart = self.chart_of(path)
+            if chart is None or path == chart.path:
+                continue
+            parts = path.relative_to(chart.path).parts
+            if parts[0] == "templates":
+                known, exists = path in self.files, path.is_file()
+                if known != exists:
+                    reload_suites.add(chart.name)
+                self.remove_template(path)
+                if exists:
+                    self.add_template(path)
+            elif path.parent == chart.path / "tests" and path.name.endswith(
+                "_test.yaml"
+            ):
+                self.suites.pop(path, None)
+                if path.is_file():
+                    self.suites[path] = load_suite_targets(chart, path)
+        for chart_name in reload_suites:
+            chart = self.graph.charts[chart_name]
+            for suite in chart.find_test_suites():
+                self.suites[suite] = load_suite_targets(chart, suite)
+
+    def affected_templates(self, changed: Iterable[Path]) -> Set[Path]:
+        """Template files whose rendered output may change with the given
+        changed template files: the files themselves and every file whose
+        content uses one of their named templates, directly or indirectly."""
+        affected: Set[Path] = set()
+        seen: Set[str] = set()
+        stack: List[str] = []
+        for path in changed:
+            affected.add(path)
+            parsed = self.files.get(path)
+            if parsed:
+                stack.extend(parsed.defines)
+        if affected and self.dynamic:
+            # Computed names could refer to anything.
+            stack.extend(self.dynamic)
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            if node.startswith(ROOT):
+                affected.add(Path(node.removeprefix(ROOT)))
+                continue
+            stack.extend(self.users.get(node, ()))
+        return affected
+
+    def chart_of(self, path: Path) -> Optional["ChartInfo"]:
+        """The chart whose directory contains the path (the innermost one)."""
+        return self.graph.chart_of(path)
+
+    def chart_suites(self, chart_names: Iterable[str]) -> Set[Path]:
+        names = set(chart_names)
+        return {p for p, s in self.suites.items() if s.chart.name in names}
+
+    def affected_suites(self, files: Iterable[Path]) -> List[Path]:
+        """Return the test suites whose results may change with the files.
+
+        - Template files select the suites rendering them or a template using
+          a named template they define, in any chart.
+        - Suite and snapshot files select their suite, values files under
+          tests/ the suites reading them.
+        - Any other change to a chart (values, Chart.yaml, schema, vendored
+          subcharts, deleted templates) selects all suites of the chart and of
+          the charts depending on it.
+        """
+        selected: Set[Path] = set()
+        changed_templates: Set[Path] = set()
+        changed_charts: Set[str] = set()
+        for path in files:
+            chart = self.chart_of(path)
+            if chart is None:
+                continue
+            rel = path.relative_to(chart.path)
+            parts = rel.parts
+            if not parts:
+                changed_charts.add(chart.name)
+            elif parts[0] == "templates" and path in self.files:
+                changed_templates.add(path)
+            elif parts[0] == "tests":
+                selected.update(self.test_file_suites(chart, path))
+            elif len(parts) == 1 and any(
+                fnmatch.fnmatch(rel.name, p) for p in DOC_FILES
+            ):
+                continue
+            else:
+                changed_charts.add(chart.name)
+
+        if changed_templates:
+            affected = self.affected_templates(changed_templates)
+            # Suites without a templates: list render every template.
+            rendering_all = {
+                chart.name
+                for chart in map(self.chart_of, affected)
+                if chart is not None
+            }
+            selected.update(
+                p
+                for p, s in self.suites.items()
+                if (
+                    bool(s.templates & affected)
+                    if s.templates is not None
+                    else s.chart.name in rendering_all
+                )
+            )
+        if changed_charts:
+            closure = self.graph.find_closure(
+                sorted(changed_charts), self.graph.dependent_selector()
+            )
+            selected.update(self.chart_suites(closure))
+        return sorted(selected)
+
+    def test_file_suites(self, chart: "ChartInfo", path: Path) -> Set[Path]:
+        """Suites affected by a changed file in a chart's tests/ directory."""
+        tests_dir = chart.path / "tests"
+        if path in self.suites:
+            return {path}
+        if path.parent.name == "__snapshot__" and path.suffix == ".snap":
+            suite = tests_dir / path.stem
+            return {suite} if suite in self.suites else set()
+        if path.name.endswith("_test.yaml"):
+            # deleted suite
+            return set()
+        readers = {p for p, s in self.suites.items() if path in s.values}
+        # Files no suite names directly may still be read by one.
+        return readers or self.chart_suites([chart.name])
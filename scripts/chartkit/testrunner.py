@@ -0,0 +1,921 @@
+"""Runs helm-unittest suites for charts."""
+
+import contextlib
+import hashlib
+import heapq
+import json
+import os
+import queue
+import re
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import click
+
+from .files import make_path_root_relative
+from .profiling import subprocess_phase
+from .reports import ANSI_ESCAPE, TestCaseResult, count_documents, parse_junit
+from .resultcache import ResultCache
+from .timings import TimingDB, predict_makespan
+
+if TYPE_CHECKING:
+    from .charts import ChartInfo
+
+
+SUITE_LINE = re.compile(r"^\s+(PASS|FAIL)\s+(.+?)\t(.+?)\s*$")
+
+# Suites per helm process when batching without a fixed size: aim for this
+# many batches per worker so the schedule can still balance the load.
+BATCHES_PER_WORKER = 2
+
+
+def terminate(process: subprocess.Popen):
+    """Send SIGTERM to a helm process started in a session of its own, and
+    so to the plugin processes it started too."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _print_suite_summary(
+    passed: bool, output: str, detail: str = "", cached: bool = False
+) -> None:
+    """Print a compact one-line summary of a suite result.
+
+    Parses the suite name, test counts, and elapsed time from helm unittest
+    output. Full failure output is deferred and printed by the caller after
+    all suites complete, so failures don't interleave with other results.
+    Output split from a batched run has no per-suite totals; detail is shown
+    in their place. Results served from the result cache are marked.
+    """
+    suite_name = tests = time = ""
+    for line in output.splitlines():
+        line = ANSI_ESCAPE.sub("", line)
+        if m := re.match(r"^\s+(?:PASS|FAIL)\s+(.+?)\t", line):
+            suite_name = m.group(1).strip()
+        elif m := re.match(r"^Tests:\s+(.+)$", line):
+            tests = m.group(1).strip()
+        elif m := re.match(r"^Time:\s+(.+)$", line):
+            time = m.group(1).strip()
+
+    status = (
+        click.style(" PASS ", fg="white", bg="green", bold=True)
+        if passed
+        else click.style(" FAIL ", fg="white", bg="red", bold=True)
+    )
+    summary = f"{tests}, {time}" if tests or time else detail
+    marker = click.style("  [cached]", dim=True) if cached else ""
+    click.echo(f"{status}  {suite_name}  ({summary}){marker}")
+
+
+class SuiteReports:
+    """Splits the output of a helm unittest run into per-suite reports while
+    it is being read.
+
+    Each suite's report is its PASS/FAIL line and any failure details that
+    follow it. feed() returns the reports completed by a line, as (suite file
+    path as printed by helm, relative to the chart directory; the report;
+    seconds between the previous report and this one; the number of lines in
+    other before it) tuples. Lines outside of any report (chart headers,
+    totals) are kept in other.
+    """
+
+    def __init__(self, start: float):
+        self.last = start
+        self.current: Optional[Tuple[str, float, List[str]]] = None
+        self.other: List[str] = []
+
+    def feed(self, line: str) -> List[Tuple[str, str, float, int]]:
+        plain = ANSI_ESCAPE.sub("", line).rstrip("\n")
+        if m := SUITE_LINE.match(plain):
+            done = self.close()
+            now = time.monotonic()
+            self.current = (m.group(3), now - self.last, [line])
+            self.last = now
+            return done
+        if plain.startswith(("Charts:", "### Chart")):
+            done = self.close()
+            self.other.append(line)
+            return done
+        if self.current is not None:
+            self.current[2].append(line)
+        else:
+            self.other.append(line)
+        return []
+
+    def close(self) -> List[Tuple[str, str, float, int]]:
+        """Finish the report being read, e.g. at the end of the output."""
+        if self.current is None:
+            return []
+        path, duration, lines = self.current
+        self.current = None
+        return [(path, "".join(lines), duration, len(self.other))]
+
+
+@dataclass
+class TestSuite:
+    chart: "ChartInfo"
+    path: Path
+
+    @property
+    def key(self) -> str:
+        """Stable identifier of the suite: its path relative to the git root."""
+        return make_path_root_relative(self.path).as_posix()
+
+
+@dataclass
+class SuiteResult:
+    suite: TestSuite
+    passed: bool
+    output: str
+    duration: float
+    batch_size: int = 1
+    cached: bool = False
+    tests: List[TestCaseResult] = field(default_factory=list)
+    command: List[str] = field(default_factory=list)
+
+
+@dataclass
+class SuiteBatch:
+    """Suites of one chart run by a single helm unittest process."""
+
+    chart: "ChartInfo"
+    suites: List[TestSuite]
+    expected: float = 0.0
+
+
+class TextReporter:
+    """Reports a test run as one summary line per suite, with the failure
+    details printed at the end so they don't interleave with other results.
+    In verbose mode the helm output is printed instead, as it arrives."""
+
+    def __init__(self, verbose: bool = False):
+        self.verbose = verbose
+        self.failures: List[str] = []
+
+    def message(self, text: str):
+        click.echo(text)
+
+    def start(self, suites: int, processes: int, workers: int):
+        in_processes = ""
+        if processes != suites:
+            plural = "process" if processes == 1 else "processes"
+            in_processes = f" in {processes} helm {plural}"
+        click.echo(
+            f"Running {suites} test suites{in_processes} with PARALLEL={workers}..."
+        )
+
+    def output(self, chart: str, text: str):
+        click.echo(text, nl=False)
+
+    def result(self, result: SuiteResult):
+        if result.cached:
+            _print_suite_summary(
+                True, result.output, f"{result.duration:.2f}s", cached=True
+            )
+            return
+        if not self.verbose:
+            _print_suite_summary(
+                result.passed,
+                result.output,
+                f"batch of {result.batch_size}, {result.duration:.2f}s",
+            )
+        if not result.passed:
+            self.failures.append(result.output)
+
+    def cancelled(self, suites: List[TestSuite]):
+        pass
+
+    def finish(
+        self,
+        passed: bool,
+        cancelled: int,
+        duration: float,
+        predicted: Optional[float] = None,
+    ):
+        if not self.verbose and self.failures:
+            click.echo("\n--- Failures ---\n")
+            for output in self.failures:
+                click.echo(output, nl=False)
+        if cancelled:
+            click.echo(f"Cancelled {cancelled} test suites.")
+        if predicted is not None:
+            click.echo(
+                f"Predicted makespan {predicted:.1f}s, actual {duration:.1f}s "
+                "(longest-expected-first schedule)."
+            )
+
+
+class NDJSONReporter:
+    """Reports a test run as newline-delimited JSON events on stdout, written
+    as they happen: start, suite (one per result, with the output of failed
+    suites), output (helm output, in verbose mode), cancelled, message and a
+    final end event. Every event has the seconds elapsed since the run began.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+
+    def emit(self, event: str, **fields: Any):
+        elapsed = round(time.monotonic() - self.started, 3)
+        click.echo(json.dumps({"event": event, "elapsed": elapsed, **fields}))
+        click.get_text_stream("stdout").flush()
+
+    def message(self, text: str):
+        self.emit("message", message=text)
+
+    def start(self, suites: int, processes: int, workers: int):
+        self.emit("start", suites=suites, processes=processes, workers=workers)
+
+    def output(self, chart: str, text: str):
+        self.emit("output", chart=chart, output=text)
+
+    def result(self, result: SuiteResult):
+        self.emit(
+            "suite",
+            suite=result.suite.key,
+            chart=result.suite.chart.name,
+            passed=result.passed,
+            cached=result.cached,
+            duration=round(result.duration, 3),
+            **({} if result.passed else {"output": ANSI_ESCAPE.sub("", result.output)}),
+        )
+
+    def cancelled(self, suites: List[TestSuite]):
+        self.emit("cancelled", suites=[s.key for s in suites])
+
+    def finish(
+        self,
+        passed: bool,
+        cancelled: int,
+        duration: float,
+        predicted: Optional[float] = None,
+    ):
+        self.emit(
+            "end",
+            passed=passed,
+            cancelled=cancelled,
+            duration=round(duration, 3),
+            **({} if predicted is None else {"predicted": round(predicted, 3)}),
+        )
+
+
+Reporter = TextReporter | NDJSONReporter
+
+
+class UnitTestRunner:
+    """Runs test suites on a pool of helm unittest processes.
+
+    Suites of the same chart can be grouped into batches run by a single helm
+    process, which pays helm startup and chart loading once per batch instead
+    of once per suite. Batches are scheduled longest-expected-first using the
+    durations recorded in the timing database, so a long batch is not left to
+    run alone at the end. Suites without history are estimated from their
+    file size. With a result cache, suites whose inputs are unchanged since
+    they last passed are reported from the cache without running helm.
+
+    helm output is read as it is written and every suite result is reported
+    as soon as helm prints it. With fail_fast, the first failure cancels the
+    batches that have not finished yet. With test_cases, helm also writes a
+    JUnit report per process, which adds the individual test cases to the
+    results for --junit-xml and --json-report.
+    """
+
+    workers: int
+    update_snapshot: bool
+    verbose: bool
+    timings: Optional[TimingDB]
+    batch_size: Optional[int]
+    estimates: Dict[str, float]
+    result_cache: Optional[ResultCache]
+    cache_keys: Dict[str, str]
+    results: List[SuiteResult]
+    fail_fast: bool
+    test_cases: bool
+    reporter: Reporter
+    cancelled: List[TestSuite]
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        update_snapshot: bool = False,
+        verbose: bool = False,
+        timings: Optional[TimingDB] = None,
+        batch_size: Optional[int] = 1,
+        result_cache: Optional[ResultCache] = None,
+        fail_fast: bool = False,
+        reporter: Optional[Reporter] = None,
+        cancel: Optional[threading.Event] = None,
+        test_cases: bool = False,
+        record_timings: bool = True,
+    ):
+        """batch_size is the maximum number of suites per helm process, or
+        None to size batches automatically (see plan_batches). Setting cancel
+        from another thread stops a run like a --fail-fast failure does.
+        Without record_timings, the timing file is only read."""
+        self.workers = workers or os.cpu_count() or 4
+        self.update_snapshot = update_snapshot
+        self.verbose = verbose
+        self.timings = timings
+        self.record_timings = record_timings
+        self.batch_size = batch_size
+        self.estimates = {}
+        # updating snapshots must always run helm
+        self.result_cache = None if update_snapshot else result_cache
+        self.cache_keys = {}
+        self.results = []
+        self.fail_fast = fail_fast
+        self.test_cases = test_cases
+        self.reporter = reporter or TextReporter(verbose)
+        self.cancelled = []
+        self.cancel = cancel or threading.Event()
+        self.processes: Set[subprocess.Popen] = set()
+        self.lock = threading.Lock()
+        # where helm writes the JUnit reports of a run with test_cases (see run)
+        self.junit_dir: Optional[Path] = None
+        self.duration = 0.0
+        # the split made by select_shard, written with the results
+        self.split: Dict[str, Any] = {}
+
+    def estimate(self, suites: List[TestSuite]) -> Dict[str, float]:
+        """Expected duration per suite key. Suites without recorded timings are
+        estimated from their size, scaled by the known suites' time per byte."""
+        sizes = {s.key: s.path.stat().st_size for s in suites}
+        known = {
+            s.key: d
+            for s in suites
+            if self.timings and (d := self.timings.expected(s.key)) is not None
+        }
+        known_bytes = sum(sizes[k] for k in known)
+        seconds_per_byte = sum(known.values()) / known_bytes if known_bytes else 0.0
+        return {
+            key: known[key] if key in known else size * seconds_per_byte
+            for key, size in sizes.items()
+        }
+
+    def weights(self, suites: List[TestSuite]) -> Dict[str, float]:
+        """Relative cost per suite key: the expected durations, or the suite
+        file sizes when there is no timing history at all."""
+        estimates = self.estimate(suites)
+        if not any(estimates.values()):
+            # no history at all: larger suites usually take longer
+            estimates = {s.key: float(s.path.stat().st_size) for s in suites}
+        return estimates
+
+    def select_shard(
+        self, suites: List[TestSuite], index: int, count: int
+    ) -> List[TestSuite]:
+        """Return the suites assigned to shard index (0-based) of count.
+
+        Suites are dealt longest-expected-first to the least loaded shard, so
+        shards finish at about the same time. The partition only depends on
+        the suite list and the weights, so every node computes the same one
+        as long as they read the same timing file (or none) and a shard run
+        does not record timings. A fingerprint of the suites and weights is
+        kept in split, so unittest-merge can tell if the shards disagreed.
+        """
+        weights = self.weights(suites)
+        loads = [(0.0, shard) for shard in range(count)]
+        assigned: List[TestSuite] = []
+        for suite in sorted(suites, key=lambda s: (-weights[s.key], s.key)):
+            load, shard = heapq.heappop(loads)
+            if shard == index:
+                assigned.append(suite)
+            heapq.heappush(loads, (load + weights[suite.key], shard))
+        split = {
+            "count": count,
+            "suites": sorted(
+                [key, round(weight, 6)] for key, weight in weights.items()
+            ),
+        }
+        self.split = {
+            "fingerprint": hashlib.sha256(
+                json.dumps(split, sort_keys=True).encode()
+            ).hexdigest(),
+            "total": len(suites),
+            "assigned": sorted(s.key for s in assigned),
+        }
+        return assigned
+
+    def plan_batches(self, suites: List[TestSuite]) -> List[SuiteBatch]:
+        """Group suites of the same chart into batches, longest-expected first.
+
+        With a fixed batch_size each chart's suites are split into chunks of
+        that size. Otherwise the expected run time is split evenly into
+        BATCHES_PER_WORKER batches per worker, and each chart's suites are
+        packed into batches up to that share; without any timing history the
+        same split is made by suite file size.
+        """
+        estimates = self.weights(suites)
+        self.estimates = estimates
+        ordered = sorted(suites, key=lambda s: (-estimates[s.key], s.key))
+
+        target_batches = self.workers * BATCHES_PER_WORKER
+        by_chart: Dict[str, List[TestSuite]] = {}
+        for suite in ordered:
+            by_chart.setdefault(suite.chart.name, []).append(suite)
+
+        batches: List[SuiteBatch] = []
+        for chart_suites in by_chart.values():
+            chart = chart_suites[0].chart
+            if self.batch_size is not None:
+                size = max(self.batch_size, 1)
+                groups = [
+                    chart_suites[i : i + size]
+                    for i in range(0, len(chart_suites), size)
+                ]
+            else:
+                share = sum(estimates.values()) / target_batches
+                groups = [[]]
+                for suite in chart_suites:
+                    group_time = sum(estimates[s.key] for s in groups[-1])
+                    if groups[-1] and group_time + estimates[suite.key] > share:
+                        groups.append([])
+                    groups[-1].append(suite)
+            batches.extend(
+                SuiteBatch(chart, group, sum(estimates[s.key] for s in group))
+                for group in groups
+            )
+        return sorted(batches, key=lambda b: (-b.expected, b.suites[0].key))
+
+    def helm_command(self, batch: SuiteBatch) -> List[str]:
+        cmd = ["helm", "unittest", str(batch.chart.path)]
+        for suite in batch.suites:
+            cmd.extend(["-f", str(suite.path)])
+        cmd.append("--with-subchart=false")
+        if self.update_snapshot:
+            cmd.append("-u")
+        cmd.append("--color")
+        return cmd
+
+    def stream_batch(self, batch: SuiteBatch) -> Iterator[Tuple[str, Any]]:
+        """Run one helm process, yielding ("result", SuiteResult) events as
+        the suites are reported, ("output", (chart, text)) events with the helm
+        output in verbose mode and a ("cancelled", suites) event for the
+        suites a cancellation stopped. Once helm has exited, the test cases of
+        its JUnit report are added to the results, which are then yielded
+        together as a ("batch", results) event."""
+        if self.cancel.is_set():
+            yield "cancelled", batch.suites
+            return
+        command = self.helm_command(batch)
+        junit: Optional[Path] = None
+        if self.junit_dir is not None:
+            junit = self.junit_dir / f"{id(batch)}.xml"
+            command = [*command, "-t", "JUnit", "-o", str(junit)]
+        finished: List[SuiteResult] = []
+        with subprocess_phase(command):
+            start = time.monotonic()
+            process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1,
+                # helm runs the unittest plugin as a child process holding
+                # stdout open; a session of its own lets a cancellation
+                # terminate both (see terminate)
+                start_new_session=True,
+            )
+            with self.lock:
+                self.processes.add(process)
+                # a cancellation may have come while helm was starting
+                if self.cancel.is_set():
+                    terminate(process)
+            try:
+                if len(batch.suites) == 1:
+                    yield from self.stream_suite(batch, process, start, finished)
+                else:
+                    yield from self.stream_suites(batch, process, start, finished)
+            finally:
+                with self.lock:
+                    self.processes.discard(process)
+                if process.stdout:
+                    process.stdout.close()
+                process.wait()
+        if junit is not None:
+            self.add_test_cases(finished, parse_junit(junit))
+        yield "batch", finished
+
+    def stream_suite(
+        self,
+        batch: SuiteBatch,
+        process: subprocess.Popen,
+        start: float,
+        finished: List[SuiteResult],
+    ) -> Iterator[Tuple[str, Any]]:
+        """Events of a helm process running a single suite: its exit code is
+        the result, and all of its output belongs to the suite. In verbose
+        mode the output is passed on line by line as helm writes it."""
+        assert process.stdout is not None
+        lines: List[str] = []
+        for line in process.stdout:
+            lines.append(line)
+            if self.verbose:
+                yield "output", (batch.chart.name, line)
+        passed = process.wait() == 0
+        if self.cancel.is_set() and process.returncode < 0:
+            yield "cancelled", batch.suites
+            return
+        duration = time.monotonic() - start
+        result = SuiteResult(batch.suites[0], passed, "".join(lines), duration)
+        result.command = self.helm_command(batch)
+        finished.append(result)
+        yield "result", result
+
+    def stream_suites(
+        self,
+        batch: SuiteBatch,
+        process: subprocess.Popen,
+        start: float,
+        finished: List[SuiteResult],
+    ) -> Iterator[Tuple[str, Any]]:
+        """Events of a helm process running several suites, split from its
+        output as each suite is reported."""
+        suites = {suite.path.resolve(): suite for suite in batch.suites}
+        # a suite file can hold several suites, each reported on its own
+        expected = {path: count_documents(path) for path in suites}
+        partial: Dict[Path, SuiteResult] = {}
+        reports = SuiteReports(start)
+        shown = 0  # lines of reports.other already shown in verbose mode
+
+        def complete(path: Path) -> SuiteResult:
+            result = partial.pop(path)
+            result.command = self.helm_command(batch)
+            del suites[path]
+            finished.append(result)
+            return result
+
+        def results(done: List[Tuple[str, str, float, int]]):
+            nonlocal shown
+            for rel_path, report, duration, other_before in done:
+                path = (batch.chart.path / rel_path).resolve()
+                if path not in suites:
+                    reports.other.append(report)
+                    continue
+                if self.verbose:
+                    header = "".join(reports.other[shown:other_before])
+                    shown = other_before
+                    yield "output", (batch.chart.name, header + report)
+                status_line = ANSI_ESCAPE.sub("", report.splitlines()[0])
+                passed = status_line.split()[0] == "PASS"
+                if path in partial:
+                    result = partial[path]
+                    result.passed = result.passed and passed
+                    result.output += report
+                    result.duration += duration
+                else:
+                    partial[path] = SuiteResult(
+                        suites[path], passed, report, duration, len(batch.suites)
+                    )
+                expected[path] -= 1
+                if expected[path] <= 0:
+                    yield "result", complete(path)
+
+        assert process.stdout is not None
+        for line in process.stdout:
+            yield from results(reports.feed(line))
+        yield from results(reports.close())
+        process.wait()
+        other = "".join(reports.other)
+        if self.verbose:
+            yield "output", (batch.chart.name, "".join(reports.other[shown:]))
+        if suites and self.cancel.is_set():
+            yield "cancelled", list(suites.values())
+        else:
+            for path in list(suites):
+                if path not in partial:
+                    # helm failed before reporting the suite
+                    partial[path] = SuiteResult(
+                        suites[path], False, other, 0.0, len(batch.suites)
+                    )
+                else:
+                    # or some of the suites in its file
+                    partial[path].passed = False
+                yield "result", complete(path)
+
+    def add_test_cases(
+        self,
+        results: List[SuiteResult],
+        junit: List[Tuple[str, List[TestCaseResult]]],
+    ):
+        """Attach the test cases of a JUnit report to the suite results. The
+        report names suites by their suite: field; their files are known from
+        the PASS/FAIL lines in the text output."""
+        if len(results) == 1:
+            results[0].tests = [test for _, tests in junit for test in tests]
+            return
+        by_name: Dict[str, List[List[TestCaseResult]]] = {}
+        for name, tests in junit:
+            by_name.setdefault(name, []).append(tests)
+        for result in sorted(results, key=lambda r: r.suite.key):
+            for line in ANSI_ESCAPE.sub("", result.output).splitlines():
+                m = SUITE_LINE.match(line)
+                if m and by_name.get(m.group(2).strip()):
+                    result.tests.extend(by_name[m.group(2).strip()].pop(0))
+
+    def run_batch(self, batch: SuiteBatch, events: "queue.Queue[Tuple[str, Any]]"):
+        """Worker: stream a batch's events to the queue, then mark it done."""
+        try:
+            for event in self.stream_batch(batch):
+                events.put(event)
+        finally:
+            events.put(("done", batch))
+
+    def cancel_outstanding(self, futures: Dict[Future, SuiteBatch]) -> int:
+        """Stop the batches that have not finished yet; returns the number of
+        batches that never started. Running helm processes are terminated and
+        report their unfinished suites as cancelled."""
+        self.cancel.set()
+        not_started = 0
+        for future, batch in futures.items():
+            if future.cancel():
+                not_started += 1
+                self.cancelled.extend(batch.suites)
+                self.reporter.cancelled(batch.suites)
+        with self.lock:
+            for process in self.processes:
+                terminate(process)
+        return not_started
+
+    def lookup_cached(self, suites: List[TestSuite]) -> List[SuiteResult]:
+        """Return cached passing results for suites whose inputs are unchanged."""
+        if self.result_cache is None:
+            return []
+        results: List[SuiteResult] = []
+        for suite in suites:
+            key = self.result_cache.key(suite)
+            self.cache_keys[suite.key] = key
+            cached = self.result_cache.get(key)
+            if self.test_cases and cached is not None and not cached.get("tests"):
+                # cached by a run without test cases; run again for the report
+                cached = None
+            if cached is not None:
+                results.append(
+                    SuiteResult(
+                        suite,
+                        True,
+                        cached.get("output", ""),
+                        cached.get("duration", 0.0),
+                        cached=True,
+                        tests=[
+                            TestCaseResult.from_json(test)
+                            for test in cached.get("tests", [])
+                        ],
+                        command=cached.get("command", []),
+                    )
+                )
+        return results
+
+    def record(self, result: SuiteResult):
+        """Keep a fresh suite result and record its timing."""
+        self.results.append(result)
+        if self.timings is not None and self.record_timings:
+            self.timings.record(result.suite.key, result.duration)
+
+    def cache_results(self, results: List[SuiteResult]):
+        """Cache the passes of a finished batch, with their test cases."""
+        if self.result_cache is None:
+            return
+        for result in results:
+            if result.passed:
+                self.result_cache.put(
+                    self.cache_keys[result.suite.key],
+                    result.suite,
+                    result.output,
+                    result.duration,
+                    [test.to_json() for test in result.tests],
+                    result.command,
+                )
+
+    def run(self, suites: List[TestSuite]) -> bool:
+        reporter = self.reporter
+        start = time.monotonic()
+        if not suites:
+            reporter.message("No test suites found.")
+            reporter.finish(True, 0, 0.0)
+            return True
+
+        cached_results = self.lookup_cached(suites)
+        for result in cached_results:
+            reporter.result(result)
+        self.results.extend(cached_results)
+        cached_keys = {r.suite.key for r in cached_results}
+        suites = [s for s in suites if s.key not in cached_keys]
+        if cached_results:
+            reporter.message(
+                f"{len(cached_results)} test suites unchanged since they passed."
+            )
+        if not suites:
+            reporter.finish(True, 0, time.monotonic() - start)
+            return True
+
+        batches = self.plan_batches(suites)
+        has_history = self.timings is not None and any(
+            self.timings.expected(s.key) is not None for s in suites
+        )
+        predicted = predict_makespan([b.expected for b in batches], self.workers)
+
+        reporter.start(len(suites), len(batches), self.workers)
+        start = time.monotonic()
+        failed = False
+        events: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        with (
+            (
+                tempfile.TemporaryDirectory(prefix="chartkit-junit-")
+                if self.test_cases
+                else contextlib.nullcontext()
+            ) as junit_dir,
+            ThreadPoolExecutor(max_workers=self.workers) as executor,
+        ):
+            self.junit_dir = Path(junit_dir) if junit_dir else None
+            futures = {
+                executor.submit(self.run_batch, batch, events): batch
+                for batch in batches
+            }
+            pending = len(futures)
+            stopping = False
+            try:
+                while pending:
+                    try:
+                        kind, payload = events.get(timeout=0.1)
+                    except queue.Empty:
+                        kind, payload = "", None
+                    if kind == "done":
+                        pending -= 1
+                    elif kind == "output":
+                        reporter.output(*payload)
+                    elif kind == "cancelled":
+                        self.cancelled.extend(payload)
+                        reporter.cancelled(payload)
+                    elif kind == "batch":
+                        self.cache_results(payload)
+                    elif kind == "result":
+                        self.record(payload)
+                        reporter.result(payload)
+                        if not payload.passed:
+                            failed = True
+                            if self.fail_fast and not self.cancel.is_set():
+                                reporter.message("Stopping after the first failure.")
+                                self.cancel.set()
+                    if self.cancel.is_set() and not stopping:
+                        stopping = True
+                        pending -= self.cancel_outstanding(futures)
+            except KeyboardInterrupt:
+                # helm runs in sessions of its own and does not see Ctrl-C
+                self.cancel_outstanding(futures)
+                raise
+        for future in futures:
+            if not future.cancelled():
+                # re-raise errors from the workers, e.g. helm not found
+                future.result()
+        self.junit_dir = None
+        actual = time.monotonic() - start
+        self.duration = actual
+
+        if self.timings is not None and self.record_timings:
+            self.timings.save()
+        passed = not failed and not self.cancelled
+        reporter.finish(
+            passed, len(self.cancelled), actual, predicted if has_history else None
+        )
+        return passed
+
+    def write_results(self, path: Path, shard_index: int = 0, shard_count: int = 1):
+        """Write the suite results of the last run as JSON, for unittest-merge."""
+        data = {
+            "shard": {"index": shard_index, "count": shard_count, **self.split},
+            "passed": all(r.passed for r in self.results) and not self.cancelled,
+            "cancelled": sorted(s.key for s in self.cancelled),
+            "suites": [
+                {
+                    "suite": r.suite.key,
+                    "chart": r.suite.chart.name,
+                    "passed": r.passed,
+                    "cached": r.cached,
+                    "duration": r.duration,
+                }
+                | ({} if r.passed else {"output": r.output})
+                for r in sorted(self.results, key=lambda r: r.suite.key)
+            ],
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+
+
+def merge_results(paths: List[Path], timings: Optional[TimingDB] = None) -> bool:
+    """Combine per-shard result files into one summary.
+
+    Fails if any suite failed or was cancelled (--fail-fast), if a results
+    file cannot be read, or if shards are missing. Also fails if the shards
+    did not split the same suites on the same weights (see select_shard),
+    if a suite was run by several shards, or if a suite assigned to a shard
+    has no result. Suite durations from non-cached runs are recorded in
+    timings when given, so the next sharded run can balance on them.
+    """
+    ok = True
+    suites: List[Dict] = []
+    cancelled: List[str] = []
+    shards: Dict[int, int] = {}
+    fingerprints: Set[str] = set()
+    totals: Set[int] = set()
+    # times each suite was assigned to a shard, and run
+    assigned: Dict[str, int] = {}
+    for path in paths:
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            click.echo(f"ERROR: Failed to read results {path}: {e}", err=True)
+            ok = False
+            continue
+        shard = data.get("shard", {})
+        shards[shard.get("index", 0)] = shard.get("count", 1)
+        suites.extend(data.get("suites", []))
+        cancelled.extend(data.get("cancelled", []))
+        if "fingerprint" in shard:
+            fingerprints.add(shard["fingerprint"])
+            totals.add(shard.get("total", 0))
+            for key in shard.get("assigned", []):
+                assigned[key] = assigned.get(key, 0) + 1
+
+    counts = set(shards.values())
+    expected = max(counts) if counts else 0
+    missing = sorted(set(range(expected)) - set(shards))
+    if len(counts) > 1 or missing:
+        click.echo(
+            f"ERROR: Incomplete shard results: expected {expected} shards, "
+            f"missing {', '.join(map(str, missing)) or 'none'}"
+            + (" (shard counts disagree)" if len(counts) > 1 else ""),
+            err=True,
+        )
+        ok = False
+
+    if len(fingerprints) > 1:
+        click.echo(
+            "ERROR: The shards split different suites or weights; run them "
+            "with the same charts and --timings-file.",
+            err=True,
+        )
+        ok = False
+    run_counts: Dict[str, int] = {}
+    for key in [s["suite"] for s in suites] + cancelled:
+        run_counts[key] = run_counts.get(key, 0) + 1
+    duplicates = sorted(
+        {
+            key
+            for counts in (run_counts, assigned)
+            for key, count in counts.items()
+            if count > 1
+        }
+    )
+    if duplicates:
+        click.echo(
+            f"ERROR: {len(duplicates)} test suites were assigned to several shards: "
+            f"{', '.join(duplicates[:5])}" + (" ..." if len(duplicates) > 5 else ""),
+            err=True,
+        )
+        ok = False
+    unrun = sorted(set(assigned) - set(run_counts))
+    if unrun:
+        click.echo(
+            f"ERROR: {len(unrun)} assigned test suites have no results: "
+            f"{', '.join(unrun[:5])}" + (" ..." if len(unrun) > 5 else ""),
+            err=True,
+        )
+        ok = False
+    if len(totals) == 1 and not missing and len(assigned) != min(totals):
+        click.echo(
+            f"ERROR: The shards were assigned {len(assigned)} of "
+            f"{min(totals)} test suites.",
+            err=True,
+        )
+        ok = False
+
+    failures = [s for s in suites if not s.get("passed")]
+    if failures:
+        click.echo("\n--- Failures ---\n")
+        for suite in failures:
+            click.echo(suite.get("output", f"{suite['suite']}\n"), nl=False)
+
+    if timings is not None:
+        for suite in suites:
+            if not suite.get("cached"):
+                timings.record(suite["suite"], suite.get("duration", 0.0))
+        timings.save()
+
+    cached = sum(1 for s in suites if s.get("cached"))
+    click.echo(
+        f"{len(suites)} test suites across {len(shards)} shards: "
+        f"{len(suites) - len(failures)} passed ({cached} cached), "
+        f"{len(failures)} failed"
+        + (f", {len(cancelled)} cancelled." if cancelled else ".")
+    )
+    return ok and not failures and not cancelled
@@ -0,0 +1,56 @@
+"""Historical unit test suite durations used for scheduling."""
+
+import heapq
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import click
+
+from .cache import cache_dir, write_json_atomic
+
+# Weight of the latest run when updating a suite's expected duration, so a
+# single slow run on a busy machine does not dominate the estimate.
+SMOOTHING = 0.5
+
+
+class TimingDB:
+    """Expected duration per test suite, keyed by the suite's path relative to
+    the git root and stored as JSON (by default in .git/chartkit-cache)."""
+
+    path: Path
+    durations: Dict[str, float]
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or cache_dir() / "timings.json"
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self.durations = {k: float(v) for k, v in data.get("suites", {}).items()}
+        except (OSError, ValueError, AttributeError):
+            self.durations = {}
+
+    def expected(self, key: str) -> Optional[float]:
+        return self.durations.get(key)
+
+    def record(self, key: str, seconds: float):
+        previous = self.durations.get(key)
+        if previous is None:
+            self.durations[key] = seconds
+        else:
+            self.durations[key] = SMOOTHING * seconds + (1 - SMOOTHING) * previous
+
+    def save(self):
+        try:
+            write_json_atomic(self.path, {"suites": self.durations})
+        except OSError as e:
+            click.echo(f"WARN: Failed to write timings {self.path}: {e}", err=True)
+
+
+def predict_makespan(durations: List[float], workers: int) -> float:
+    """Simulate running jobs in the given order on a pool of workers, each job
+    starting on the first worker to become free, and return the finish time."""
+    finish_times = [0.0] * max(workers, 1)
+    for duration in durations:
+        earliest = heapq.heappop(finish_times)
+        heapq.heappush(finish_times, earliest + duration)
+    return max(finish_times)
@@ -1,11 +1,43 @@
 """Manage helm chart versions."""
 
 import json
-from typing import Optional
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set
 import click
 from semver import Version
-from .charts import ChartGraph, ChartInfo
+from .charts import ChartGraph
+from .chartyaml import ChartYamlBatch, WriteSummary
 from .git import git_root
+from .profiling import profiled
+
+
+@dataclass
+class VersionCheck:
+    name: str
+    path: str
+    version: str
+    previous_version: Optional[str]  # None if the chart is new
+    # whether the chart's files differ from the compared commit
+    changed: bool = True
+
+    @property
+    def needs_bump(self) -> bool:
+        """Whether the chart changed but its version is not above the one at
+        the compared commit."""
+        if not self.changed:
+            return False
+        previous = Version.parse(self.previous_version or "0.0.0")
+        return Version.parse(self.version) <= previous
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "path": self.path,
+            "version": self.version,
+            "previous_version": self.previous_version,
+            "changed": self.changed,
+            "needs_bump": self.needs_bump,
+        }
 
 
 class VersionManager:
@@ -30,55 +62,39 @@ class VersionManager:
     def get_version(self, chart_name: str) -> str:
         return str(self.version_map.get(chart_name, "unknown"))
 
-    def cascade_bump(
-        self, chart: ChartInfo, part: str, dependency: Optional[ChartInfo] = None
-    ):
-        """Bump the version of the specified chart and cascade to dependents."""
-        if chart.name not in self.version_map:
-            return
-
-        # If a dependency is specified, ensure it was updated
-        dependency_updated = (
-            self.bump_dependency(chart, dependency, self.get_version(dependency.name))
-            if dependency
-            else False
+    def cascade_bump(self, chart_names: List[str], part: str):
+        """Bump the specified charts and cascade to their dependents.
+
+        Makes one pass over the dependents' closure of the charts in
+        topological order (dependencies first), so every chart is visited
+        once however many paths lead to it. A chart is bumped if it was
+        specified or one of its dependencies was bumped, and all of its pins
+        on bumped dependencies are rewritten at the same time.
+        """
+        requested = {name for name in chart_names if name in self.version_map}
+        closure = self.chart_graph.find_closure(
+            sorted(requested), self.chart_graph.dependent_selector()
         )
-
-        # Avoid re-processing charts
-        if chart.name in self.updated_charts:
-            return
-
-        if dependency is None or dependency_updated:
-            # Bump the specified chart
-            new_version = self.bump_version(self.version_map[chart.name], part)
-            if not new_version:
-                return
-
+        for name in self.chart_graph.topological_order():
+            if name not in closure or name not in self.version_map:
+                continue
+            chart = self.chart_graph.charts[name]
+            bumped = [
+                dep
+                for dep in chart.dependencies
+                if dep.get("name") in self.updated_charts
+            ]
+            if name not in requested and not bumped:
+                continue
+            for dep in bumped:
+                dep["version"] = self.get_version(dep["name"])
+                self.dependencies_updated.setdefault(name, []).append(dep["name"])
+            if name in self.updated_charts:
+                continue
+            new_version = self.bump_version(self.version_map[name], part)
             chart.version = str(new_version)
-            self.version_map[chart.name] = new_version
-            self.updated_charts.add(chart.name)
-
-        # Find dependents and bump them as well
-        dependents = self.chart_graph.find_subtree(
-            chart.name, self.chart_graph.dependent_selector()
-        )
-        # Recursively bump dependents
-        for dep in dependents.next:
-            self.cascade_bump(dep.info, part, chart)
-
-    def bump_dependency(
-        self, chart: ChartInfo, dependency: ChartInfo, new_version: str
-    ) -> bool:
-        """Update the version of a dependency in the specified chart."""
-        updated = False
-        for dep in chart.dependencies:
-            if dep.get("name") == dependency.name:
-                dep["version"] = f"{new_version}"
-                updated = True
-                break
-        if updated:
-            self.dependencies_updated.setdefault(chart.name, []).append(dependency.name)
-        return updated
+            self.version_map[name] = new_version
+            self.updated_charts.add(name)
 
     def bump_version(self, current_version: Version, part: str) -> Version:
         """Bump the version of the specified chart."""
@@ -93,13 +109,53 @@ class VersionManager:
 
         return new_version
 
-    def save_versions(self):
-        """Save updated versions back to Chart.yaml files."""
-        for chart_name in self.updated_charts:
+    def check_versions(
+        self,
+        chart_names: List[str],
+        commit: str = "HEAD",
+        changed: Optional[Set[str]] = None,
+    ) -> List[VersionCheck]:
+        """Compare the charts' versions with their versions at a commit.
+        changed names the charts whose files differ from the commit; only
+        those can need a bump. None treats every chart as changed."""
+        root = git_root()
+        previous = self.chart_graph.get_previous_versions(chart_names, commit)
+        checks = []
+        for chart_name in chart_names:
+            chart = self.chart_graph.get_chart(chart_name)
+            try:
+                path = str(chart.path.relative_to(root))
+            except ValueError:
+                path = str(chart.path)
+            previous_version = previous[chart_name]
+            if previous_version is not None and not Version.is_valid(previous_version):
+                click.echo(
+                    f"WARN: Invalid version {previous_version} of chart "
+                    f"{chart_name} at {commit}.",
+                    err=True,
+                )
+                previous_version = None
+            checks.append(
+                VersionCheck(
+                    chart_name,
+                    path,
+                    chart.version,
+                    previous_version,
+                    changed is None or chart_name in changed,
+                )
+            )
+        return checks
+
+    def save_versions(self) -> WriteSummary:
+        """Save updated versions back to Chart.yaml files in one batch."""
+        batch = ChartYamlBatch()
+        for chart_name in sorted(self.updated_charts):
             chart = self.chart_graph.charts.get(chart_name)
             if chart:
-                chart.save_chart_yaml()
+                batch.update(chart)
+        return batch.commit()
 
+    @profiled("output")
     def print_updates(self, output_format: str = "text", release_type: str = ""):
         """Print the updated charts and their new versions."""
         sorted_updates = sorted(self.updated_charts)
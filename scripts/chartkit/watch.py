@@ -0,0 +1,336 @@
+"""chartkit watch: re-run the unit test suites affected by file changes."""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import click
+
+from .charts import ChartGraph
+from .files import make_path_root_relative
+from .templateindex import TemplateIndex
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+)
+EVENT = struct.Struct("iIII")
+
+# Directories not watched: snapshots are written by helm unittest itself.
+IGNORED_DIRS = ["__snapshot__", ".git"]
+
+
+def is_ignored(name: str) -> bool:
+    """Editor swap, backup and temporary files."""
+    return (
+        name.startswith(".")
+        or name.endswith("~")
+        or name.endswith((".swp", ".swx"))
+        or name == "4913"
+    )
+
+
+def walk_dirs(directory: Path) -> Iterable[Path]:
+    for dirpath, dirnames, _ in os.walk(directory):
+        dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+        yield Path(dirpath)
+
+
+class InotifyWatcher:
+    """Watches directory trees with Linux inotify (through libc, no extra
+    dependency). Directories created later are watched as they appear."""
+
+    def __init__(self, directories: Iterable[Path]):
+        self.libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        self.libc.inotify_init1.argtypes = [ctypes.c_int]
+        self.libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, Path] = {}
+        self.watched: Set[Path] = set()
+        try:
+            self.add(directories)
+        except OSError:
+            self.close()
+            raise
+
+    def add(self, directories: Iterable[Path]):
+        for directory in directories:
+            for path in walk_dirs(directory):
+                if path in self.watched:
+                    continue
+                wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+                if wd < 0:
+                    error = ctypes.get_errno()
+                    if error in (errno.ENOSPC, errno.EMFILE):
+                        raise OSError(error, "inotify watch limit reached")
+                    continue
+                self.watches[wd] = path
+                self.watched.add(path)
+
+    def read(self, timeout: Optional[float]) -> Set[Path]:
+        """Paths changed within timeout seconds (None waits for a change).
+        A queue overflow reports every watched directory."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed: Set[Path] = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                changed.update(self.watched)
+                continue
+            directory = self.watches.get(wd)
+            if mask & IN_IGNORED:
+                self.watched.discard(self.watches.pop(wd, Path()))
+                continue
+            if directory is None or not name or is_ignored(name):
+                continue
+            path = directory / name
+            if mask & IN_ISDIR:
+                if name in IGNORED_DIRS:
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # files may already be inside, e.g. a directory moved here
+                    self.add([path])
+                    changed.update(p for p in path.rglob("*") if p.is_file())
+            changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Finds changes by comparing file mtimes and sizes every interval."""
+
+    def __init__(self, directories: Iterable[Path], interval: float = 1.0):
+        self.directories = list(directories)
+        self.interval = interval
+        self.files = self.scan()
+
+    def add(self, directories: Iterable[Path]):
+        self.directories.extend(directories)
+        self.files = self.scan()
+
+    def scan(self) -> Dict[Path, Tuple[int, int]]:
+        files: Dict[Path, Tuple[int, int]] = {}
+        for directory in self.directories:
+            for path in walk_dirs(directory):
+                try:
+                    entries = list(os.scandir(path))
+                except OSError:
+                    continue
+                for entry in entries:
+                    if is_ignored(entry.name) or not entry.is_file():
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files[Path(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def read(self, timeout: Optional[float]) -> Set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            time.sleep(
+                self.interval
+                if remaining is None
+                else max(0.0, min(self.interval, remaining))
+            )
+            files = self.scan()
+            changed = {
+                path
+                for path in files.keys() | self.files.keys()
+                if files.get(path) != self.files.get(path)
+            }
+            self.files = files
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self):
+        pass
+
+
+Watcher = InotifyWatcher | PollingWatcher
+
+
+def make_watcher(
+    directories: List[Path], poll: bool = False, interval: float = 1.0
+) -> Watcher:
+    """inotify where available, polling otherwise (or when asked to)."""
+    if not poll:
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError) as e:
+            click.echo(f"WARN: inotify unavailable ({e}); polling instead.", err=True)
+    return PollingWatcher(directories, interval)
+
+
+def wait_for_changes(watcher: Watcher, debounce: float) -> Set[Path]:
+    """Block until files change, then collect changes until none arrive for
+    debounce seconds, so a burst of saves (or a git checkout) is one run."""
+    changed = watcher.read(None)
+    while True:
+        more = watcher.read(debounce)
+        if not more:
+            return changed
+        changed |= more
+
+
+class SuiteWatcher:
+    """Re-runs affected suites in a background thread on file changes.
+
+    The graph and its TemplateIndex stay in memory and are refreshed with
+    the changed files; the graph is only rebuilt when charts are added,
+    removed or their Chart.yaml changes. A change arriving while suites run
+    cancels that run: its suites are run again together with the newly
+    affected ones, and the result cache skips those that already passed.
+    """
+
+    def __init__(self, graph: ChartGraph, debounce: float, **run_options):
+        self.graph = graph
+        self.index = TemplateIndex(graph)
+        self.debounce = debounce
+        self.run_options = run_options
+        self.thread: Optional[threading.Thread] = None
+        self.cancel = threading.Event()
+        # suites of the current run, carried over if it is cancelled
+        self.suites: Set[Path] = set()
+
+    def chart_dirs(self) -> List[Path]:
+        return sorted(chart.path for chart in self.graph.charts.values())
+
+    def affected(self, changed: Set[Path]) -> List[Path]:
+        """Suites affected by the changes, before and after refreshing the
+        index (a deleted template's users only show up before)."""
+        if self.graph.is_stale():
+            self.graph = ChartGraph(
+                roots=self.graph.roots,
+                internal_only=self.graph.internal_only,
+                use_cache=self.graph.use_cache,
+            )
+            self.index = TemplateIndex(self.graph)
+            return sorted(self.index.affected_suites(changed))
+        before = set(self.index.affected_suites(changed))
+        self.index.refresh(changed)
+        return sorted(before | set(self.index.affected_suites(changed)))
+
+    def start(self, suites: List[Path]):
+        self.stop()
+        self.suites = set(suites)
+        self.cancel = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, args=(sorted(self.suites), self.cancel), daemon=True
+        )
+        self.thread.start()
+
+    def run(self, suites: List[Path], cancel: threading.Event):
+        try:
+            self.graph.run_unit_tests(
+                suite_paths=[str(s) for s in suites],
+                cancel=cancel,
+                **self.run_options,
+            )
+        except Exception as e:
+            click.echo(f"ERROR: {e}", err=True)
+        finally:
+            if not cancel.is_set():
+                self.suites = set()
+            click.echo("Watching for changes...", err=True)
+
+    def stop(self) -> bool:
+        """Cancel the running suites; returns whether a run was cancelled."""
+        if self.thread is None or not self.thread.is_alive():
+            return False
+        self.cancel.set()
+        self.thread.join()
+        return True
+
+    def watch(self, watcher: Watcher):
+        click.echo(f"Watching {len(self.graph.charts)} charts for changes...", err=True)
+        while True:
+            changed = wait_for_changes(watcher, self.debounce)
+            charts_before = set(self.graph.charts)
+            suites = self.affected(changed)
+            new_dirs = [
+                c.path for n, c in self.graph.charts.items() if n not in charts_before
+            ]
+            if new_dirs:
+                watcher.add(new_dirs)
+            if not suites:
+                # e.g. documentation, or charts without suites
+                continue
+            names = self.graph.get_affected_charts([str(p) for p in changed])
+            if self.stop():
+                click.echo("Cancelled the running suites for newer changes.", err=True)
+                suites = sorted(set(suites) | self.suites)
+            files = ", ".join(
+                sorted(make_path_root_relative(p).as_posix() for p in changed)[:5]
+            )
+            more = f" and {len(changed) - 5} more" if len(changed) > 5 else ""
+            click.echo(
+                f"\nChanged {files}{more} (affecting {', '.join(names)}): "
+                f"running {len(suites)} test suites.",
+                err=True,
+            )
+            self.start(suites)
+
+
+def watch(
+    graph: ChartGraph,
+    debounce: float = 0.3,
+    poll: bool = False,
+    interval: float = 1.0,
+    **run_options,
+):
+    """Watch the chart directories and re-run affected suites until
+    interrupted."""
+    tests = SuiteWatcher(graph, debounce, **run_options)
+    watcher = make_watcher(tests.chart_dirs(), poll=poll, interval=interval)
+    try:
+        tests.watch(watcher)
+    except KeyboardInterrupt:
+        tests.stop()
+    finally:
+        watcher.close()